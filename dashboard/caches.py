@@ -0,0 +1,103 @@
+"""cache of widget data.
+
+widget data is cached by widget name and user_settings (and user for widgets
+that have per user data, the day for widgets that depend on it) together with the versions of the models the widget
+reads (Widget.cache_models). writes to those models change their version, the
+data of the old versions is still served while a single background job
+calculates the new one, so only the very first load of a widget waits for it.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
+from typing import TYPE_CHECKING, Callable
+
+import orjson
+from django.core.cache import cache
+from django.db import connections, models
+from django.utils import timezone
+
+if TYPE_CHECKING:
+    from dashboard.widgets import JSON, Widget
+
+logger = logging.getLogger(__name__)
+
+WIDGET_CACHE_TIMEOUT = 60 * 60 * 24
+# a refresh that takes longer than this can be started again by another request
+REFRESH_LOCK_TIMEOUT = 60
+
+refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="widgets")
+
+
+def model_version_key(model: type[models.Model]) -> str:
+    return f"dashboard_widget_version:{model._meta.label_lower}"
+
+
+def invalidate_widgets(model: type[models.Model]):
+    """makes cached data of the widgets that read model stale"""
+    # not a counter, an evicted counter would start over and match old data
+    cache.set(model_version_key(model), time.time_ns(), timeout=None)
+
+
+def widget_cache_key(widget: "Widget") -> str:
+    subscribed_widget = widget.subscribed_widget
+    user_settings = orjson.dumps(
+        subscribed_widget.user_settings, option=orjson.OPT_SORT_KEYS
+    )
+    key = (
+        f"dashboard_widget:{subscribed_widget.widget_name}:"
+        f"{sha1(user_settings).hexdigest()}"
+    )
+    if widget.cache_per_user:
+        key += f":{subscribed_widget.user_id}"
+    if widget.cache_per_day:
+        # data of yesterday isn't served after midnight, not even while refreshing
+        key += f":{timezone.localdate().isoformat()}"
+    return key
+
+
+def widget_versions(widget: "Widget") -> list[int]:
+    keys = [model_version_key(model) for model in widget.cache_models]
+    versions = cache.get_many(keys)
+    return [versions.get(key, 0) for key in keys]
+
+
+def refresh_widget_data(key: str, versions: list[int], get_data: Callable[[], "JSON"]):
+    try:
+        cache.set(key, {"versions": versions, "data": get_data()}, WIDGET_CACHE_TIMEOUT)
+    finally:
+        cache.delete(f"{key}:refreshing")
+
+
+def refresh_in_background(*args):
+    def refresh():
+        try:
+            refresh_widget_data(*args)
+        except Exception:
+            logger.exception("refreshing widget data %s failed", args[0])
+        finally:
+            # the thread's own connections, requests don't close them here
+            connections.close_all()
+
+    refresh_executor.submit(refresh)
+
+
+def get_cached_widget_data(widget: "Widget", get_data: Callable[[], "JSON"]) -> "JSON":
+    """cached data of the widget. stale data is returned as is and refreshed in the
+    background, get_data is only called in place when there is nothing cached."""
+    if widget.cache_models is None:
+        return get_data()
+
+    key = widget_cache_key(widget)
+    versions = widget_versions(widget)
+    cached = cache.get(key)
+    if cached is None:
+        data = get_data()
+        cache.set(key, {"versions": versions, "data": data}, WIDGET_CACHE_TIMEOUT)
+        return data
+
+    if cached["versions"] != versions and cache.add(
+        f"{key}:refreshing", True, REFRESH_LOCK_TIMEOUT
+    ):
+        refresh_in_background(key, versions, get_data)
+    return cached["data"]
@@ -0,0 +1,53 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.test.client import RequestFactory
+
+from dashboard.enums import WidgetsEnum
+from dashboard.models import SubscribedWidget
+from dashboard.widgets import WIDGETMAP
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures how long querying and rendering the data of each dashboard "
+        "widget takes, without the cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--widget",
+            action="append",
+            dest="widgets",
+            choices=WidgetsEnum.values,
+            help="Only measure this widget, can be repeated.",
+        )
+        parser.add_argument(
+            "--limit", type=int, help="Rows per widget (user_settings limit)."
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Runs per widget, best is shown."
+        )
+
+    def handle(self, *args, **options):
+        context = {"request": RequestFactory().get("/")}
+        user_settings = {"limit": options["limit"]} if options["limit"] else None
+        for widget_name in options["widgets"] or WidgetsEnum.values:
+            widget = WIDGETMAP[widget_name](
+                SubscribedWidget(widget_name=widget_name, user_settings=user_settings)
+            )
+            instances = list(widget.get_queryset()[: widget.limit])
+            query_times = []
+            render_times = []
+            for _ in range(options["repeat"]):
+                start = perf_counter()
+                widget.get_data(context=context)
+                query_times.append(perf_counter() - start)
+                start = perf_counter()
+                widget.serialized_data(instances, context=context)
+                render_times.append(perf_counter() - start)
+            self.stdout.write(
+                f"{widget_name:<16} rows {len(instances):>4}  "
+                f"query+render {min(query_times) * 1000:8.2f} ms  "
+                f"render {min(render_times) * 1000:8.2f} ms"
+            )
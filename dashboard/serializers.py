@@ -1,11 +1,13 @@
-from datetime import timedelta
-from typing import Literal
+from datetime import date, timedelta
+from itertools import pairwise
+from typing import Literal, TypeAlias
 
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from drf_spectacular.utils import PolymorphicProxySerializer, extend_schema_field
 from rest_framework.renderers import serializers
 from rest_framework.serializers import (
+    CharField,
     ChoiceField,
     DateField,
     DecimalField,
@@ -78,6 +80,8 @@ class InvoiceWidgetSerializer(ModelSerializer):
 
 class BestCustomerWidgetSerializer(ModelSerializer):
     cash_in = DecimalField(max_digits=19, decimal_places=4)
+    cash_out = DecimalField(max_digits=19, decimal_places=4)
+    revenue = DecimalField(max_digits=19, decimal_places=4)
 
     class Meta:
         model = Stakeholder
@@ -91,6 +95,8 @@ class BestCustomerWidgetSerializer(ModelSerializer):
             "vkntckn",
             "address",
             "cash_in",
+            "cash_out",
+            "revenue",
         ]
 
 
@@ -111,18 +117,35 @@ class BalanceWidgetSerializer(ModelSerializer):
         ]
 
 
+BalanceGraphScale: TypeAlias = Literal["days", "weeks", "months"]
+
+
 def get_balance_graph_date_ranges(
-    scale: Literal["days"] | Literal["weeks"] | Literal["months"] = "days",
-):
-    today = timezone.now().date()
-    dates = [today + timedelta(**{scale: i}) for i in range(-20, 20)]
-    return zip(dates, dates)
+    scale: BalanceGraphScale = "days", length: int = 40
+) -> list[tuple[date, date]]:
+    """first and last days of length consecutive days, weeks (starting on monday)
+    or months. the current one is in the middle."""
+    today = timezone.localdate()
+    if scale == "months":
+        current = today.replace(day=1)
+    else:
+        current = today - timedelta(days=today.weekday() if scale == "weeks" else 0)
+
+    def shift(periods: int) -> date:
+        if scale == "months":
+            years, month = divmod(current.month - 1 + periods, 12)
+            return current.replace(year=current.year + years, month=month + 1)
+        return current + timedelta(**{scale: periods})
+
+    starts = [shift(i) for i in range(-(length // 2), length - length // 2 + 1)]
+    return [(start, end - timedelta(days=1)) for start, end in pairwise(starts)]
 
 
 class BalancesSerializer(serializers.Serializer):
     """this exist to fill openapi schema correctly. no other reason"""
 
     balance = DecimalField(19, 4)
+    running_balance = DecimalField(19, 4)
     range = ListField(child=DateField(), min_length=2, max_length=2)
 
 
@@ -133,13 +156,8 @@ class BalanceGraphWidgetSerializer(ModelSerializer):
 
     @extend_schema_field(BalancesSerializer(many=True))
     def get_balances(self, obj):
-        date_ranges = list(get_balance_graph_date_ranges())
-        balance_names = [f"balance_{i}" for i in range(len(date_ranges))]
-        balances = [
-            {"balance": getattr(obj, name), "range": date_range}
-            for name, date_range in zip(balance_names, date_ranges)
-        ]
-        return balances
+        # calculated by the BalanceGraph widget
+        return getattr(obj, "graph_balances", [])
 
     class Meta:
         model = PaymentAccount
@@ -155,6 +173,20 @@ class BalanceGraphWidgetSerializer(ModelSerializer):
         ]
 
 
+widget_data_schema = PolymorphicProxySerializer(
+    component_name="widget_data",
+    serializers=[
+        ItemWidgetSerializer,
+        InvoiceWidgetSerializer,
+        BestCustomerWidgetSerializer,
+        BalanceWidgetSerializer,
+        BalanceGraphWidgetSerializer,
+        UserSerializer,
+    ],
+    resource_type_field_name="type",
+)
+
+
 class DashboardSerializer(serializers.Serializer):
     """This doesn't really do anything other than hinting openapi."""
 
@@ -163,26 +195,26 @@ class DashboardSerializer(serializers.Serializer):
     user_settings = JSONField()
     widget_name = ChoiceField(choices=WidgetsEnum.choices)
     widget_data = SerializerMethodField()
+    next = CharField(allow_null=True)
+    error = CharField(allow_null=True)
 
-    @extend_schema_field(
-        PolymorphicProxySerializer(
-            component_name="widget_data",
-            serializers=[
-                ItemWidgetSerializer,
-                InvoiceWidgetSerializer,
-                BestCustomerWidgetSerializer,
-                BalanceWidgetSerializer,
-                BalanceGraphWidgetSerializer,
-                UserSerializer,
-            ],
-            resource_type_field_name="type",
-        )
-    )
+    @extend_schema_field(widget_data_schema)
     def get_widget_data(self, obj):
         """do not delete. this is for openapi"""
         pass
 
 
+class WidgetDataSerializer(serializers.Serializer):
+    """openapi hint for the rows of a widget after a cursor"""
+
+    widget_data = SerializerMethodField()
+    next = CharField(allow_null=True)
+
+    @extend_schema_field(widget_data_schema)
+    def get_widget_data(self, obj):
+        pass
+
+
 class SubscribedWidgetSerializer(ModelSerializer):
     user = serializers.HiddenField(default=CurrentUserDefault())
 
@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from dashboard.caches import invalidate_widgets
+from dashboard.widgets import WIDGETMAP
+from utilities.signals import bulk_saved
+
+CACHED_MODELS = {
+    model for widget in WIDGETMAP.values() for model in widget.cache_models or []
+}
+
+
+@receiver([post_save, post_delete, bulk_saved])
+def invalidate_cached_widgets(sender, **kwargs):
+    if sender in CACHED_MODELS:
+        # after commit, a refresh before it would cache the old data as new
+        transaction.on_commit(lambda: invalidate_widgets(sender))
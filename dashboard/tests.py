@@ -1,3 +1,223 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from dashboard import caches
+from dashboard.enums import WidgetsEnum
+from dashboard.models import SubscribedWidget
+from dashboard.widgets import Balance, BestCustomers, LastInvoices
+from inventory.models import Warehouse
+from invoice.exchange_rates import clear_rates_cache
+from invoice.models import ExchangeRate, Invoice
+from payments.models import Payment, PaymentAccount
+from stakeholder.models import Stakeholder, StakeholderRole
+from users.models import User
+from utilities.enums import Currency, InvoiceType
+
+
+class TestDashboard(TransactionTestCase):
+    # widgets are evaluated on other threads (connections), data has to be committed
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="dashboard_user", password="password"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        SubscribedWidget.objects.create(user=self.user, widget_name=WidgetsEnum.balance)
+        self.account = PaymentAccount.objects.create(name="Company account")
+        self.other_account = PaymentAccount.objects.create(name="Other account")
+
+    def get_balance(self) -> Decimal:
+        res = self.client.get(reverse("dashboard"))
+        self.assertEqual(res.status_code, 200)
+        (widget,) = res.json()
+        account = next(
+            row for row in widget["widget_data"] if row["id"] == self.account.id
+        )
+        return Decimal(account["balance"])
+
+    def pay(self, amount: str):
+        Payment.objects.create(
+            payer=self.other_account, receiver=self.account, amount=Decimal(amount)
+        )
+
+    @mock.patch.object(
+        caches, "refresh_in_background", side_effect=caches.refresh_widget_data
+    )
+    def test_widget_data_is_cached_and_refreshed_after_writes(self, refresh):
+        self.pay("10")
+        self.assertEqual(self.get_balance(), Decimal("10"))
+
+        with self.assertNumQueries(1):
+            # subscribed widgets only
+            self.assertEqual(self.get_balance(), Decimal("10"))
+        refresh.assert_not_called()
+
+        self.pay("5")
+        # stale data is served while it is refreshed
+        self.assertEqual(self.get_balance(), Decimal("10"))
+        refresh.assert_called_once()
+        self.assertEqual(self.get_balance(), Decimal("15"))
+        refresh.assert_called_once()
+
+    def test_widgets_of_the_day_are_not_served_after_midnight(self):
+        SubscribedWidget.objects.create(
+            user=self.user, widget_name=WidgetsEnum.due_payments
+        )
+        payment = Payment.objects.create(
+            payer=self.other_account,
+            receiver=self.account,
+            amount=Decimal(10),
+            due_date=timezone.localdate() + timedelta(days=8),
+        )
+
+        def due_payments() -> list[int]:
+            res = self.client.get(reverse("dashboard"))
+            widget = next(
+                widget
+                for widget in res.json()
+                if widget["widget_name"] == WidgetsEnum.due_payments
+            )
+            return [payment["id"] for payment in widget["widget_data"]]
+
+        self.assertEqual(due_payments(), [])
+        tomorrow = timezone.now() + timedelta(days=1)
+        with mock.patch("django.utils.timezone.now", return_value=tomorrow):
+            self.assertEqual(due_payments(), [payment.id])
+
+    def test_failing_and_slow_widgets_dont_fail_the_dashboard(self):
+        for widget_name in [WidgetsEnum.last_invoices, WidgetsEnum.last_users]:
+            SubscribedWidget.objects.create(user=self.user, widget_name=widget_name)
+
+        def slow_get_data(context=None):
+            time.sleep(0.5)
+            return []
+
+        with (
+            mock.patch.object(Balance, "get_data", side_effect=Exception),
+            mock.patch.object(LastInvoices, "get_data", side_effect=slow_get_data),
+            mock.patch.object(LastInvoices, "timeout", 0.1),
+            self.assertLogs("dashboard.views", "ERROR"),
+        ):
+            res = self.client.get(reverse("dashboard"))
+
+        self.assertEqual(res.status_code, 200)
+        widgets = {widget["widget_name"]: widget for widget in res.json()}
+        self.assertIsNone(widgets[WidgetsEnum.balance]["widget_data"])
+        self.assertIsNotNone(widgets[WidgetsEnum.balance]["error"])
+        self.assertIsNone(widgets[WidgetsEnum.last_invoices]["widget_data"])
+        self.assertIsNotNone(widgets[WidgetsEnum.last_invoices]["error"])
+        self.assertIsNone(widgets[WidgetsEnum.last_users]["error"])
+        self.assertEqual(
+            [user["id"] for user in widgets[WidgetsEnum.last_users]["widget_data"]],
+            [self.user.id],
+        )
+
+    def test_widget_rows_are_limited_and_loaded_with_cursors(self):
+        for i in range(4):
+            User.objects.create_user(username=f"dashboard_user_{i}")
+        SubscribedWidget.objects.create(
+            user=self.user,
+            widget_name=WidgetsEnum.last_users,
+            user_settings={"limit": 3},
+        )
+        res = self.client.get(reverse("dashboard"))
+        widget = next(
+            widget
+            for widget in res.json()
+            if widget["widget_name"] == WidgetsEnum.last_users
+        )
+        usernames = [user["username"] for user in widget["widget_data"]]
+        self.assertEqual(
+            usernames, ["dashboard_user_3", "dashboard_user_2", "dashboard_user_1"]
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(
+                reverse("subscribedwidget-data", args=[widget["id"]]),
+                {"cursor": widget["next"]},
+            )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [user["username"] for user in res.data["widget_data"]],
+            ["dashboard_user_0", "dashboard_user"],
+        )
+        self.assertIsNone(res.data["next"])
+        users_query = next(
+            query["sql"] for query in queries if 'FROM "users_user"' in query["sql"]
+        )
+        self.assertNotIn("password", users_query)
+
+    def test_widgets_of_other_users_are_not_visible(self):
+        other_user = User.objects.create_user(username="other_dashboard_user")
+        other_widget = SubscribedWidget.objects.create(
+            user=other_user, widget_name=WidgetsEnum.last_users
+        )
+        res = self.client.get(reverse("subscribedwidget-list"))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [widget["widget_name"] for widget in res.data["results"]],
+            [WidgetsEnum.balance],
+        )
+        res = self.client.get(reverse("subscribedwidget-data", args=[other_widget.id]))
+        self.assertEqual(res.status_code, 404)
+
+    def test_best_customers_are_ordered_by_net_revenue(self):
+        warehouse = Warehouse.objects.create(name="Depot")
+        customers = [
+            Stakeholder.objects.create(
+                name=name, shortname=name, role=StakeholderRole.customer
+            )
+            for name in ["first", "second"]
+        ]
+
+        def invoice(customer, invoice_type, total, currency=Currency.turkish_lira):
+            return Invoice.objects.create(
+                invoice_type=invoice_type,
+                name="invoice",
+                stakeholder=customer,
+                warehouse=warehouse,
+                currency=currency,
+                total=Decimal(total),
+            )
+
+        self.addCleanup(clear_rates_cache)
+        ExchangeRate.objects.load([(Currency.dollar, timezone.localdate(), 2)])
+        invoice(customers[0], InvoiceType.sale, "100")
+        invoice(customers[0], InvoiceType.refund_sale, "60")
+        invoice(customers[1], InvoiceType.sale, "50")
+        invoice(customers[1], InvoiceType.sale, "1000", Currency.dollar)
+        old_sale = invoice(customers[0], InvoiceType.sale, "30")
+        old_sale.created_at = timezone.now() - timedelta(days=100)
+        old_sale.save()
+
+        def best_customers(**user_settings):
+            widget = BestCustomers(SubscribedWidget(user_settings=user_settings))
+            data, next_cursor = widget.get_data()
+            return [(row["name"], Decimal(row["revenue"])) for row in data]
+
+        # in the base currency
+        self.assertEqual(
+            best_customers(), [("second", Decimal(2050)), ("first", Decimal(70))]
+        )
+        self.assertEqual(
+            best_customers(months=1),
+            [("second", Decimal(2050)), ("first", Decimal(40))],
+        )
+        self.assertEqual(
+            best_customers(currency=Currency.turkish_lira),
+            [("first", Decimal(70)), ("second", Decimal(50))],
+        )
+        self.assertEqual(
+            best_customers(currency=Currency.dollar), [("second", Decimal(1000))]
+        )
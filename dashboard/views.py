@@ -1,45 +1,74 @@
 import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from django.db import close_old_connections
 from django.http.response import JsonResponse
-from drf_spectacular.utils import extend_schema
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework import permissions
+from rest_framework.decorators import action
 from rest_framework.request import HttpRequest
+from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
+from dashboard.caches import get_cached_widget_data
 from dashboard.models import SubscribedWidget
-from dashboard.serializers import DashboardSerializer, SubscribedWidgetSerializer
-from dashboard.widgets import WIDGETMAP, Widget
-from asgiref.sync import async_to_sync, sync_to_async
+from dashboard.serializers import (
+    DashboardSerializer,
+    SubscribedWidgetSerializer,
+    WidgetDataSerializer,
+)
+from dashboard.widgets import JSON, WIDGETMAP, Widget
+from asgiref.sync import async_to_sync
 
 from users.models import User
 
+logger = logging.getLogger(__name__)
 
-async def gather_widgets_data(*widgets: Widget, context=None):
-    """takes widgets, asyncronously queries their querysets, returns them in a dict
-    with the unique_name of the widget as the key"""
 
-    # result = defaultdict(list)
-    result = []
+# widgets of all dashboard requests of a worker run on these threads, each one
+# uses its own database connection
+widget_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="widgets")
 
-    async def task(widget: Widget):
-        queryset = widget.get_queryset()
-        instances = []
-        async for instance in queryset:
-            instances.append(instance)
 
-        widget_data = await sync_to_async(widget.serialized_data)(instances, context=context)
-        subscribed_widget = widget.subscribed_widget
-        result.append(
-            {
-                "id": subscribed_widget.id,
-                "widget_index": subscribed_widget.widget_index,
-                "user_settings": subscribed_widget.user_settings,
-                "widget_name": subscribed_widget.widget_name,
-                "widget_data": widget_data,
-            }
-        )
+def evaluate_widget(widget: Widget, context=None) -> tuple[JSON, str | None]:
+    try:
+        return get_cached_widget_data(widget, partial(widget.get_data, context=context))
+    finally:
+        close_old_connections()
 
-    await asyncio.gather(*(task(widget) for widget in widgets))
-    return result
+
+async def gather_widgets_data(*widgets: Widget, context=None) -> list[dict]:
+    """evaluates the widgets concurrently on widget_executor, a widget that fails
+    or takes longer than its timeout gets an error instead of data"""
+    loop = asyncio.get_running_loop()
+
+    async def task(widget: Widget) -> dict:
+        subscribed_widget = widget.subscribed_widget
+        result = {
+            "id": subscribed_widget.id,
+            "widget_index": subscribed_widget.widget_index,
+            "user_settings": subscribed_widget.user_settings,
+            "widget_name": subscribed_widget.widget_name,
+            "widget_data": None,
+            "next": None,
+            "error": None,
+        }
+        try:
+            result["widget_data"], result["next"] = await asyncio.wait_for(
+                loop.run_in_executor(widget_executor, evaluate_widget, widget, context),
+                widget.timeout,
+            )
+        except asyncio.TimeoutError:
+            # the thread can't be stopped, it finishes (and fills the cache) later
+            result["error"] = str(_("Widget took too long to load."))
+        except Exception:
+            logger.exception("widget %s failed", subscribed_widget.widget_name)
+            result["error"] = str(_("Widget couldn't be loaded."))
+        return result
+
+    return await asyncio.gather(*(task(widget) for widget in widgets))
 
 
 async def get_widget_data(user: User, context=None) -> dict:
@@ -69,3 +98,23 @@ class DashboardView(APIView):
 class SubscribedWidgetViewset(ModelViewSet):
     queryset = SubscribedWidget.objects.all()
     serializer_class = SubscribedWidgetSerializer
+
+    def get_queryset(self):
+        # users only see and load the widgets they subscribed to
+        return super().get_queryset().filter(user=self.request.user)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("cursor", str, description=_("next of the widget"))
+        ],
+        responses={200: WidgetDataSerializer},
+    )
+    @action(detail=True, methods=["get"])
+    def data(self, request, pk=None):
+        """rows of the widget that come after the given cursor (load more)"""
+        subscribed_widget = self.get_object()
+        widget = WIDGETMAP[subscribed_widget.widget_name](subscribed_widget)
+        widget_data, next_cursor = widget.get_data(
+            context={"request": request}, cursor=request.query_params.get("cursor")
+        )
+        return Response({"widget_data": widget_data, "next": next_cursor})
@@ -1,16 +1,19 @@
 from abc import ABC, abstractmethod
-from datetime import timedelta
+from datetime import date, timedelta
 from decimal import Decimal
+from functools import cached_property
 from typing import Any, TypeAlias
 from django.utils import timezone
 
-from django.db.models import F, Q, OuterRef, QuerySet, Subquery, Sum
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Model, Q, OuterRef, Prefetch, QuerySet, Subquery, Sum
 from django.db.models.functions import Coalesce
 from rest_framework.serializers import Serializer
 
 from dashboard.enums import WidgetsEnum
 from dashboard.models import SubscribedWidget
 from dashboard.serializers import (
+    BalanceGraphScale,
     BalanceGraphWidgetSerializer,
     BalanceWidgetSerializer,
     BestCustomerWidgetSerializer,
@@ -20,17 +23,33 @@ from dashboard.serializers import (
 )
 from inventory.models import Item, StockMovement, WarehouseItemStock
 from invoice.models import Invoice
-from payments.models import Payment, PaymentAccount
+from payments.models import DailyBalance, Payment, PaymentAccount
 from payments.serializers import PaymentOutSerializer
 from stakeholder.models import Stakeholder, StakeholderRole
 from users.models import User
 from users.serializers import UserSerializer
-from utilities.enums import InvoiceType
+from utilities.enums import Currency
+from utilities.pagination import KeysetPagination
 
 JSON: TypeAlias = dict[str, "JSON"] | list["JSON"] | str | int | float | bool | None
 
 
 class Widget(ABC):
+    # data is cached until one of these models is written, None is not cached
+    cache_models: list[type[Model]] | None = None
+    cache_per_user = False
+    # widgets whose rows depend on the current day (due dates, periods) are cached
+    # for the day, writes of cache_models aren't the only change to them
+    cache_per_day = False
+    # seconds the dashboard waits for the data
+    timeout = 10
+    # number of rows, user_settings "limit" can change it up to max_limit.
+    # None is all of them
+    default_limit: int | None = 10
+    max_limit = 100
+    # model field ordering of the rows, widgets with one have "load more" cursors
+    ordering: list[str] | None = None
+
     def __init__(self, subscribed_widget: SubscribedWidget, **user_inputs) -> None:
         self.user_inputs = user_inputs
         self.subscribed_widget = subscribed_widget
@@ -51,24 +70,72 @@ class Widget(ABC):
         print(user_inputs)
         pass
 
-    def serialized_data(self, serializer_data: Any, context=None) -> JSON:
-        """serialized data, should return json serializable object"""
-        if isinstance(serializer_data, list):
-            serializer = self.get_serializer_class()(
-                data=serializer_data, many=True, context=context
+    @cached_property
+    def settings(self) -> dict[str, Any]:
+        settings = self.subscribed_widget and self.subscribed_widget.user_settings
+        return settings if isinstance(settings, dict) else {}
+
+    @property
+    def limit(self) -> int | None:
+        limit = self.settings.get("limit")
+        if isinstance(limit, int) and 0 < limit <= self.max_limit:
+            return limit
+        return self.default_limit
+
+    def get_only_fields(self, queryset: QuerySet) -> list[str] | None:
+        """model fields read by the serializer, None if it reads something else
+        that might need the other fields (properties, method fields)"""
+        model = queryset.model
+        only_fields = set(queryset.query.select_related or {})
+        for field in self.get_serializer_class()().fields.values():
+            if field.write_only or field.source in queryset.query.annotations:
+                continue
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                return None
+            if model_field.concrete and not model_field.many_to_many:
+                only_fields.add(model_field.name)
+            elif not model_field.is_relation:
+                return None
+        return list(only_fields)
+
+    def get_data(self, context=None, cursor: str | None = None) -> JSON:
+        """serialized rows of the widget and the cursor of the rows after them"""
+        queryset = self.get_queryset()
+        only_fields = self.get_only_fields(queryset)
+        if only_fields is not None:
+            # the cursor is made of the ordering fields
+            ordering = [field.lstrip("-") for field in self.ordering or []]
+            queryset = queryset.only(*only_fields, *ordering)
+
+        next_cursor = None
+        if self.ordering is not None and self.limit is not None:
+            instances, next_cursor = KeysetPagination().paginate_ordered(
+                queryset, self.ordering, self.limit, cursor
             )
-            serializer.is_valid()
+        elif self.limit is not None:
+            instances = list(queryset[: self.limit])
         else:
-            serializer = self.get_serializer_class()(
-                data=serializer_data, context=context
-            )
-            serializer.is_valid()
+            instances = list(queryset)
+        return self.serialized_data(instances, context=context), next_cursor
+
+    def serialized_data(self, instances: Any, context=None) -> JSON:
+        """serialized data, should return json serializable object"""
+        # output only, instances aren't input data to be validated
+        serializer = self.get_serializer_class()(
+            instances, many=isinstance(instances, list), context=context
+        )
         return serializer.data
 
 
 class DuePayments(Widget):
     """Payments that are needed to be made or received"""
 
+    cache_models = [Payment]
+    cache_per_day = True
+    ordering = ["due_date", "amount"]
+
     def get_serializer_class(self) -> Serializer:
         return PaymentOutSerializer
 
@@ -91,6 +158,9 @@ class DuePayments(Widget):
 class LastInvoices(Widget):
     """Last created Invoices"""
 
+    cache_models = [Invoice]
+    ordering = ["-created_at"]
+
     def get_serializer_class(self) -> Serializer:
         return InvoiceWidgetSerializer
 
@@ -101,89 +171,96 @@ class LastInvoices(Widget):
 class LeftoverItems(Widget):
     """items that are not sold in a long time and are in stock"""
 
+    cache_models = [Item, StockMovement, Invoice]
+    cache_per_day = True
+    ordering = ["last_sold_at"]
+    # user_settings "not_sold_days" and "new_item_days"
+    default_not_sold_days = 30
+    default_new_item_days = 7
+
     def get_serializer_class(self) -> Serializer:
         return ItemWidgetSerializer
 
+    def get_days(self, name: str, default: int) -> int:
+        days = self.settings.get(name)
+        return days if isinstance(days, int) and days >= 0 else default
+
     def get_queryset(self):
-        date = timezone.now() - timedelta(days=30)
-        invoices = Invoice.objects.filter(
-            last_payment_date__gt=date, invoice_type=InvoiceType.sale
-        )
-        stock_movements = StockMovement.objects.select_related(
-            "invoice_item__invoice"
-        ).filter(invoice_item__invoice__in=invoices)
-        warehouse_item_stocks = WarehouseItemStock.objects.filter(
-            stockmovement__in=stock_movements
-        )
-        sevendaysago = timezone.now() - timedelta(days=7)
+        now = timezone.now()
+        not_sold_days = self.get_days("not_sold_days", self.default_not_sold_days)
+        new_item_days = self.get_days("new_item_days", self.default_new_item_days)
         return (
-            Item.objects.select_related("stock_unit", "category", "created_by")
-            .prefetch_related("stocks")
-            .exclude(stocks__in=warehouse_item_stocks)
-            .exclude(stocks__amount_db__lte=0)
-            .exclude(created_at__gt=sevendaysago)
+            Item.objects.leftovers(
+                not_sold_since=now - timedelta(days=not_sold_days),
+                created_before=now - timedelta(days=new_item_days),
+            )
+            .select_related("stock_unit", "category", "created_by")
+            .prefetch_related(
+                Prefetch("stocks", queryset=WarehouseItemStock.objects.with_amounts())
+            )
         )
 
 
 class BestCustomers(Widget):
-    """Most revenue generating customers"""
+    """customers with the most net revenue (sales - sale refunds)"""
+
+    cache_models = [Invoice]
+    cache_per_day = True
+    # user_settings "currency" only counts the invoices of that currency, otherwise
+    # all of them in the base currency. "months" is the last n months, all time
+    # if unset
 
     def get_serializer_class(self) -> Serializer:
         return BestCustomerWidgetSerializer
 
     def get_queryset(self) -> QuerySet:
+        currency = self.settings.get("currency")
+        if currency in Currency.values:
+            revenues = Q(revenues__currency=currency)
+            sales, refunds = "revenues__sales", "revenues__refunds"
+        else:
+            revenues = Q(revenues__isnull=False)
+            sales, refunds = "revenues__base_sales", "revenues__base_refunds"
+        months = self.settings.get("months")
+        if isinstance(months, int) and months > 0:
+            start = timezone.localdate().replace(day=1)
+            years, month = divmod(start.month - months, 12)
+            start = start.replace(year=start.year + years, month=month + 1)
+            revenues &= Q(revenues__month__gte=start)
         return (
             Stakeholder.objects.filter(
+                revenues,
                 role__in=[
                     StakeholderRole.customer,
                     StakeholderRole.customer_and_supplier,
-                ]
-            )
-            .alias(
-                cash_in=Coalesce(
-                    Sum(
-                        "invoice__total",
-                        filter=Q(invoice__invoice_type=InvoiceType.sale),
-                    ),
-                    Decimal(0),
-                ),
-                cash_out=Coalesce(
-                    Sum(
-                        "invoice__total",
-                        filter=Q(invoice__invoice_type=InvoiceType.refund_sale),
-                    ),
-                    Decimal(0),
-                ),
+                ],
             )
-            .annotate(cash_in=F("cash_in"))
-            .order_by("-cash_in")
+            .annotate(cash_in=Sum(sales), cash_out=Sum(refunds))
+            .annotate(revenue=F("cash_in") - F("cash_out"))
+            .order_by("-revenue", "pk")
         )
 
 
 class Balance(Widget):
     """Balance for company payment accounts"""
 
+    cache_models = [Payment]
+    cache_per_day = True
+    default_limit = None
+
     def get_serializer_class(self) -> Serializer:
         return BalanceWidgetSerializer
 
     def get_queryset(self) -> QuerySet:
-        received_payments = (
-            Payment.objects.filter(receiver_id=OuterRef("id"))
-            .values("receiver_id")
-            .annotate(cash_in=Sum("amount"))
-        )
-        made_payments = (
-            Payment.objects.filter(payer_id=OuterRef("id"))
-            .values("payer_id")
-            .annotate(cash_out=Sum("amount"))
-        )
+        last_balance = DailyBalance.objects.filter(
+            account_id=OuterRef("id"), currency=OuterRef("account_currency")
+        ).order_by("-date")
         return (
             PaymentAccount.objects.filter(stakeholder=None)
             .annotate(
                 balance=Coalesce(
-                    Subquery(received_payments.values("cash_in")[:1]), Decimal(0)
+                    Subquery(last_balance.values("balance")[:1]), Decimal(0)
                 )
-                - Coalesce(Subquery(made_payments.values("cash_out")[:1]), Decimal(0))
             )
             .select_related("bank")
         )
@@ -193,65 +270,74 @@ class BalanceGraph(Widget):
     """Same as Balance but with graph"""
 
     unique_name = "balance_graph"
+    cache_models = [Payment]
+    cache_per_day = True
+    default_limit = None
+    # user_settings scale: date_trunc kind
+    scales = {"days": "day", "weeks": "week", "months": "month"}
+    default_length = 40
+    max_length = 400
 
     def get_serializer_class(self) -> Serializer:
         return BalanceGraphWidgetSerializer
 
-    def get_queryset(self) -> QuerySet:
-        date_ranges = get_balance_graph_date_ranges()
-        balances = {}
-        first_date = None
-        for i, (date1, date2) in enumerate(date_ranges):
-            if i == 0:
-                first_date = date1
-
-            received_payments = (
-                Payment.objects.filter(
-                    receiver_id=OuterRef("id"), due_date__range=[date1, date2]
-                )
-                .values("receiver_id")
-                .annotate(cash_in=Sum("amount"))
-            )
-            received_payments = Coalesce(
-                received_payments.values("cash_in")[:1], Decimal(0)
-            )
-            made_payments = (
-                Payment.objects.filter(
-                    payer_id=OuterRef("id"), due_date__range=[date1, date2]
-                )
-                .values("payer_id")
-                .annotate(cash_out=Sum("amount"))
-            )
-            made_payments = Coalesce(made_payments.values("cash_out")[:1], Decimal(0))
-            balance = received_payments - made_payments
-            balances[f"balance_{i}"] = balance
-        cash_in_before = (
-            Payment.objects.filter(receiver_id=OuterRef("id"), due_date__lt=first_date)
-            .values("receiver_id")
-            .annotate(cash_in=Sum("amount"))
-        )
-        cash_in_before = Coalesce(cash_in_before.values("cash_in")[:1], Decimal(0))
-        cash_out_before = (
-            Payment.objects.filter(payer_id=OuterRef("id"), due_date__lt=first_date)
-            .values("payer_id")
-            .annotate(cash_out=Sum("amount"))
-        )
-        cash_out_before = Coalesce(cash_out_before.values("cash_out")[:1], Decimal(0))
+    @cached_property
+    def scale(self) -> BalanceGraphScale:
+        scale = self.settings.get("scale")
+        return scale if scale in self.scales else "days"
+
+    @cached_property
+    def date_ranges(self) -> list[tuple[date, date]]:
+        length = self.settings.get("length")
+        if not isinstance(length, int) or not 0 < length <= self.max_length:
+            length = self.default_length
+        return get_balance_graph_date_ranges(self.scale, length)
 
-        balance_before = cash_in_before - cash_out_before
-        balances["balance_before"] = balance_before
-        output = (
+    def get_queryset(self) -> QuerySet:
+        balance_before = DailyBalance.objects.filter(
+            account_id=OuterRef("id"),
+            currency=OuterRef("account_currency"),
+            date__lt=self.date_ranges[0][0],
+        ).order_by("-date")
+        return (
             PaymentAccount.objects.select_related("bank")
             .filter(stakeholder=None)
             .annotate(
-                **balances,
+                balance_before=Coalesce(
+                    Subquery(balance_before.values("balance")[:1]), Decimal(0)
+                )
             )
         )
-        return output
+
+    def serialized_data(self, instances: Any, context=None) -> JSON:
+        # every period of every account in one query, instead of a subquery for each
+        periods = DailyBalance.objects.filter(
+            account__in=instances,
+            currency=F("account__account_currency"),
+            date__range=[self.date_ranges[0][0], self.date_ranges[-1][1]],
+        ).period_totals(self.scales[self.scale])
+        totals = {(row["account_id"], row["period"]): row for row in periods}
+        for account in instances:
+            account.graph_balances = []
+            running_balance = account.balance_before
+            for date_range in self.date_ranges:
+                row = totals.get((account.id, date_range[0]))
+                if row is not None:
+                    running_balance = account.balance_before + row["running_change"]
+                account.graph_balances.append(
+                    {
+                        "balance": row["change"] if row is not None else Decimal(0),
+                        "running_balance": running_balance,
+                        "range": date_range,
+                    }
+                )
+        return super().serialized_data(instances, context)
 
 
 class LastUsers(Widget):
     unique_name = "last_users"
+    cache_models = [User]
+    ordering = ["-date_joined"]
 
     def get_serializer_class(self) -> Serializer:
         return UserSerializer
@@ -262,6 +348,8 @@ class LastUsers(Widget):
 
 class LastItems(Widget):
     unique_name = "last_items"
+    cache_models = [Item, StockMovement]
+    ordering = ["-created_at"]
 
     def get_serializer_class(self) -> Serializer:
         return ItemWidgetSerializer
@@ -269,7 +357,9 @@ class LastItems(Widget):
     def get_queryset(self):
         return (
             Item.objects.select_related("stock_unit", "category", "created_by")
-            .prefetch_related("stocks")
+            .prefetch_related(
+                Prefetch("stocks", queryset=WarehouseItemStock.objects.with_amounts())
+            )
             .all()
         )
 
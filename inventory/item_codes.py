@@ -0,0 +1,127 @@
+"""index of items by barcode and stock_code for scanners.
+
+the items of a code are cached as compact records, in a small in process dict
+and in the shared cache, under a version that writes to items change. so the
+cached records of every code become stale at once and codes of new items are
+found. stocks change with every movement, they aren't cached.
+"""
+import threading
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from inventory.models import Item, WarehouseItemStock
+
+CACHE_TIMEOUT = 60 * 60 * 24
+VERSION_KEY = "item_codes_version"
+LOCAL_MAXSIZE = 10000
+
+# fields of the item records
+RECORD_FIELDS = [
+    "id",
+    "name",
+    "barcode",
+    "stock_code",
+    "sellprice",
+    "sellcurrency",
+    "kdv",
+    "stock_unit_id",
+    "inactivated",
+]
+
+_lock = threading.Lock()
+# records of codes for local_version
+local_version = None
+local_records: dict[str, list[dict]] = {}
+
+
+def invalidate_item_codes():
+    """makes the cached records of every code stale"""
+
+    def change_version():
+        # not a counter, an evicted counter would start over and match old records
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+    change_version()
+    # a lookup before the commit could cache the old records again
+    transaction.on_commit(change_version)
+
+
+def code_cache_key(version: int, code: str) -> str:
+    return f"item_codes:{version}:{code}"
+
+
+def record(item: dict) -> dict:
+    return {
+        field: str(value) if isinstance(value, Decimal) else value
+        for field, value in item.items()
+    }
+
+
+def fetch_records(codes: list[str]) -> dict[str, list[dict]]:
+    records = {code: [] for code in codes}
+    items = Item.objects.filter(Q(barcode__in=codes) | Q(stock_code__in=codes)).values(
+        *RECORD_FIELDS
+    )
+    for item in items.order_by("pk"):
+        for code in {item["barcode"], item["stock_code"]}:
+            if code in records:
+                records[code].append(record(item))
+    return records
+
+
+def get_records(codes: list[str]) -> dict[str, list[dict]]:
+    """the item records of each code, unknown codes have none"""
+    global local_version, local_records
+    version = cache.get_or_set(VERSION_KEY, time.time_ns, timeout=None)
+    with _lock:
+        if version != local_version or len(local_records) > LOCAL_MAXSIZE:
+            local_version, local_records = version, {}
+        records = {code: local_records[code] for code in codes if code in local_records}
+
+    missing = [code for code in codes if code not in records]
+    if missing:
+        keys = {code_cache_key(version, code): code for code in missing}
+        cached = cache.get_many(keys)
+        records.update({keys[key]: value for key, value in cached.items()})
+        missing = [code for code in missing if code not in records]
+    fetched = {}
+    if missing:
+        fetched = fetch_records(missing)
+        cache.set_many(
+            {code_cache_key(version, code): value for code, value in fetched.items()},
+            CACHE_TIMEOUT,
+        )
+        records.update(fetched)
+
+    with _lock:
+        if version == local_version:
+            local_records.update(records)
+    return records
+
+
+def lookup(codes: list[str]) -> dict[str, list[dict]]:
+    """the items of each code (barcode or stock_code) with their stock per
+    warehouse"""
+    records = get_records(codes)
+    item_ids = {item["id"] for items in records.values() for item in items}
+    stocks = {item_id: [] for item_id in item_ids}
+    if item_ids:
+        warehouse_item_stocks = (
+            WarehouseItemStock.objects.filter(item_id__in=item_ids)
+            .only("item_id", "warehouse_id", "amount_db")
+            .order_by("warehouse_id")
+            .with_amounts()
+        )
+        for stock in warehouse_item_stocks:
+            stocks[stock.item_id].append(
+                {"warehouse": stock.warehouse_id, "amount": str(stock.amount_db)}
+            )
+    # the records are shared with other requests
+    return {
+        code: [{**item, "stocks": stocks[item["id"]]} for item in items]
+        for code, items in records.items()
+    }
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+
+from inventory.models import Item, WarehouseItemStock
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculates cached stock amounts (WarehouseItemStock.amount_db) "
+        "from stock movements and reports the ones that were wrong. "
+        "Also recalculates total_stock and last_sold_at of their items."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--warehouse",
+            type=int,
+            action="append",
+            dest="warehouses",
+            help="Only reconcile stocks of this warehouse id, can be repeated.",
+        )
+        parser.add_argument(
+            "--item-from", type=int, help="Only items with id >= this value."
+        )
+        parser.add_argument(
+            "--item-to", type=int, help="Only items with id <= this value."
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Rows per UPDATE statement.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the drift, don't write anything.",
+        )
+
+    def handle(self, *args, **options):
+        queryset = WarehouseItemStock.objects.all()
+        if options["warehouses"]:
+            queryset = queryset.filter(warehouse_id__in=options["warehouses"])
+        if options["item_from"] is not None:
+            queryset = queryset.filter(item_id__gte=options["item_from"])
+        if options["item_to"] is not None:
+            queryset = queryset.filter(item_id__lte=options["item_to"])
+
+        drifted = queryset.reconcile_amounts(
+            chunk_size=options["chunk_size"], commit=not options["dry_run"]
+        )
+
+        missing = [row for row in drifted if row[1] is None]
+        wrong = [row for row in drifted if row[1] is not None]
+        if options["verbosity"] >= 2:
+            for pk, cached, actual in wrong:
+                self.stdout.write(f"stock {pk}: cached {cached}, actual {actual}")
+
+        if not options["dry_run"]:
+            # total_stock of the items is the sum of their stocks
+            items = Item.objects.filter(pk__in=queryset.values("item_id"))
+            refreshed = items.refresh_totals()
+            self.stdout.write(f"totals of {refreshed} items were recalculated.")
+
+        verb = "would be" if options["dry_run"] else "were"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(wrong)} stocks had a wrong amount and {len(missing)} had "
+                f"none, {len(drifted)} {verb} fixed."
+            )
+        )
@@ -0,0 +1,74 @@
+# Generated by Django 4.2 on 2026-10-18 10:51
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def refresh_item_totals(apps, schema_editor):
+    Item = apps.get_model("inventory", "Item")
+    StockMovement = apps.get_model("inventory", "StockMovement")
+    InvoiceItem = apps.get_model("invoice", "InvoiceItem")
+    movement_sum = (
+        StockMovement.objects.filter(warehouse_item_stock__item_id=OuterRef("pk"))
+        .order_by()
+        .values("warehouse_item_stock__item_id")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    last_sale = (
+        InvoiceItem.objects.filter(
+            stock_movement__warehouse_item_stock__item_id=OuterRef("pk"),
+            invoice__invoice_type="sale",
+        )
+        .order_by()
+        .values("stock_movement__warehouse_item_stock__item_id")
+        .annotate(last=Max("invoice__created_at"))
+        .values("last")
+    )
+    Item.objects.update(
+        total_stock=Coalesce(Subquery(movement_sum), Decimal(0)),
+        last_sold_at=Subquery(last_sale),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0017_alter_historicalitem_created_at_and_more"),
+        ("invoice", "0014_alter_invoice_created_at_and_more"),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name="item",
+            managers=[],
+        ),
+        migrations.AddField(
+            model_name="item",
+            name="last_sold_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Last sold at"
+            ),
+        ),
+        migrations.AddField(
+            model_name="item",
+            name="total_stock",
+            field=models.DecimalField(
+                decimal_places=4,
+                default=Decimal("0"),
+                max_digits=19,
+                verbose_name="Total stock",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="item",
+            index=models.Index(
+                condition=models.Q(("total_stock__gt", 0)),
+                fields=["last_sold_at", "id"],
+                name="item_in_stock_last_sold_idx",
+            ),
+        ),
+        migrations.RunPython(refresh_item_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-18 11:16
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0018_item_last_sold_at_item_total_stock_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="item",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector(
+                    "name", "description", config="turkish"
+                ),
+                name="item_search_idx",
+            ),
+        ),
+    ]
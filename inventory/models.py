@@ -1,15 +1,20 @@
+from collections import defaultdict
+from datetime import datetime
 from decimal import Decimal
 from pathlib import Path
-from typing import Sequence
+from typing import Iterable
 
-from django.db import models
-from django.db.models import QuerySet
-from django.db.models.aggregates import Sum
+from django.contrib.postgres.indexes import GinIndex
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Q, QuerySet, Subquery, Value, When
+from django.db.models.aggregates import Max, Sum
+from django.db.models.functions import Coalesce, Greatest
 from django.utils.translation import gettext_lazy as _
 from simple_history.models import HistoricalRecords
 
 from utilities.common_model_mixins import CreateUpdateInfo, InactivatedMixin
-from utilities.enums import Currency
+from utilities.enums import Currency, InvoiceType
+from utilities.search import search_vector
 from utilities.validators import not_zero_validator
 
 
@@ -43,6 +48,69 @@ def get_item_image_location(instance: "Item", filename: str) -> Path:
     return path
 
 
+class ItemQuerySet(models.QuerySet["Item"]):
+    def add_to_total_stocks(self, deltas: dict[int, Decimal]) -> int:
+        """adds {item_id: delta} to total_stock in one UPDATE."""
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if not deltas:
+            return 0
+        delta_case = Case(
+            *(When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()),
+            output_field=self.model._meta.get_field("total_stock"),
+        )
+        return self.filter(pk__in=deltas).update(
+            total_stock=F("total_stock") + delta_case
+        )
+
+    def mark_sold(self, sold_at: dict[int, datetime]) -> int:
+        """moves last_sold_at of {item_id: sold_at} forward in one UPDATE,
+        an earlier sale doesn't change it."""
+        if not sold_at:
+            return 0
+        sold_at_case = Case(
+            *(When(pk=pk, then=Value(at)) for pk, at in sold_at.items()),
+            output_field=self.model._meta.get_field("last_sold_at"),
+        )
+        return self.filter(pk__in=sold_at).update(
+            last_sold_at=Greatest(Coalesce("last_sold_at", sold_at_case), sold_at_case)
+        )
+
+    def refresh_totals(self) -> int:
+        """recalculates total_stock and last_sold_at of every item in this queryset
+        from stock movements and sale invoices in a single UPDATE."""
+        # invoice.models imports this module
+        InvoiceItem = self.model._meta.apps.get_model("invoice", "InvoiceItem")
+        movement_sum = (
+            StockMovement.objects.filter(warehouse_item_stock__item_id=OuterRef("pk"))
+            .order_by()
+            .values("warehouse_item_stock__item_id")
+            .annotate(total=Sum("amount"))
+            .values("total")
+        )
+        last_sale = (
+            InvoiceItem.objects.filter(
+                stock_movement__warehouse_item_stock__item_id=OuterRef("pk"),
+                invoice__invoice_type=InvoiceType.sale,
+            )
+            .order_by()
+            .values("stock_movement__warehouse_item_stock__item_id")
+            .annotate(last=Max("invoice__created_at"))
+            .values("last")
+        )
+        return self.update(
+            total_stock=Coalesce(Subquery(movement_sum), Decimal(0)),
+            last_sold_at=Subquery(last_sale),
+        )
+
+    def leftovers(self, not_sold_since: datetime, created_before: datetime):
+        """items in stock that weren't sold since not_sold_since"""
+        return self.filter(
+            Q(last_sold_at__lt=not_sold_since) | Q(last_sold_at__isnull=True),
+            total_stock__gt=0,
+            created_at__lt=created_before,
+        )
+
+
 class Item(CreateUpdateInfo, InactivatedMixin["Item"]):
     name = models.CharField(_("Item/Service"), max_length=200, unique=True)
     description = models.CharField(
@@ -90,10 +158,52 @@ class Item(CreateUpdateInfo, InactivatedMixin["Item"]):
         on_delete=models.PROTECT,
     )
 
-    history = HistoricalRecords()
+    # kept up to date by stock movements and sale invoices, not by saving the item.
+    # save() leaves them out of its UPDATE and refuses them in update_fields, use
+    # ItemQuerySet.add_to_total_stocks, mark_sold or refresh_totals instead
+    total_stock = models.DecimalField(
+        _("Total stock"), max_digits=19, decimal_places=4, default=Decimal(0)
+    )
+    last_sold_at = models.DateTimeField(_("Last sold at"), null=True, blank=True)
+    maintained_fields = ["total_stock", "last_sold_at"]
+
+    history = HistoricalRecords(excluded_fields=maintained_fields)
+
+    objects = ItemQuerySet.as_manager()
 
     stocks: QuerySet["WarehouseItemStock"]  # reverse foreign key
 
+    class Meta:
+        indexes = [
+            # leftover (slow moving) items
+            models.Index(
+                fields=["last_sold_at", "id"],
+                condition=Q(total_stock__gt=0),
+                name="item_in_stock_last_sold_idx",
+            ),
+            # ItemViewset search_fields
+            GinIndex(search_vector("name", "description"), name="item_search_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if set(kwargs.get("update_fields") or []) & set(self.maintained_fields):
+            raise ValueError(
+                f"{', '.join(self.maintained_fields)} of items can't be saved, "
+                "they are kept up to date by stock movements and sale invoices."
+            )
+        # a stale total_stock would overwrite the movements written since it was read
+        if not (args or self._state.adding or kwargs.get("force_insert")):
+            kwargs.setdefault(
+                "update_fields",
+                [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.name not in self.maintained_fields
+                ],
+            )
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.name}"
 
@@ -120,6 +230,132 @@ class Warehouse(models.Model):
         return f"{self.name}"
 
 
+class WarehouseItemStockQuerySet(models.QuerySet["WarehouseItemStock"]):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._fill_amounts = False
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._fill_amounts = self._fill_amounts
+        return clone
+
+    def _fetch_all(self):
+        needs_filling = self._result_cache is None and self._fill_amounts
+        super()._fetch_all()
+        if needs_filling and self._iterable_class is models.query.ModelIterable:
+            self.fill_missing_amounts(self._result_cache)
+
+    def with_amounts(self) -> "WarehouseItemStockQuerySet":
+        """makes sure fetched stocks have amount_db set, missing ones are
+        calculated for the whole batch at once. use this (or a Prefetch with it)
+        wherever stocks are rendered in a list."""
+        clone = self._chain()
+        clone._fill_amounts = True
+        return clone
+
+    def fill_missing_amounts(
+        self, warehouse_item_stocks: Iterable["WarehouseItemStock"]
+    ) -> None:
+        """calculates amount_db of the stocks that don't have it with one grouped
+        SUM and writes them back with one UPDATE."""
+        missing = {
+            wis.pk: wis for wis in warehouse_item_stocks if wis.amount_db is None
+        }
+        if not missing:
+            return
+        sums = dict(
+            StockMovement.objects.filter(warehouse_item_stock_id__in=missing)
+            .values("warehouse_item_stock_id")
+            .annotate(total=Sum("amount"))
+            .values_list("warehouse_item_stock_id", "total")
+        )
+        for pk, wis in missing.items():
+            wis.amount_db = Decimal(sums.get(pk) or 0)
+        amount_field = self.model._meta.get_field("amount_db")
+        amount_case = Case(
+            *(When(pk=pk, then=Value(wis.amount_db)) for pk, wis in missing.items()),
+            output_field=amount_field,
+        )
+        # stocks that got an amount meanwhile are already correct, leave them be.
+        self.model._default_manager.filter(
+            pk__in=missing, amount_db__isnull=True
+        ).update(amount_db=amount_case)
+
+    def reconcile_amounts(
+        self, chunk_size: int = 5000, commit: bool = True
+    ) -> list[tuple[int, Decimal | None, Decimal]]:
+        """finds the stocks in this queryset whose amount_db is wrong with one grouped
+        SUM over the movements and recalculates them chunk_size rows per UPDATE.
+        returns (id, cached amount, actual amount) of the wrong ones."""
+        totals = dict(
+            StockMovement.objects.filter(warehouse_item_stock__in=self.values("pk"))
+            .values("warehouse_item_stock_id")
+            .annotate(total=Sum("amount"))
+            .order_by()
+            .values_list("warehouse_item_stock_id", "total")
+        )
+        drifted = []
+        cached_amounts = self.order_by().values_list("pk", "amount_db")
+        for pk, cached in cached_amounts.iterator(chunk_size=chunk_size):
+            actual = Decimal(totals.get(pk) or 0)
+            if cached != actual:
+                drifted.append((pk, cached, actual))
+
+        if commit:
+            # summing again while updating, so movements written since the
+            # grouped SUM above aren't lost.
+            for start in range(0, len(drifted), chunk_size):
+                pks = [pk for pk, cached, actual in drifted[start : start + chunk_size]]
+                self.model._default_manager.filter(pk__in=pks).refresh_amounts()
+        return drifted
+
+    def refresh_amounts(self) -> int:
+        """recalculates amount_db of every stock in this queryset from its
+        movements in a single UPDATE ... SET amount_db = (SELECT SUM(...))."""
+        movement_sum = (
+            StockMovement.objects.filter(warehouse_item_stock_id=OuterRef("pk"))
+            .order_by()
+            .values("warehouse_item_stock_id")
+            .annotate(total=Sum("amount"))
+            .values("total")
+        )
+        return self.update(amount_db=Coalesce(Subquery(movement_sum), Decimal(0)))
+
+    def invalidate_amounts(self) -> int:
+        """forgets amount_db of every stock in this queryset, they get calculated
+        again when they are read through with_amounts()."""
+        return self.update(amount_db=None)
+
+    def apply_deltas(self, deltas: Iterable[tuple[int, Decimal]]) -> int:
+        """adds (warehouse_item_stock_id, delta) pairs to amount_db in one UPDATE,
+        and to total_stock of their items in another one.
+        stocks whose amount_db is NULL stay NULL, they get recalculated on read."""
+        summed: defaultdict[int, Decimal] = defaultdict(Decimal)
+        for warehouse_item_stock_id, delta in deltas:
+            summed[warehouse_item_stock_id] += delta
+        summed = {pk: delta for pk, delta in summed.items() if delta}
+        if not summed:
+            return 0
+        amount_field = self.model._meta.get_field("amount_db")
+        delta_case = Case(
+            *(When(pk=pk, then=Value(delta)) for pk, delta in summed.items()),
+            output_field=amount_field,
+        )
+        updated = self.filter(pk__in=summed).update(
+            amount_db=F("amount_db") + delta_case
+        )
+
+        item_deltas: defaultdict[int, Decimal] = defaultdict(Decimal)
+        stock_items = self.model._default_manager.filter(pk__in=summed).values_list(
+            "pk", "item_id"
+        )
+        for pk, item_id in stock_items:
+            item_deltas[item_id] += summed[pk]
+        Item.objects.add_to_total_stocks(item_deltas)
+        return updated
+
+
 class WarehouseItemStock(models.Model):
     item = models.ForeignKey(
         Item,
@@ -143,14 +379,28 @@ class WarehouseItemStock(models.Model):
         blank=True,
     )
 
+    objects = WarehouseItemStockQuerySet.as_manager()
+
     @staticmethod
-    def update_stocks(ids: list[int]) -> None:
-        warehouse_item_stocks = WarehouseItemStock.objects.filter(ids)
-        for wis in warehouse_item_stocks:
-            wis.amount_db = None
-        WarehouseItemStock.objects.bulk_update(
-            warehouse_item_stocks, fields=["amount_db"]
-        )
+    def update_stocks(
+        ids: Iterable[int] | None = None,
+        item_ids: Iterable[int] | None = None,
+        warehouse_ids: Iterable[int] | None = None,
+        refresh: bool = True,
+    ) -> int:
+        """recalculates (or with refresh=False just invalidates) the stocks matching
+        all of the given ids in one statement without loading them.
+        returns the number of stocks updated."""
+        queryset = WarehouseItemStock.objects.all()
+        if ids is not None:
+            queryset = queryset.filter(pk__in=ids)
+        if item_ids is not None:
+            queryset = queryset.filter(item_id__in=item_ids)
+        if warehouse_ids is not None:
+            queryset = queryset.filter(warehouse_id__in=warehouse_ids)
+        if refresh:
+            return queryset.refresh_amounts()
+        return queryset.invalidate_amounts()
 
     def calculate_stock(self) -> Decimal:
         stock_movements = self.stockmovement_set.all()
@@ -160,18 +410,13 @@ class WarehouseItemStock(models.Model):
     # @persistent_cached_property(timeout=None)
     @property
     def amount(self) -> Decimal:
+        # amount_db is kept up to date by StockMovement writes, NULL means
+        # it is unknown. this doesn't write it back, querysets made with
+        # WarehouseItemStock.objects.with_amounts() do that for whole batches.
         if self.amount_db is None:
-            self.amount_db = self.calculate_stock()
-            self.save()
+            return self.calculate_stock()
         return self.amount_db
 
-    def refresh_from_db(
-        self, using: str | None = None, fields: Sequence[str] | None = None
-    ) -> None:
-        self.amount_db = self.calculate_stock()
-        self.save()
-        return super().refresh_from_db(using, fields)
-
     class Meta:
         unique_together = [["item", "warehouse"]]
 
@@ -195,6 +440,23 @@ class StockMovement(CreateUpdateInfo):
         "self", on_delete=models.CASCADE, blank=True, null=True
     )
 
+    def save(self, *args, **kwargs) -> None:
+        """saves the movement and moves the difference into the cached stock
+        amounts in the same transaction. deletes are handled by post_delete signal."""
+        with transaction.atomic():
+            deltas = [(self.warehouse_item_stock_id, self.amount)]
+            if not self._state.adding and self.pk is not None:
+                previous = (
+                    StockMovement.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values_list("warehouse_item_stock_id", "amount")
+                    .first()
+                )
+                if previous:
+                    deltas.append((previous[0], -previous[1]))
+            super().save(*args, **kwargs)
+            WarehouseItemStock.objects.apply_deltas(deltas)
+
     def __str__(self):
         direction = "> >" if self.amount > 0 else "< <"
         if self.related_movement:
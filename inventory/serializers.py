@@ -1,7 +1,10 @@
-from typing import Any, OrderedDict
+from decimal import Decimal
+from typing import Any, Iterable, OrderedDict
 
+from django.db.models import Manager
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
 
 from inventory import models
 from users.serializers import ConciseUserSerializer
@@ -78,12 +81,22 @@ class WarehouseSerializer(ModelSerializer):
         fields = ["id", "name", "address", "phone", "plate_number"]
 
 
+class WarehouseItemStockListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # fills missing amounts of the whole list at once instead of one
+        # query per stock, does nothing if they are already filled.
+        stocks = list(data.all() if isinstance(data, Manager) else data)
+        models.WarehouseItemStock.objects.fill_missing_amounts(stocks)
+        return super().to_representation(stocks)
+
+
 class WarehouseItemStockSerializer(ModelSerializer):
     amount = serializers.DecimalField(max_digits=19, decimal_places=4, read_only=True)
 
     class Meta:
         model = models.WarehouseItemStock
         fields = ["id", "item", "warehouse", "amount"]
+        list_serializer_class = WarehouseItemStockListSerializer
 
 
 class ItemInSerializer(DynamicFieldsModelSerializer):
@@ -203,11 +216,12 @@ class ItemNestedSerializer(UniqueFieldsMixin, ModelSerializer):
 
     def create(self, validated_data: OrderedDict):
         stock_unit_data: OrderedDict = validated_data.pop("stock_unit")
-        if stock_unit_data.get("id"):
-            stock_unit = models.StockUnit.objects.get(id=stock_unit_data["id"])
-        else:
-            stock_unit = StockUnitSerializer().create(stock_unit_data)
-        return super().create({**validated_data, "stock_unit_id": stock_unit.id})
+        # a new item doesn't have any stocks to set
+        validated_data.pop("stocks", None)
+        stock_unit_id = stock_unit_data.get("id")
+        if not stock_unit_id:
+            stock_unit_id = StockUnitSerializer().create(stock_unit_data).id
+        return super().create({**validated_data, "stock_unit_id": stock_unit_id})
 
     class Meta:
         model = models.Item
@@ -240,11 +254,13 @@ class WarehouseItemStockNestedSerializer(ModelSerializer):
 
     def create(self, validated_data: OrderedDict):
         item_data: OrderedDict = validated_data.pop("item")
-        if item_data.get("id"):
-            item = models.Item.objects.get(id=item_data["id"])
-        else:
-            item = ItemNestedSerializer().create(item_data)
-        return super().create({**validated_data, "item_id": item.id})
+        item_id = item_data.get("id")
+        if not item_id:
+            item_id = ItemNestedSerializer().create(item_data).id
+        # a new stock has no movements yet, movements add their deltas to it.
+        return super().create(
+            {**validated_data, "item_id": item_id, "amount_db": Decimal(0)}
+        )
 
     class Meta:
         model = models.WarehouseItemStock
@@ -252,6 +268,70 @@ class WarehouseItemStockNestedSerializer(ModelSerializer):
         fields = ["item", "warehouse", "amount"]
 
 
+class StockMovementNestedListSerializer(serializers.ListSerializer):
+    """creates (unsaved) StockMovements of many lines at once. items and stocks of
+    all the lines are looked up together, so the number of queries doesn't
+    depend on the number of lines, except for lines with brand new items."""
+
+    def create(self, validated_data: list[OrderedDict]):
+        stocks_data = [vd.pop("warehouse_item_stock") for vd in validated_data]
+        stock_ids = self.resolve_stock_ids(stocks_data)
+        return [
+            models.StockMovement(**vd, warehouse_item_stock_id=stock_id)
+            for vd, stock_id in zip(validated_data, stock_ids)
+        ]
+
+    def resolve_stock_ids(self, stocks_data: list[OrderedDict]) -> list[int]:
+        """ids of the WarehouseItemStocks for the given warehouse_item_stock data,
+        in the same order. creates the items and stocks that don't exist yet."""
+        item_ids = {sd["item"]["id"] for sd in stocks_data if sd["item"].get("id")}
+        existing_item_ids = set(
+            models.Item.objects.filter(id__in=item_ids).values_list("id", flat=True)
+        )
+        if item_ids - existing_item_ids:
+            raise ValidationError(
+                {"item": _("Item/Service doesn't exist.")}, code="does_not_exist"
+            )
+        for stock_data in stocks_data:
+            if not stock_data["item"].get("id"):
+                item = ItemNestedSerializer().create(stock_data["item"])
+                stock_data["item"]["id"] = item.id
+
+        pairs = [(sd["item"]["id"], sd["warehouse"].id) for sd in stocks_data]
+        stock_ids = self.get_stock_ids(pairs)
+        missing_pairs = set(pairs) - set(stock_ids)
+        if missing_pairs:
+            # a new stock has no movements yet, movements add their deltas to it.
+            models.WarehouseItemStock.objects.bulk_create(
+                [
+                    models.WarehouseItemStock(
+                        item_id=item_id,
+                        warehouse_id=warehouse_id,
+                        amount_db=Decimal(0),
+                    )
+                    for item_id, warehouse_id in missing_pairs
+                ],
+                # someone else may have created it in the meantime
+                ignore_conflicts=True,
+            )
+            stock_ids.update(self.get_stock_ids(missing_pairs))
+        return [stock_ids[pair] for pair in pairs]
+
+    @staticmethod
+    def get_stock_ids(pairs: Iterable[tuple[int, int]]) -> dict[tuple[int, int], int]:
+        """{(item_id, warehouse_id): warehouse_item_stock_id} for the given pairs"""
+        pairs = set(pairs)
+        stocks = models.WarehouseItemStock.objects.filter(
+            item_id__in={item_id for item_id, warehouse_id in pairs},
+            warehouse_id__in={warehouse_id for item_id, warehouse_id in pairs},
+        ).values_list("item_id", "warehouse_id", "id")
+        return {
+            (item_id, warehouse_id): stock_id
+            for item_id, warehouse_id, stock_id in stocks
+            if (item_id, warehouse_id) in pairs
+        }
+
+
 class StockMovementNestedSerializer(ModelSerializer):
     """for creating WarehouseItemStock from StockMovement"""
 
@@ -310,18 +390,17 @@ class StockMovementNestedSerializer(ModelSerializer):
             ) = models.WarehouseItemStock.objects.get_or_create(
                 item_id=warehouse_item_stock_data["item"]["id"],
                 warehouse=warehouse_item_stock_data["warehouse"],
+                defaults={"amount_db": Decimal(0)},
             )
-            instance.warehouse_item_stock.amount_db = None
-            instance.warehouse_item_stock.save()
             instance.warehouse_item_stock = warehouse_item_stock
 
-        instance.warehouse_item_stock.amount_db = None
         instance.amount = validated_data["amount"]
         return instance
 
     class Meta:
         model = models.StockMovement
         fields = ["warehouse_item_stock", "amount", "related_movement"]
+        list_serializer_class = StockMovementNestedListSerializer
 
 
 class WarehouseItemStockInfoSerializer(DynamicFieldsModelSerializer):
@@ -341,4 +420,38 @@ class WarehouseItemStockInfoSerializer(DynamicFieldsModelSerializer):
         fields = ["item", "warehouse", "amount_db"]
 
 
+class ItemCodeLookupQuerySerializer(serializers.Serializer):
+    code = serializers.ListField(
+        child=serializers.CharField(max_length=40),
+        allow_empty=False,
+        max_length=200,
+        help_text=_("Barcode or stock code, can be repeated"),
+    )
+
+
+class ItemCodeStockSerializer(serializers.Serializer):
+    warehouse = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=19, decimal_places=4)
+
+
+class ItemCodeSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    barcode = serializers.CharField(allow_null=True)
+    stock_code = serializers.CharField(allow_null=True)
+    sellprice = serializers.DecimalField(max_digits=19, decimal_places=4)
+    sellcurrency = serializers.CharField()
+    kdv = serializers.IntegerField()
+    stock_unit_id = serializers.IntegerField()
+    inactivated = serializers.BooleanField()
+    stocks = ItemCodeStockSerializer(many=True)
+
+
+class ItemCodeLookupSerializer(serializers.Serializer):
+    """documents the response of ItemLookupView, which is built by
+    inventory.item_codes without serializers"""
+
+    results = serializers.DictField(child=ItemCodeSerializer(many=True))
+
+
 # TODO: Merge Items that may be duplicate with a view
@@ -1,18 +1,28 @@
 from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
-from inventory.models import Item, StockMovement
-from utilities.signals import handle_file_pre_delete, handle_file_field_cleanup_pre_save
+from inventory.item_codes import invalidate_item_codes
+from inventory.models import Item, StockMovement, WarehouseItemStock
+from utilities.signals import (
+    bulk_saved,
+    handle_file_field_cleanup_pre_save,
+    handle_file_pre_delete,
+)
 
 pre_save.connect(handle_file_field_cleanup_pre_save, sender=Item)
 pre_delete.connect(handle_file_pre_delete, sender=Item)
 
 
-# this won't be called when doing bulk create, bulk update but hey.
-# doesn't hurt to have it.
-@receiver(post_save, sender=StockMovement)
+# inserts and updates are handled by StockMovement.save, bulk operations
+# have to call WarehouseItemStock.objects.apply_deltas themselves.
+# queryset deletes still send this signal for every movement.
 @receiver(post_delete, sender=StockMovement)
-def clear_warehouse_item_stock_cache(sender, instance: StockMovement, **kwargs):
-    if instance.warehouse_item_stock.amount_db is not None:
-        instance.warehouse_item_stock.amount_db = None
-        instance.warehouse_item_stock.save()
+def subtract_deleted_movement_from_stock(sender, instance: StockMovement, **kwargs):
+    WarehouseItemStock.objects.apply_deltas(
+        [(instance.warehouse_item_stock_id, -instance.amount)]
+    )
+
+
+@receiver([post_save, post_delete, bulk_saved], sender=Item)
+def invalidate_codes_of_changed_items(sender, **kwargs):
+    invalidate_item_codes()
@@ -0,0 +1,62 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from inventory.models import (
+    Item,
+    StockMovement,
+    StockUnit,
+    Warehouse,
+    WarehouseItemStock,
+)
+
+
+class TestReconcileStocks(TestCase):
+    def setUp(self):
+        unit = StockUnit.objects.create(name="Adet")
+        self.item = Item.objects.create(
+            name="reconciled item",
+            stock_unit=unit,
+            kdv=18,
+            buyprice=Decimal("10"),
+            sellprice=Decimal("12"),
+        )
+        self.warehouse = Warehouse.objects.create(name="Ana Depo")
+        self.warehouse2 = Warehouse.objects.create(name="Yeni Depo")
+        self.stock = WarehouseItemStock.objects.create(
+            item=self.item, warehouse=self.warehouse
+        )
+        self.stock2 = WarehouseItemStock.objects.create(
+            item=self.item, warehouse=self.warehouse2
+        )
+        StockMovement.objects.create(warehouse_item_stock=self.stock, amount=7)
+        StockMovement.objects.create(warehouse_item_stock=self.stock2, amount=3)
+        WarehouseItemStock.objects.filter(pk=self.stock.pk).update(amount_db=100)
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command("reconcile_stocks", *args, stdout=out)
+        return out.getvalue()
+
+    def amounts(self):
+        return dict(WarehouseItemStock.objects.values_list("pk", "amount_db"))
+
+    def test_dry_run_reports_without_writing(self):
+        before = self.amounts()
+        output = self.reconcile("--dry-run")
+        self.assertIn("1 stocks had a wrong amount and 1 had none", output)
+        self.assertEqual(self.amounts(), before)
+
+    def test_rebuilds_amounts(self):
+        self.reconcile()
+        self.assertEqual(
+            self.amounts(), {self.stock.pk: Decimal(7), self.stock2.pk: Decimal(3)}
+        )
+
+    def test_only_given_warehouse_is_rebuilt(self):
+        self.reconcile("--warehouse", str(self.warehouse2.pk))
+        self.assertEqual(
+            self.amounts(), {self.stock.pk: Decimal(100), self.stock2.pk: Decimal(3)}
+        )
@@ -109,3 +109,97 @@ class TestAppModels(TestCase):
         self.assertEqual(
             toWarehouseStockBefore + change, self.warehouse_item_stock.amount
         )
+
+    def amount_db_of(self, warehouse_item_stock: WarehouseItemStock):
+        return (
+            WarehouseItemStock.objects.filter(pk=warehouse_item_stock.pk)
+            .values_list("amount_db", flat=True)
+            .get()
+        )
+
+    def test_stock_movement_writes_apply_deltas_to_amount_db(self):
+        # computes amount_db once, after that it should be maintained by deltas.
+        WarehouseItemStock.objects.filter(
+            pk=self.warehouse_item_stock.pk
+        ).reconcile_amounts()
+        current_stock = self.amount_db_of(self.warehouse_item_stock)
+        movement: StockMovement = StockMovement.objects.create(
+            warehouse_item_stock=self.warehouse_item_stock,
+            amount=Decimal("3"),
+        )
+        self.assertEqual(
+            self.amount_db_of(self.warehouse_item_stock), current_stock + 3
+        )
+        movement.amount = Decimal("-2")
+        movement.save()
+        self.assertEqual(
+            self.amount_db_of(self.warehouse_item_stock), current_stock - 2
+        )
+        movement.delete()
+        self.assertEqual(self.amount_db_of(self.warehouse_item_stock), current_stock)
+
+    def test_apply_deltas_keeps_unknown_amounts_unknown(self):
+        WarehouseItemStock.objects.filter(pk=self.warehouse_item_stock.pk).update(
+            amount_db=None
+        )
+        WarehouseItemStock.objects.apply_deltas(
+            [(self.warehouse_item_stock.pk, Decimal("1"))]
+        )
+        self.assertIsNone(self.amount_db_of(self.warehouse_item_stock))
+
+    def test_amount_property_does_not_write(self):
+        self.assertEqual(self.warehouse_item_stock.amount, Decimal("10.15"))
+        self.assertIsNone(self.amount_db_of(self.warehouse_item_stock))
+
+    def test_with_amounts_fills_missing_amounts_in_one_batch(self):
+        pks = [self.warehouse_item_stock.pk, self.warehouse_item_stock2.pk]
+        # select, grouped sum and the update that writes them back
+        with self.assertNumQueries(3):
+            stocks = list(WarehouseItemStock.objects.filter(pk__in=pks).with_amounts())
+        self.assertEqual(
+            {wis.pk: wis.amount_db for wis in stocks},
+            {pks[0]: Decimal("10.15"), pks[1]: Decimal("5")},
+        )
+        self.assertEqual(self.amount_db_of(self.warehouse_item_stock2), Decimal("5"))
+        # nothing left to fill
+        with self.assertNumQueries(1):
+            list(WarehouseItemStock.objects.filter(pk__in=pks).with_amounts())
+
+    def test_update_stocks_refreshes_by_item_and_warehouse(self):
+        WarehouseItemStock.objects.update(amount_db=Decimal(100))
+        updated = WarehouseItemStock.update_stocks(
+            item_ids=[self.item.pk], warehouse_ids=[self.warehouse2.pk]
+        )
+        self.assertEqual(updated, 1)
+        self.assertEqual(self.amount_db_of(self.warehouse_item_stock2), Decimal(5))
+        self.assertEqual(self.amount_db_of(self.warehouse_item_stock), Decimal(100))
+
+        WarehouseItemStock.update_stocks(ids=[self.warehouse_item_stock.pk])
+        self.assertEqual(self.amount_db_of(self.warehouse_item_stock), Decimal("10.15"))
+
+        WarehouseItemStock.update_stocks(item_ids=[self.item.pk], refresh=False)
+        self.assertIsNone(self.amount_db_of(self.warehouse_item_stock))
+
+    def test_total_stock_of_item_is_kept_up_to_date(self):
+        def total_stock():
+            return Item.objects.values_list("total_stock", flat=True).get(
+                pk=self.item.pk
+            )
+
+        self.assertEqual(total_stock(), Decimal("15.15"))
+        self.warehouse_stock_movement2.amount = Decimal("-5")
+        self.warehouse_stock_movement2.save()
+        self.assertEqual(total_stock(), Decimal("5.15"))
+        self.warehouse_stock_movement.delete()
+        self.assertEqual(total_stock(), Decimal("-5"))
+
+        # saving an item that was loaded before doesn't overwrite it
+        self.item.name = "renamed item"
+        self.item.save()
+        self.assertEqual(total_stock(), Decimal("-5"))
+        with self.assertRaises(ValueError):
+            self.item.save(update_fields=["name", "total_stock"])
+
+        Item.objects.update(total_stock=Decimal(100))
+        Item.objects.filter(pk=self.item.pk).refresh_totals()
+        self.assertEqual(total_stock(), Decimal("-5"))
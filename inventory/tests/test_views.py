@@ -1,12 +1,22 @@
+import csv
+from decimal import Decimal
 from uuid import uuid4
 
 from django.contrib.auth.models import AnonymousUser, Group, Permission
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework.response import Response
 from rest_framework.test import APIClient
 
-from inventory.models import StockUnit
+from inventory.item_codes import lookup
+from inventory.models import (
+    Item,
+    StockMovement,
+    StockUnit,
+    Warehouse,
+    WarehouseItemStock,
+)
 from users.models import User
 
 
@@ -83,3 +93,97 @@ class TestInventory(TestCase):
     def test_item_not_created_by_non_employee_user(self):
         res = self.create_item(self.nonemployee_client)
         self.assertEqual(res.status_code, 403)
+
+    def test_item_export_streams_filtered_and_ordered_csv(self):
+        for name, buyprice in [("b item", 10), ("a item", 20), ("c item", 30)]:
+            Item.objects.create(
+                name=name,
+                stock_unit=self.stock_unit,
+                kdv=18,
+                buyprice=buyprice,
+                sellprice=buyprice,
+            )
+        res = self.employee_client.get(
+            reverse("item-export"),
+            {"buyprice__range": "5,25", "search": "item", "ordering": "name"},
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res["Content-Type"], "text/csv")
+        rows = list(
+            csv.reader(b"".join(res.streaming_content).decode("utf-8-sig").splitlines())
+        )
+        self.assertEqual(rows[0][1], str(Item._meta.get_field("name").verbose_name))
+        self.assertEqual([row[1] for row in rows[1:]], ["a item", "b item"])
+
+    def test_item_search_matches_words_by_prefix_and_ranks_them(self):
+        for name, description in [
+            ("Mavi defter", "kalemlik ile"),
+            ("Kırmızı kalem", "kalemler, kırmızı"),
+            ("Silgi", None),
+        ]:
+            Item.objects.create(
+                name=name,
+                description=description,
+                stock_unit=self.stock_unit,
+                kdv=18,
+                buyprice=1,
+                sellprice=1,
+            )
+        url = reverse("item-list")
+        res = self.employee_client.get(url, {"search": "kalem"})
+        self.assertEqual(
+            [item["name"] for item in res.data["results"]],
+            ["Kırmızı kalem", "Mavi defter"],
+        )
+        res = self.employee_client.get(url, {"search": "kırmızı kal"})
+        self.assertEqual(
+            [item["name"] for item in res.data["results"]], ["Kırmızı kalem"]
+        )
+        res = self.employee_client.get(url, {"search": "%"})
+        self.assertEqual(res.data["count"], 0)
+
+    def test_items_are_looked_up_by_barcode_and_stock_code(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        warehouse = Warehouse.objects.create(name="Depot")
+        items = [
+            Item.objects.create(
+                name=name,
+                barcode=barcode,
+                stock_code="PEN",
+                stock_unit=self.stock_unit,
+                kdv=18,
+                buyprice=1,
+                sellprice=2,
+            )
+            for name, barcode in [("blue pen", "8690001"), ("red pen", "8690002")]
+        ]
+        stock = WarehouseItemStock.objects.create(item=items[0], warehouse=warehouse)
+        StockMovement.objects.create(warehouse_item_stock=stock, amount=Decimal(3))
+
+        url = reverse("item-lookup")
+        res = self.employee_client.get(url, {"code": ["8690001", "PEN", "unknown"]})
+        self.assertEqual(res.status_code, 200)
+        results = res.json()["results"]
+        (blue_pen,) = results["8690001"]
+        self.assertEqual(blue_pen["name"], "blue pen")
+        self.assertEqual(
+            blue_pen["stocks"], [{"warehouse": warehouse.id, "amount": "3.0000"}]
+        )
+        self.assertEqual(
+            [item["name"] for item in results["PEN"]], ["blue pen", "red pen"]
+        )
+        self.assertEqual(results["unknown"], [])
+
+        # cached codes only query the stocks
+        with self.assertNumQueries(1):
+            self.assertEqual(lookup(["8690001"])["8690001"], [blue_pen])
+
+        items[1].barcode = "unknown"
+        items[1].save()
+        results = self.employee_client.get(url, {"code": ["unknown"]}).json()["results"]
+        self.assertEqual([item["name"] for item in results["unknown"]], ["red pen"])
+
+        res = self.employee_client.get(url)
+        self.assertEqual(res.status_code, 400)
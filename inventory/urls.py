@@ -15,6 +15,8 @@ router.register("warehouse-item-stock", views.WarehouseItemStockViewset)
 router.register("stock-movement", views.StockMovementWithoutItemViewset)
 
 urlpatterns = [
+    # before the router, item/<pk>/ would match it
+    path("item/lookup/", views.ItemLookupView.as_view(), name="item-lookup"),
     path("", include(router.urls)),
     path("bulk/", include(url_patterns)),
 ]
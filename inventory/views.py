@@ -1,15 +1,22 @@
 import django_filters
-from django.db.models import QuerySet
+from django.db.models import Prefetch, QuerySet
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.cache import cache_page
 from django.views.decorators.vary import vary_on_cookie, vary_on_headers
+from drf_spectacular.utils import extend_schema
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
 from inventory import models
 from inventory import serializers as inventory_serializers
+from inventory.item_codes import lookup
 from invoice import serializers as invoice_serializers
-from utilities.filters import DjangoFilterBackend, OrderingFilter, SearchFilter
+from utilities.exportviewmixins import CSVExportMixin
+from utilities.filters import (DjangoFilterBackend, FullTextSearchFilter,
+                               OrderingFilter, SearchFilter)
+from utilities.pagination import KeysetPagination
 
 
 class CategoryViewset(ModelViewSet):
@@ -121,7 +128,7 @@ class ItemFilter(django_filters.FilterSet):
         }
 
 
-class ItemViewset(ModelViewSet):
+class ItemViewset(CSVExportMixin, ModelViewSet):
     queryset = (
         models.Item.objects.select_related(
             "created_by",
@@ -129,10 +136,14 @@ class ItemViewset(ModelViewSet):
             "category",
             "stock_unit",
         )
-        .prefetch_related("stocks")
+        .prefetch_related(
+            Prefetch(
+                "stocks", queryset=models.WarehouseItemStock.objects.with_amounts()
+            )
+        )
         .all()
     )
-    filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
+    filter_backends = [DjangoFilterBackend, OrderingFilter, FullTextSearchFilter]
     filterset_class = ItemFilter
     filterset_overrides = {
         "id": {
@@ -152,6 +163,23 @@ class ItemViewset(ModelViewSet):
     ]
     ordering = ["-id"]
     search_fields = ["name", "description"]
+    export_fields = [
+        "id",
+        "name",
+        "description",
+        "barcode",
+        "stock_code",
+        "category__name",
+        "stock_unit__name",
+        "kdv",
+        "buyprice",
+        "buycurrency",
+        "sellprice",
+        "sellcurrency",
+        "inactivated",
+        "created_at",
+        "updated_at",
+    ]
 
     @method_decorator(cache_page(1))
     @method_decorator(vary_on_cookie)
@@ -172,6 +200,7 @@ class ItemHistoryViewset(ItemViewset):
         "created_by", "updated_by", "category", "stock_unit"
     ).all()
     filter_backends = [OrderingFilter, SearchFilter]
+    pagination_class = KeysetPagination
     ordering_fields = [
         "id",
         "name",
@@ -185,6 +214,26 @@ class ItemHistoryViewset(ItemViewset):
     search_fields = ["name", "description"]
 
 
+class ItemLookupView(APIView):
+    """items of barcodes and stock codes for scanners, without the filters and
+    serializers of ItemViewset. ?code= can be repeated to look up many codes."""
+
+    # for DjangoModelPermissions
+    queryset = models.Item.objects.all()
+
+    @extend_schema(
+        parameters=[inventory_serializers.ItemCodeLookupQuerySerializer],
+        responses={200: inventory_serializers.ItemCodeLookupSerializer},
+    )
+    def get(self, request):
+        query = inventory_serializers.ItemCodeLookupQuerySerializer(
+            data=request.query_params
+        )
+        query.is_valid(raise_exception=True)
+        codes = list(dict.fromkeys(query.validated_data["code"]))
+        return Response({"results": lookup(codes)})
+
+
 class WarehouseViewset(ModelViewSet):
     filter_backends = [SearchFilter]
     queryset = models.Warehouse.objects.all()
@@ -193,14 +242,16 @@ class WarehouseViewset(ModelViewSet):
 
 
 class WarehouseItemStockViewset(ReadOnlyModelViewSet):
-    queryset = models.WarehouseItemStock.objects.all()
+    queryset = models.WarehouseItemStock.objects.select_related(
+        "item", "warehouse"
+    ).with_amounts()
     serializer_class = inventory_serializers.WarehouseItemStockInfoSerializer
     filter_backends = [SearchFilter, DjangoFilterBackend]
     search_fields = ["item__name"]
     # filterset_fields = ['warehouse', 'item']
 
 
-class StockMovementWithoutItemViewset(ModelViewSet):
+class StockMovementWithoutItemViewset(CSVExportMixin, ModelViewSet):
     queryset = models.StockMovement.objects.select_related(
         "invoice_item__invoice__stakeholder",
         "invoice_item__invoice__created_by",
@@ -208,6 +259,7 @@ class StockMovementWithoutItemViewset(ModelViewSet):
     ).all()
     serializer_class = invoice_serializers.StockMovementWithoutItemSerializer
     filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
+    pagination_class = KeysetPagination
     search_fields = ["warehouse_item_stock__item__name"]
     ordering_fields = [
         "id",
@@ -246,3 +298,14 @@ class StockMovementWithoutItemViewset(ModelViewSet):
             "exact": {"component": "item-select", "props": {"label": "item"}}
         },
     }
+    export_fields = [
+        "id",
+        "warehouse_item_stock__item__name",
+        "warehouse_item_stock__warehouse__name",
+        "amount",
+        "invoice_item__invoice__name",
+        ("invoice_item__invoice__stakeholder__name", _("Stakeholder")),
+        "invoice_item__price",
+        "created_at",
+        "updated_at",
+    ]
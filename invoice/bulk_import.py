@@ -0,0 +1,74 @@
+from itertools import islice
+from typing import Any, Iterable, Iterator
+
+from django.db import DatabaseError, transaction
+from rest_framework.exceptions import ValidationError
+
+from invoice.serializers import InvoiceDetailInSerializer
+
+
+def import_invoices(
+    records: Iterable[tuple[int, Any, str | None]],
+    context: dict,
+    chunk_size: int = 200,
+) -> Iterator[dict]:
+    """validates and saves InvoiceDetailInSerializer payloads chunk by chunk,
+    every chunk in its own transaction. records are what
+    utilities.parsers.iter_json_lines yields, a result is yielded for each of them."""
+    records = iter(records)
+    while chunk := list(islice(records, chunk_size)):
+        yield from import_chunk(chunk, context)
+
+
+def import_chunk(chunk: list[tuple[int, Any, str | None]], context: dict):
+    results = {}
+    valid = []
+    # one serializer validates the whole chunk like ListSerializer does,
+    # building the nested fields for every record would dominate the import.
+    serializer = InvoiceDetailInSerializer(many=True, context=context)
+    for line, record, error in chunk:
+        if error:
+            results[line] = failed(line, error)
+            continue
+        try:
+            validated_data = serializer.child.run_validation(record)
+        except ValidationError as e:
+            results[line] = failed(line, e.detail)
+        else:
+            valid.append((line, record, validated_data))
+
+    try:
+        invoices = serializer.create(
+            [validated_data for line, record, validated_data in valid]
+        )
+        for (line, record, validated_data), invoice in zip(valid, invoices):
+            results[line] = created(line, invoice)
+    except (DatabaseError, ValidationError):
+        # a single bad record rolls back the whole chunk,
+        # save them one by one to find out which one it was.
+        for line, record, validated_data in valid:
+            results[line] = import_one(line, record, context)
+
+    return [results[line] for line, record, error in chunk]
+
+
+def import_one(line: int, record: Any, context: dict) -> dict:
+    serializer = InvoiceDetailInSerializer(data=record, context=context)
+    try:
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            invoice = serializer.save()
+    except ValidationError as e:
+        return failed(line, e.detail)
+    except DatabaseError as e:
+        # integrity errors, out of range values
+        return failed(line, str(e))
+    return created(line, invoice)
+
+
+def created(line: int, invoice) -> dict:
+    return {"line": line, "status": "created", "id": invoice.id}
+
+
+def failed(line: int, errors) -> dict:
+    return {"line": line, "status": "failed", "errors": errors}
@@ -4,5 +4,6 @@ from invoice import bulkviews
 
 url_patterns = [
     path("invoice/", bulkviews.BulkInvoiceViews.as_view()),
+    path("invoice/import/", bulkviews.BulkInvoiceImportView.as_view()),
     path("invoice/conditions/", bulkviews.BulkInvoiceConditionsViews.as_view()),
 ]
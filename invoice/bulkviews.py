@@ -1,8 +1,12 @@
+from drf_spectacular.utils import extend_schema
 from rest_framework import generics
+from rest_framework.response import Response
 
 from invoice import models
 from invoice import serializers as invoice_serializers
+from invoice.bulk_import import import_invoices
 from utilities.bulkviewmixins import BulkDeleteMixin
+from utilities.parsers import JSONLinesParser
 
 
 class BulkInvoiceViews(BulkDeleteMixin, generics.GenericAPIView):
@@ -13,3 +17,32 @@ class BulkInvoiceViews(BulkDeleteMixin, generics.GenericAPIView):
 class BulkInvoiceConditionsViews(BulkDeleteMixin, generics.GenericAPIView):
     serializer_class = invoice_serializers.InvoiceConditionTemplateInSerializer
     queryset = models.InvoiceConditionTemplate.objects.all()
+
+
+class BulkInvoiceImportView(generics.GenericAPIView):
+    """imports invoices from a JSON Lines body,
+    one InvoiceDetailInSerializer payload per line."""
+
+    serializer_class = invoice_serializers.InvoiceDetailInSerializer
+    queryset = models.Invoice.objects.all()
+    parser_classes = [JSONLinesParser]
+    chunk_size = 200
+
+    @extend_schema(
+        request={
+            JSONLinesParser.media_type: invoice_serializers.InvoiceDetailInSerializer
+        },
+        responses={200: invoice_serializers.InvoiceImportReportSerializer},
+    )
+    def post(self, request, *args, **kwargs):
+        results = list(
+            import_invoices(
+                request.data,
+                self.get_serializer_context(),
+                chunk_size=self.chunk_size,
+            )
+        )
+        created = sum(result["status"] == "created" for result in results)
+        return Response(
+            {"created": created, "failed": len(results) - created, "results": results}
+        )
@@ -0,0 +1,50 @@
+"""cache of exchange rates by currency and date.
+
+a rate is looked up in a short lived in process cache, then in the shared cache,
+then in the database. loading rates changes the version in the keys of the
+shared cache, so the cached rates of every date become stale at once.
+"""
+import time
+from datetime import date
+from decimal import Decimal
+from typing import Callable
+
+from django.core.cache import cache
+
+CACHE_TIMEOUT = 60 * 60 * 24
+# other processes see newly loaded rates after this many seconds
+LOCAL_TIMEOUT = 60
+VERSION_KEY = "exchange_rates_version"
+
+_NOT_FOUND = object()
+# (currency, date) -> (expires at, rate)
+local_rates: dict[tuple[str, date], tuple[float, Decimal | None]] = {}
+
+
+def rate_cache_key(currency: str, on: date) -> str:
+    # not a counter, an evicted counter would start over and match old rates
+    version = cache.get_or_set(VERSION_KEY, time.time_ns, timeout=None)
+    return f"exchange_rate:{version}:{currency}:{on.isoformat()}"
+
+
+def get_cached_rate(
+    currency: str, on: date, get_rate: Callable[[], Decimal | None]
+) -> Decimal | None:
+    now = time.monotonic()
+    expires_at, rate = local_rates.get((currency, on), (0, None))
+    if expires_at > now:
+        return rate
+
+    key = rate_cache_key(currency, on)
+    rate = cache.get(key, _NOT_FOUND)
+    if rate is _NOT_FOUND:
+        rate = get_rate()
+        cache.set(key, rate, CACHE_TIMEOUT)
+    local_rates[(currency, on)] = (now + LOCAL_TIMEOUT, rate)
+    return rate
+
+
+def clear_rates_cache():
+    """makes cached rates stale after rates were written"""
+    cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+    local_rates.clear()
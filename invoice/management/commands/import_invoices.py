@@ -0,0 +1,60 @@
+import sys
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice.bulk_import import import_invoices
+from users.models import User
+from utilities.parsers import iter_json_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports invoices from a JSON Lines file, one invoice per line in the "
+        "shape the invoice endpoint accepts, and reports the failed lines."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="JSON Lines file, - reads from stdin.")
+        parser.add_argument(
+            "--user",
+            required=True,
+            help="Username the invoices are created by.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=200,
+            help="Invoices per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} doesn't exist.")
+        # serializers take the user from the request
+        context = {"request": SimpleNamespace(user=user)}
+
+        if options["path"] == "-":
+            self.import_file(sys.stdin.buffer, context, options)
+        else:
+            with open(options["path"], "rb") as file:
+                self.import_file(file, context, options)
+
+    def import_file(self, file, context, options):
+        created = failed = 0
+        for result in import_invoices(
+            iter_json_lines(file), context, chunk_size=options["chunk_size"]
+        ):
+            if result["status"] == "created":
+                created += 1
+                if options["verbosity"] >= 2:
+                    self.stdout.write(f"line {result['line']}: invoice {result['id']}")
+            else:
+                failed += 1
+                self.stderr.write(f"line {result['line']}: {result['errors']}")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"{created} invoices were imported, {failed} failed.")
+        )
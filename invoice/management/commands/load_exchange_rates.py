@@ -0,0 +1,62 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from invoice.models import ExchangeRate, Invoice, StakeholderRevenue
+from invoice.serializers import ExchangeRateSerializer
+from payments.models import Payment
+from utilities.parsers import iter_json_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads exchange rates to the base currency from a JSON Lines file, one "
+        '{"currency": "USD", "date": "2024-01-31", "rate": "30.5"} per line. '
+        "Existing rates of the same day are replaced, invoices and payments that "
+        "were missing a rate get their base currency totals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="JSON Lines file, - reads from stdin.")
+
+    def handle(self, *args, **options):
+        if options["path"] == "-":
+            rates = self.read_rates(sys.stdin.buffer)
+        else:
+            with open(options["path"], "rb") as file:
+                rates = self.read_rates(file)
+
+        with transaction.atomic():
+            loaded = ExchangeRate.objects.load(rates)
+            missing = Invoice.objects.filter(base_total__isnull=True)
+            stakeholder_ids = set(
+                missing.values_list("stakeholder_id", flat=True).distinct()
+            )
+            invoices = missing.fill_base_totals()
+            if invoices:
+                StakeholderRevenue.objects.rebuild(stakeholder_ids=stakeholder_ids)
+            payments = Payment.objects.fill_base_amounts()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{loaded} rates were loaded, base currency totals of {invoices} "
+                f"invoices and {payments} payments were filled."
+            )
+        )
+
+    def read_rates(self, file):
+        rates = []
+        errors = []
+        for line_number, record, error in iter_json_lines(file):
+            serializer = ExchangeRateSerializer(data=record)
+            if error is None and not serializer.is_valid():
+                error = serializer.errors
+            if error is not None:
+                errors.append(f"line {line_number}: {error}")
+                continue
+            data = serializer.validated_data
+            rates.append((data["currency"], data["date"], data["rate"]))
+        if errors:
+            raise CommandError("\n".join(errors))
+        return rates
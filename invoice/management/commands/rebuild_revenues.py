@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from invoice.models import StakeholderRevenue
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculates the monthly revenues of stakeholders (StakeholderRevenue) "
+        "from invoices."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stakeholder",
+            type=int,
+            action="append",
+            dest="stakeholders",
+            help="Only rebuild revenues of this stakeholder id, can be repeated.",
+        )
+
+    def handle(self, *args, **options):
+        rows = StakeholderRevenue.objects.rebuild(
+            stakeholder_ids=options["stakeholders"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"{rows} monthly revenues were created."))
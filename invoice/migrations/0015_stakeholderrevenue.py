@@ -0,0 +1,110 @@
+# Generated by Django 4.2 on 2026-10-18 10:54
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+import django.db.models.deletion
+
+
+def rebuild_stakeholder_revenues(apps, schema_editor):
+    Invoice = apps.get_model("invoice", "Invoice")
+    StakeholderRevenue = apps.get_model("invoice", "StakeholderRevenue")
+    total = Coalesce("total", Value(Decimal(0)))
+    sale = Q(invoice_type="sale")
+    refund = Q(invoice_type="refund-sale")
+    rows = [
+        StakeholderRevenue(**row)
+        for row in Invoice.objects.filter(sale | refund)
+        .annotate(month=TruncMonth("created_at", output_field=models.DateField()))
+        .values("stakeholder_id", "currency", "month")
+        .annotate(
+            sales=Coalesce(Sum(total, filter=sale), Value(Decimal(0))),
+            refunds=Coalesce(Sum(total, filter=refund), Value(Decimal(0))),
+            sale_count=Count("pk", filter=sale),
+            refund_count=Count("pk", filter=refund),
+        )
+        .order_by()
+    ]
+    StakeholderRevenue.objects.bulk_create(rows, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "stakeholder",
+            "0002_alter_stakeholder_address_alter_stakeholder_email_and_more",
+        ),
+        ("invoice", "0014_alter_invoice_created_at_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StakeholderRevenue",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "currency",
+                    models.CharField(
+                        choices=[
+                            ("TRY", "Turkish lira"),
+                            ("USD", "US dollars"),
+                            ("EUR", "Euro"),
+                            ("GBP", "Pound sterling"),
+                        ],
+                        max_length=4,
+                        verbose_name="Currency",
+                    ),
+                ),
+                ("month", models.DateField(verbose_name="Month")),
+                (
+                    "sales",
+                    models.DecimalField(
+                        decimal_places=4,
+                        default=Decimal("0"),
+                        max_digits=19,
+                        verbose_name="Sales",
+                    ),
+                ),
+                (
+                    "refunds",
+                    models.DecimalField(
+                        decimal_places=4,
+                        default=Decimal("0"),
+                        max_digits=19,
+                        verbose_name="Refunds",
+                    ),
+                ),
+                (
+                    "sale_count",
+                    models.IntegerField(default=0, verbose_name="Number of sales"),
+                ),
+                (
+                    "refund_count",
+                    models.IntegerField(default=0, verbose_name="Number of refunds"),
+                ),
+                (
+                    "stakeholder",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="revenues",
+                        to="stakeholder.stakeholder",
+                        verbose_name="Stakeholder",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("stakeholder", "currency", "month")},
+            },
+        ),
+        migrations.RunPython(rebuild_stakeholder_revenues, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,146 @@
+# Generated by Django 4.2 on 2026-10-18 11:05
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+
+
+def fill_base_totals_and_revenues(apps, schema_editor):
+    ExchangeRate = apps.get_model("invoice", "ExchangeRate")
+    Invoice = apps.get_model("invoice", "Invoice")
+    StakeholderRevenue = apps.get_model("invoice", "StakeholderRevenue")
+    rate = Coalesce(
+        "currency_exchange_rate",
+        Case(
+            When(currency=settings.BASE_CURRENCY, then=Value(Decimal(1))),
+            default=Subquery(
+                ExchangeRate.objects.filter(
+                    currency=OuterRef("currency"), date__lte=OuterRef("rate_date")
+                )
+                .order_by("-date")
+                .values("rate")[:1]
+            ),
+        ),
+    )
+    Invoice.objects.annotate(rate_date=TruncDate("created_at")).annotate(
+        rate=rate
+    ).filter(rate__isnull=False).update(
+        base_total=F("total") * rate,
+        base_total_with_tax=F("total_with_tax") * rate,
+    )
+
+    total = Coalesce("total", Value(Decimal(0)))
+    base_total = Coalesce("base_total", Value(Decimal(0)))
+    sale = Q(invoice_type="sale")
+    refund = Q(invoice_type="refund-sale")
+    rows = [
+        StakeholderRevenue(**row)
+        for row in Invoice.objects.filter(sale | refund)
+        .annotate(month=TruncMonth("created_at", output_field=models.DateField()))
+        .values("stakeholder_id", "currency", "month")
+        .annotate(
+            sales=Coalesce(Sum(total, filter=sale), Value(Decimal(0))),
+            refunds=Coalesce(Sum(total, filter=refund), Value(Decimal(0))),
+            base_sales=Coalesce(Sum(base_total, filter=sale), Value(Decimal(0))),
+            base_refunds=Coalesce(Sum(base_total, filter=refund), Value(Decimal(0))),
+            sale_count=Count("pk", filter=sale),
+            refund_count=Count("pk", filter=refund),
+        )
+        .order_by()
+    ]
+    StakeholderRevenue.objects.all().delete()
+    StakeholderRevenue.objects.bulk_create(rows, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invoice", "0015_stakeholderrevenue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExchangeRate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "currency",
+                    models.CharField(
+                        choices=[
+                            ("TRY", "Turkish lira"),
+                            ("USD", "US dollars"),
+                            ("EUR", "Euro"),
+                            ("GBP", "Pound sterling"),
+                        ],
+                        max_length=4,
+                        verbose_name="Currency",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Date")),
+                (
+                    "rate",
+                    models.DecimalField(
+                        decimal_places=4, max_digits=19, verbose_name="Rate"
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("currency", "date")},
+            },
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="base_total",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=4,
+                editable=False,
+                max_digits=19,
+                null=True,
+                verbose_name="Total without tax in the base currency",
+            ),
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="base_total_with_tax",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=4,
+                editable=False,
+                max_digits=19,
+                null=True,
+                verbose_name="Total with tax in the base currency",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stakeholderrevenue",
+            name="base_refunds",
+            field=models.DecimalField(
+                decimal_places=4,
+                default=Decimal("0"),
+                max_digits=19,
+                verbose_name="Refunds in the base currency",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stakeholderrevenue",
+            name="base_sales",
+            field=models.DecimalField(
+                decimal_places=4,
+                default=Decimal("0"),
+                max_digits=19,
+                verbose_name="Sales in the base currency",
+            ),
+        ),
+        migrations.RunPython(fill_base_totals_and_revenues, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 11:16
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invoice", "0016_exchangerate_invoice_base_total_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="invoice",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector("name", config="turkish"),
+                name="invoice_search_idx",
+            ),
+        ),
+    ]
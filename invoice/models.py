@@ -1,15 +1,24 @@
 import uuid
-from datetime import datetime, timedelta
+from collections import defaultdict
+from datetime import date, datetime, timedelta
 from decimal import Decimal
+from typing import Iterable
 
-from django.db import models
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.db import models, transaction
+from django.db.models import (Case, Count, F, OuterRef, Q, Subquery, Sum,
+                              Value, When)
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from inventory.models import StockMovement, Warehouse
+from invoice.exchange_rates import clear_rates_cache, get_cached_rate
 from stakeholder.models import Stakeholder
 from utilities.common_model_mixins import CreateUpdateInfo
 from utilities.enums import Currency, InvoiceType
+from utilities.search import search_vector
 
 
 class InvoiceConditionTemplate(CreateUpdateInfo):
@@ -22,11 +31,102 @@ class InvoiceConditionTemplate(CreateUpdateInfo):
     )
 
 
+class ExchangeRateQuerySet(models.QuerySet["ExchangeRate"]):
+    def get_rate(self, currency: str, on: date) -> Decimal | None:
+        """base currency of one unit of currency on the date, the latest rate
+        before the date if there is none for that day (weekends). cached"""
+        if currency == settings.BASE_CURRENCY:
+            return Decimal(1)
+        return get_cached_rate(
+            currency,
+            on,
+            lambda: self.filter(currency=currency, date__lte=on)
+            .order_by("-date")
+            .values_list("rate", flat=True)
+            .first(),
+        )
+
+    def rate_expression(self, currency: str, on: str) -> Case:
+        """get_rate as an expression, currency and on are the currency and date
+        fields (or annotations) of the rows"""
+        return Case(
+            When(**{currency: settings.BASE_CURRENCY}, then=Value(Decimal(1))),
+            default=Subquery(
+                self.filter(currency=OuterRef(currency), date__lte=OuterRef(on))
+                .order_by("-date")
+                .values("rate")[:1]
+            ),
+        )
+
+    def load(self, rates: Iterable[tuple[str, date, Decimal]]) -> int:
+        """inserts or replaces the (currency, date, rate) rates"""
+        rows = [
+            self.model(currency=currency, date=on, rate=rate)
+            for currency, on, rate in rates
+        ]
+        self.bulk_create(
+            rows,
+            batch_size=5000,
+            update_conflicts=True,
+            unique_fields=["currency", "date"],
+            update_fields=["rate"],
+        )
+        # now for this transaction, after the commit for the others
+        clear_rates_cache()
+        transaction.on_commit(clear_rates_cache)
+        return len(rows)
+
+
+class ExchangeRate(models.Model):
+    """value of a currency in the base currency (settings.BASE_CURRENCY) on a day,
+    loaded by the load_exchange_rates command"""
+
+    currency = models.CharField(_("Currency"), max_length=4, choices=Currency.choices)
+    date = models.DateField(_("Date"))
+    rate = models.DecimalField(_("Rate"), max_digits=19, decimal_places=4)
+
+    objects = ExchangeRateQuerySet.as_manager()
+
+    class Meta:
+        unique_together = [["currency", "date"]]
+
+
+def to_base_currency(amount: Decimal | None, rate: Decimal | None) -> Decimal | None:
+    if amount is None or rate is None:
+        return None
+    return (amount * rate).quantize(Decimal("0.0001"))
+
+
+# (stakeholder id, currency, month, sales, refunds, sales and refunds in the base
+# currency, sale count, refund count)
+RevenueEntry = tuple[int, str, date, Decimal, Decimal, Decimal, Decimal, int, int]
+
+
 def week_from_now():
     now = timezone.now()
     return now + timedelta(weeks=1)
 
 
+class InvoiceQuerySet(models.QuerySet["Invoice"]):
+    def fill_base_totals(self) -> int:
+        """sets the base currency totals that were missing a rate when the invoices
+        were saved, returns the number of invoices whose rate is known now"""
+        rate = Coalesce(
+            "currency_exchange_rate",
+            ExchangeRate.objects.rate_expression("currency", "rate_date"),
+        )
+        return (
+            self.filter(base_total__isnull=True)
+            .annotate(rate_date=TruncDate("created_at"))
+            .annotate(rate=rate)
+            .filter(rate__isnull=False)
+            .update(
+                base_total=F("total") * rate,
+                base_total_with_tax=F("total_with_tax") * rate,
+            )
+        )
+
+
 class Invoice(CreateUpdateInfo):
     invoice_type: InvoiceType = models.CharField(
         _("Invoice type"), max_length=20, choices=InvoiceType.choices
@@ -55,6 +155,23 @@ class Invoice(CreateUpdateInfo):
     total_with_tax: Decimal = models.DecimalField(
         _("Total with tax"), max_digits=19, decimal_places=4, null=True, blank=True
     )
+    # totals in settings.BASE_CURRENCY, null until the rate of the day is known
+    base_total: Decimal = models.DecimalField(
+        _("Total without tax in the base currency"),
+        max_digits=19,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    base_total_with_tax: Decimal = models.DecimalField(
+        _("Total with tax in the base currency"),
+        max_digits=19,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        editable=False,
+    )
 
     stakeholder: Stakeholder = models.ForeignKey(
         Stakeholder, verbose_name=_("Stakeholder"), on_delete=models.PROTECT
@@ -80,11 +197,217 @@ class Invoice(CreateUpdateInfo):
         symmetrical=False,
     )
 
+    objects = InvoiceQuerySet.as_manager()
+
     def __str__(self):
         return f"Fatura - {self.name[:40]} - {self.created_at}"
 
+    def set_base_totals(self):
+        """totals in the base currency, by the invoice's own rate if it has one"""
+        rate = self.currency_exchange_rate or ExchangeRate.objects.get_rate(
+            self.currency, timezone.localdate(self.created_at)
+        )
+        self.base_total = to_base_currency(self.total, rate)
+        self.base_total_with_tax = to_base_currency(self.total_with_tax, rate)
+
+    def revenue_entries(self, sign: int = 1) -> list[RevenueEntry]:
+        """what the invoice adds to the StakeholderRevenue of its month"""
+        if self.invoice_type not in (InvoiceType.sale, InvoiceType.refund_sale):
+            return []
+        total = (self.total or Decimal(0)) * sign
+        base_total = (self.base_total or Decimal(0)) * sign
+        key = (
+            self.stakeholder_id,
+            self.currency,
+            timezone.localdate(self.created_at).replace(day=1),
+        )
+        if self.invoice_type == InvoiceType.sale:
+            return [(*key, total, 0, base_total, 0, sign, 0)]
+        return [(*key, 0, total, 0, base_total, 0, sign)]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            entries = []
+            if self.pk is not None:
+                previous = (
+                    Invoice.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .only(
+                        "invoice_type",
+                        "stakeholder",
+                        "currency",
+                        "created_at",
+                        "total",
+                        "base_total",
+                    )
+                    .first()
+                )
+                if previous is not None:
+                    entries += previous.revenue_entries(sign=-1)
+            self.set_base_totals()
+            super().save(*args, **kwargs)
+            StakeholderRevenue.objects.apply_entries(entries + self.revenue_entries())
+
     class Meta:
         permissions = [("view_all_invoices", _("Can view all invoices"))]
+        indexes = [
+            # InvoiceViewset search_fields
+            GinIndex(search_vector("name"), name="invoice_search_idx"),
+        ]
+
+
+class StakeholderRevenueQuerySet(models.QuerySet["StakeholderRevenue"]):
+    # in the order of RevenueEntry
+    summed_fields = [
+        "sales",
+        "refunds",
+        "base_sales",
+        "base_refunds",
+        "sale_count",
+        "refund_count",
+    ]
+
+    def between(self, start: date | None = None, end: date | None = None):
+        """rows of the months that overlap start - end (both included)"""
+        queryset = self
+        if start is not None:
+            queryset = queryset.filter(month__gte=start.replace(day=1))
+        if end is not None:
+            queryset = queryset.filter(month__lte=end)
+        return queryset
+
+    def totals(self, *group_by: str) -> models.QuerySet:
+        """sales, refunds, net revenue (sales - refunds), the same in the base
+        currency and invoice counts grouped by the given fields"""
+        return (
+            self.values(*group_by)
+            .annotate(
+                # before sales and refunds, they would refer to the sums
+                revenue=Sum(F("sales") - F("refunds")),
+                base_revenue=Sum(F("base_sales") - F("base_refunds")),
+                sales=Sum("sales"),
+                refunds=Sum("refunds"),
+                base_sales=Sum("base_sales"),
+                base_refunds=Sum("base_refunds"),
+                sale_count=Sum("sale_count"),
+                refund_count=Sum("refund_count"),
+            )
+            .order_by(*group_by)
+        )
+
+    def apply_entries(self, entries: Iterable[RevenueEntry]):
+        """adds the entries to their month rows, the ones that cancel out are
+        skipped (an update that didn't change the total, type or date)"""
+        totals = defaultdict(lambda: [0] * len(self.summed_fields))
+        for stakeholder_id, currency, month, *values in entries:
+            total = totals[(stakeholder_id, currency, month)]
+            for index, value in enumerate(values):
+                total[index] += value
+        totals = {key: total for key, total in totals.items() if any(total)}
+        if not totals:
+            return
+
+        with transaction.atomic():
+            # the month rows of a stakeholder are created by one writer at a time
+            list(
+                Stakeholder.objects.select_for_update(no_key=True)
+                .filter(pk__in={key[0] for key in totals})
+                .values_list("pk", flat=True)
+            )
+            for (stakeholder_id, currency, month), total in sorted(totals.items()):
+                values = dict(zip(self.summed_fields, total))
+                updated = self.filter(
+                    stakeholder_id=stakeholder_id, currency=currency, month=month
+                ).update(
+                    **{
+                        field: F(field) + Value(value)
+                        for field, value in values.items()
+                    }
+                )
+                if not updated:
+                    self.create(
+                        stakeholder_id=stakeholder_id,
+                        currency=currency,
+                        month=month,
+                        **values,
+                    )
+
+    def rebuild(self, stakeholder_ids: Iterable[int] | None = None) -> int:
+        """recalculates the rows of the given stakeholders (all if None) from
+        invoices, returns the number of rows created."""
+        invoices = Invoice.objects.all()
+        if stakeholder_ids is not None:
+            invoices = invoices.filter(stakeholder_id__in=stakeholder_ids)
+        total = Coalesce("total", Value(Decimal(0)))
+        base_total = Coalesce("base_total", Value(Decimal(0)))
+        sale = Q(invoice_type=InvoiceType.sale)
+        refund = Q(invoice_type=InvoiceType.refund_sale)
+        rows = [
+            self.model(**row)
+            for row in invoices.filter(sale | refund)
+            .annotate(month=TruncMonth("created_at", output_field=models.DateField()))
+            .values("stakeholder_id", "currency", "month")
+            .annotate(
+                sales=Coalesce(Sum(total, filter=sale), Value(Decimal(0))),
+                refunds=Coalesce(Sum(total, filter=refund), Value(Decimal(0))),
+                base_sales=Coalesce(Sum(base_total, filter=sale), Value(Decimal(0))),
+                base_refunds=Coalesce(
+                    Sum(base_total, filter=refund), Value(Decimal(0))
+                ),
+                sale_count=Count("pk", filter=sale),
+                refund_count=Count("pk", filter=refund),
+            )
+            .order_by()
+        ]
+
+        with transaction.atomic():
+            existing = self.all()
+            if stakeholder_ids is not None:
+                existing = existing.filter(stakeholder_id__in=stakeholder_ids)
+            existing.delete()
+            self.bulk_create(rows, batch_size=5000)
+        return len(rows)
+
+
+class StakeholderRevenue(models.Model):
+    """sales and sale refunds of a stakeholder in a currency for a month.
+    kept up to date by Invoice writes, the rebuild_revenues command recalculates
+    it from scratch."""
+
+    stakeholder = models.ForeignKey(
+        Stakeholder,
+        verbose_name=_("Stakeholder"),
+        on_delete=models.CASCADE,
+        related_name="revenues",
+    )
+    currency = models.CharField(_("Currency"), max_length=4, choices=Currency.choices)
+    month = models.DateField(_("Month"))
+    sales = models.DecimalField(
+        _("Sales"), max_digits=19, decimal_places=4, default=Decimal(0)
+    )
+    refunds = models.DecimalField(
+        _("Refunds"), max_digits=19, decimal_places=4, default=Decimal(0)
+    )
+    # of the invoices whose base currency totals are known
+    base_sales = models.DecimalField(
+        _("Sales in the base currency"),
+        max_digits=19,
+        decimal_places=4,
+        default=Decimal(0),
+    )
+    base_refunds = models.DecimalField(
+        _("Refunds in the base currency"),
+        max_digits=19,
+        decimal_places=4,
+        default=Decimal(0),
+    )
+    sale_count = models.IntegerField(_("Number of sales"), default=0)
+    refund_count = models.IntegerField(_("Number of refunds"), default=0)
+
+    objects = StakeholderRevenueQuerySet.as_manager()
+
+    class Meta:
+        unique_together = [["stakeholder", "currency", "month"]]
 
 
 class InvoiceCondition(models.Model):
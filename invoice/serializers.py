@@ -1,12 +1,13 @@
 from decimal import Decimal
 from typing import OrderedDict
 
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import Manager
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from inventory.models import WarehouseItemStock
+from inventory.models import Item, WarehouseItemStock
 from inventory.serializers import (StockMovementNestedSerializer,
                                    WarehouseItemStockInfoSerializer,
                                    WarehouseSerializer)
@@ -19,50 +20,140 @@ from utilities.enums import InvoiceType
 from utilities.serializer_helpers import (CurrentUserCreatedBy,
                                           CurrentUserDefault)
 from utilities.serializers import DynamicFieldsModelSerializer, ModelSerializer
+from utilities.signals import bulk_saved
 
 
 class InvoiceItemListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        invoice_items = list(data.all() if isinstance(data, Manager) else data)
+        WarehouseItemStock.objects.fill_missing_amounts(
+            item.stock_movement.warehouse_item_stock for item in invoice_items
+        )
+        return super().to_representation(invoice_items)
+
+    @transaction.atomic
     def create(self, validated_data):
-        invoice_items = [self.child.create(vd) for vd in validated_data]
+        stock_movements = StockMovementNestedSerializer(many=True).create(
+            [vd.pop("stock_movement") for vd in validated_data]
+        )
+        invoice_items = [
+            models.InvoiceItem(**vd, stock_movement=stock_movement)
+            for vd, stock_movement in zip(validated_data, stock_movements)
+        ]
         try:
-            stock_movements = [item.stock_movement for item in invoice_items]
             models.StockMovement.objects.bulk_create(stock_movements)
-            fake_warehouse_item_stocks = [
-                WarehouseItemStock(id=sm.warehouse_item_stock_id, amount_db=None)
-                for sm in stock_movements
-            ]
-            WarehouseItemStock.objects.bulk_update(
-                fake_warehouse_item_stocks, ["amount_db"]
+            # bulk_create skips StockMovement.save, so deltas are applied here.
+            WarehouseItemStock.objects.apply_deltas(
+                (sm.warehouse_item_stock_id, sm.amount) for sm in stock_movements
             )
-            # warehouse_item_stock_cache_names = [
-            #     generate_cache_name(
-            #         WarehouseItemStock, "amount", sm.warehouse_item_stock_id
-            #     )
-            #     for sm in stock_movements
-            # ]
-            # cache.delete_many(warehouse_item_stock_cache_names)
             models.InvoiceItem.objects.bulk_create(invoice_items)
+            bulk_saved.send(sender=models.StockMovement)
 
         except IntegrityError as e:
             raise ValidationError(e)
 
+        self.mark_items_sold(invoice_items)
         return invoice_items
 
+    @transaction.atomic
     def update(self, invoice_items, validated_data):
-        invoice_items = [
-            self.child.update(ii, vd) for (vd, ii) in zip(validated_data, invoice_items)
-        ]
-        try:
-            stock_movements = [item.stock_movement for item in invoice_items]
-            warehouse_item_stocks = [sm.warehouse_item_stock for sm in stock_movements]
+        """writes only the lines whose amount, price, item or warehouse changed.
+        invoice_items are matched to validated_data by id."""
+        items_map = {invoice_item.id: invoice_item for invoice_item in invoice_items}
+        if {vd["id"] for vd in validated_data} - set(items_map):
+            raise ValidationError(
+                {"items": _("Invoice item doesn't exist.")}, code="does_not_exist"
+            )
+        lines = [(items_map[vd["id"]], vd) for vd in validated_data]
 
-            models.StockMovement.objects.bulk_update(
-                stock_movements, {"amount", "related_movement", "warehouse_item_stock"}
+        # stocks only need resolving for the lines that moved to another stock
+        stock_ids = {
+            ii.id: ii.stock_movement.warehouse_item_stock_id for ii, vd in lines
+        }
+        moved_lines = [
+            (ii, vd)
+            for ii, vd in lines
+            if self.stock_key(vd) != self.current_stock_key(ii)
+        ]
+        if moved_lines:
+            resolved_ids = StockMovementNestedSerializer(many=True).resolve_stock_ids(
+                [vd["stock_movement"]["warehouse_item_stock"] for ii, vd in moved_lines]
             )
-            WarehouseItemStock.objects.bulk_update(warehouse_item_stocks, {"amount_db"})
+            for (ii, vd), stock_id in zip(moved_lines, resolved_ids):
+                stock_ids[ii.id] = stock_id
+
+        deltas = []
+        changed_movements = []
+        changed_items = []
+        for ii, vd in lines:
+            stock_movement = ii.stock_movement
+            amount = vd["stock_movement"]["amount"]
+            stock_id = stock_ids[ii.id]
+            if (
+                stock_movement.amount != amount
+                or stock_movement.warehouse_item_stock_id != stock_id
+            ):
+                # take back what the movement contributed before the update
+                deltas.append(
+                    (stock_movement.warehouse_item_stock_id, -stock_movement.amount)
+                )
+                deltas.append((stock_id, amount))
+                stock_movement.amount = amount
+                stock_movement.warehouse_item_stock_id = stock_id
+                changed_movements.append(stock_movement)
+            if ii.price != vd.get("price", ii.price):
+                ii.price = vd["price"]
+                changed_items.append(ii)
+
+        try:
+            if changed_movements:
+                models.StockMovement.objects.bulk_update(
+                    changed_movements, ["amount", "warehouse_item_stock"]
+                )
+                WarehouseItemStock.objects.apply_deltas(deltas)
+                bulk_saved.send(sender=models.StockMovement)
+            if changed_items:
+                models.InvoiceItem.objects.bulk_update(changed_items, ["price"])
         except IntegrityError as e:
             raise ValidationError(e)
-        # return super().update(instance, validated_data)
+        self.mark_items_sold([ii for ii, vd in moved_lines])
+        return [ii for ii, vd in lines]
+
+    @staticmethod
+    def mark_items_sold(invoice_items: list[models.InvoiceItem]):
+        """moves last_sold_at of the items of sale invoice lines to the invoice date"""
+        sold_at = dict(
+            models.Invoice.objects.filter(
+                pk__in={ii.invoice_id for ii in invoice_items},
+                invoice_type=InvoiceType.sale,
+            ).values_list("pk", "created_at")
+        )
+        stocks_sold_at = {}
+        for ii in invoice_items:
+            if ii.invoice_id in sold_at:
+                stock_id = ii.stock_movement.warehouse_item_stock_id
+                at = sold_at[ii.invoice_id]
+                stocks_sold_at[stock_id] = max(stocks_sold_at.get(stock_id, at), at)
+        if not stocks_sold_at:
+            return
+        items_sold_at = {}
+        stock_items = WarehouseItemStock.objects.filter(
+            pk__in=stocks_sold_at
+        ).values_list("pk", "item_id")
+        for stock_id, item_id in stock_items:
+            at = stocks_sold_at[stock_id]
+            items_sold_at[item_id] = max(items_sold_at.get(item_id, at), at)
+        Item.objects.mark_sold(items_sold_at)
+
+    @staticmethod
+    def stock_key(validated_item: OrderedDict):
+        stock_data = validated_item["stock_movement"]["warehouse_item_stock"]
+        return (stock_data["item"].get("id"), stock_data["warehouse"].id)
+
+    @staticmethod
+    def current_stock_key(invoice_item: models.InvoiceItem):
+        stock = invoice_item.stock_movement.warehouse_item_stock
+        return (stock.item_id, stock.warehouse_id)
 
 
 class InvoiceItemSerializer(ModelSerializer):
@@ -129,6 +220,8 @@ class InvoiceListSerializer(ModelSerializer):
             "currency_exchange_rate",
             "total",
             "total_with_tax",
+            "base_total",
+            "base_total_with_tax",
             "stakeholder",
             "warehouse",
         ]
@@ -206,6 +299,64 @@ class InvoiceConditionInSerializer(ModelSerializer):
         fields = ["id", "invoice_condition_template", "invoice", "conditions"]
 
 
+class InvoiceDetailInListSerializer(serializers.ListSerializer):
+    @transaction.atomic
+    def create(self, validated_data):
+        """creates the invoices with a fixed number of queries,
+        their items are resolved and inserted together."""
+        invoices = []
+        conditions_data = []
+        items_data = []
+        for vd in validated_data:
+            vd = calculate_total(vd)
+            if vd.pop("related_invoice", None):
+                raise ValidationError(
+                    {"related_invoice": _("Related invoices can't be created in bulk.")}
+                )
+            conditions_data.append(vd.pop("invoice_condition", None))
+            items = vd.pop("items")
+            for item in items:
+                item["stock_movement"]["amount"] = self.child.signed_amount(
+                    item["stock_movement"]["amount"], vd["invoice_type"]
+                )
+                item["stock_movement"]["warehouse_item_stock"]["warehouse"] = vd[
+                    "warehouse"
+                ]
+            items_data.append(items)
+            invoice = models.Invoice(**vd)
+            invoice.set_base_totals()
+            invoices.append(invoice)
+
+        models.Invoice.objects.bulk_create(invoices)
+        # bulk_create skips Invoice.save
+        models.StakeholderRevenue.objects.apply_entries(
+            entry for invoice in invoices for entry in invoice.revenue_entries()
+        )
+        bulk_saved.send(sender=models.Invoice)
+        for invoice, items in zip(invoices, items_data):
+            for item in items:
+                item["invoice_id"] = invoice.id
+        InvoiceItemSerializer(many=True).create(
+            [item for items in items_data for item in items]
+        )
+
+        invoice_conditions = []
+        for invoice, condition in zip(invoices, conditions_data):
+            if not condition:
+                continue
+            condition.pop("invoice", None)
+            template = condition.pop("invoice_condition_template", None)
+            invoice_conditions.append(
+                models.InvoiceCondition(
+                    **condition,
+                    invoice=invoice,
+                    invoice_condition_template_id=template and template.get("id"),
+                )
+            )
+        models.InvoiceCondition.objects.bulk_create(invoice_conditions)
+        return invoices
+
+
 class InvoiceDetailInSerializer(DynamicFieldsModelSerializer):
     # TODO: items should have an order field and they should be ordered by that
     invoice_condition = InvoiceConditionInSerializer(required=False)
@@ -249,6 +400,7 @@ class InvoiceDetailInSerializer(DynamicFieldsModelSerializer):
         return invoice
 
     def update(self, invoice: models.Invoice, validated_data: OrderedDict):
+        was_sale = invoice.invoice_type == InvoiceType.sale
         validated_data = calculate_total(validated_data)
         items_data: list[OrderedDict] = validated_data.pop("items")
         warehouse = validated_data.get("warehouse")
@@ -259,25 +411,28 @@ class InvoiceDetailInSerializer(DynamicFieldsModelSerializer):
 
         updated_item_ids = []
 
-        if not hasattr(invoice, "invoice_condition"):
+        if invoice_condition is None:
+            pass
+        elif not hasattr(invoice, "invoice_condition"):
             validated_data["invoice_condition"] = InvoiceConditionInSerializer().create(
                 {**invoice_condition, "invoice_id": invoice.id}
             )
         else:
-            if invoice.invoice_condition.conditions != invoice_condition.get(
-                "conditions"
+            condition = invoice.invoice_condition
+            conditions = invoice_condition.get("conditions", condition.conditions)
+            template_id = (
+                invoice_condition.get("invoice_condition_template") or {}
+            ).get("id")
+            # only write the condition when it actually changed
+            if (condition.conditions, condition.invoice_condition_template_id) != (
+                conditions,
+                template_id,
             ):
-                invoice.invoice_condition.conditions = invoice_condition.get(
-                    "conditions"
+                condition.conditions = conditions
+                condition.invoice_condition_template_id = template_id
+                condition.save(
+                    update_fields=["conditions", "invoice_condition_template"]
                 )
-            if (
-                invoice.invoice_condition.invoice_condition_template
-                != invoice_condition.get("invoice_condition_template")
-            ):
-                invoice.invoice_condition.invoice_condition_template_id = (
-                    invoice_condition.get("invoice_condition_template").get("id")
-                )
-            invoice.invoice_condition.save()
 
         for item in items_data:
             item["invoice_id"] = invoice.id  # just in case there is a new item
@@ -292,10 +447,14 @@ class InvoiceDetailInSerializer(DynamicFieldsModelSerializer):
             else:
                 created_items.append(item)
 
-        items_to_delete = []
-        for existing_item in invoice.items.all():
-            if existing_item.id not in updated_item_ids:
-                items_to_delete.append(existing_item.id)
+        existing_items = list(
+            invoice.items.select_related("stock_movement__warehouse_item_stock")
+        )
+        items_to_delete = [
+            existing_item.id
+            for existing_item in existing_items
+            if existing_item.id not in updated_item_ids
+        ]
 
         if items_to_delete:
             invoice.items.filter(id__in=items_to_delete).delete()
@@ -305,14 +464,18 @@ class InvoiceDetailInSerializer(DynamicFieldsModelSerializer):
 
         if len(updated_items):
             InvoiceItemSerializer(many=True).update(
-                invoice.items.select_related(
-                    "stock_movement__warehouse_item_stock"
-                ).all(),
+                [ii for ii in existing_items if ii.id in updated_item_ids],
                 updated_items,
             )
 
         invoice.warehouse = warehouse
-        return super().update(invoice, validated_data)
+        invoice = super().update(invoice, validated_data)
+        if invoice.invoice_type == InvoiceType.sale and not was_sale:
+            # the lines were written while the invoice wasn't a sale yet
+            InvoiceItemListSerializer.mark_items_sold(
+                list(invoice.items.select_related("stock_movement"))
+            )
+        return invoice
 
         # all_items = instance.items.all()
 
@@ -348,10 +511,13 @@ class InvoiceDetailInSerializer(DynamicFieldsModelSerializer):
             "updated_by",
             "total",
             "total_with_tax",
+            "base_total",
+            "base_total_with_tax",
             "items",
             "related_invoice",
             "invoice_condition",
         ]
+        list_serializer_class = InvoiceDetailInListSerializer
 
 
 class InvoiceDetailOutSerializer(InvoiceDetailInSerializer):
@@ -389,3 +555,25 @@ class StockMovementWithoutItemSerializer(ModelSerializer):
     class Meta:
         model = models.StockMovement
         fields = ["id", "warehouse_item_stock", "amount", "invoice_item"]
+
+
+class ExchangeRateSerializer(ModelSerializer):
+    class Meta:
+        model = models.ExchangeRate
+        fields = ["currency", "date", "rate"]
+        extra_kwargs = {"rate": {"min_value": Decimal("0.0001")}}
+        # rates of a day that was loaded before replace it
+        validators = []
+
+
+class InvoiceImportResultSerializer(serializers.Serializer):
+    line = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=["created", "failed"])
+    id = serializers.IntegerField(required=False)
+    errors = serializers.JSONField(required=False)
+
+
+class InvoiceImportReportSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    results = InvoiceImportResultSerializer(many=True)
@@ -1,7 +1,7 @@
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
 
-from invoice.models import Invoice, InvoiceItem
+from invoice.models import Invoice, InvoiceItem, StakeholderRevenue
 
 
 @receiver(post_delete, sender=InvoiceItem)
@@ -9,3 +9,8 @@ def auto_delete_stock_movement_related_to_invoice_item(
     sender, instance: InvoiceItem, **kwargs
 ):
     instance.stock_movement.delete()
+
+
+@receiver(post_delete, sender=Invoice)
+def subtract_deleted_invoice_from_revenues(sender, instance: Invoice, **kwargs):
+    StakeholderRevenue.objects.apply_entries(instance.revenue_entries(sign=-1))
@@ -1,20 +1,35 @@
+from datetime import timedelta
 from decimal import Decimal
+from tempfile import NamedTemporaryFile
 from typing import OrderedDict
+from unittest import mock
 from uuid import uuid4
 
+import orjson
 from django.contrib.auth.models import AnonymousUser, Group, Permission
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DataError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.response import Response
 from rest_framework.test import APIClient, APIRequestFactory
 
 from inventory.models import Item, StockUnit, Warehouse, WarehouseItemStock
 from inventory.serializers import (ItemInSerializer, ItemOutSerializer,
                                    WarehouseSerializer)
+from invoice.exchange_rates import clear_rates_cache
+from invoice.models import ExchangeRate, Invoice, InvoiceItem, StakeholderRevenue
+from invoice.serializers import (InvoiceDetailInListSerializer,
+                                 InvoiceDetailInSerializer)
+from payments.models import Payment, PaymentAccount
 from stakeholder.models import Stakeholder, StakeholderRole
 from stakeholder.serializers import StakeholderSerializer
 from users.models import User
 from utilities.enums import Currency, InvoiceType
+from utilities.pagination import KeysetPagination
 
 
 def create_employee_group() -> Group:
@@ -89,6 +104,7 @@ class TestInvoice(TestCase):
         stakeholder: Stakeholder,
         warehouse: Warehouse,
         invoice_type: InvoiceType = InvoiceType.purchase,
+        currency: Currency = Currency.turkish_lira,
     ):
         url = reverse("invoice-list")
         inventory_items = [
@@ -112,6 +128,7 @@ class TestInvoice(TestCase):
             url,
             {
                 "invoice_type": invoice_type,
+                "currency": currency,
                 "name": uuid4(),
                 "stakeholder": stakeholder.id,
                 "warehouse": warehouse.id,
@@ -165,3 +182,482 @@ class TestInvoice(TestCase):
         # is warehouse item stock amount updated correctly?
         self.assertEqual(self.item1.stocks.first().amount, self.amounts[0])
         self.assertEqual(self.item2.stocks.first().amount, self.amounts[1])
+
+    def test_invoice_create_query_count_does_not_depend_on_line_count(self):
+        items = [
+            Item.objects.create(
+                name=f"bulk item {i}",
+                stock_unit=self.stock_unit,
+                kdv=18,
+                buyprice=Decimal("10"),
+                sellprice=Decimal("12"),
+            )
+            for i in range(6)
+        ]
+        # so that building the request data doesn't query for each item
+        items = list(
+            Item.objects.filter(id__in=[item.id for item in items])
+            .select_related("stock_unit", "category", "created_by", "updated_by")
+            .prefetch_related("stocks")
+            .order_by("id")
+        )
+
+        def count_queries(items: list[Item]):
+            # permissions are cached by the first request
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                res = TestInvoice.create_invoice(
+                    self.employee_client,
+                    items=items,
+                    amounts=[Decimal(1)] * len(items),
+                    stakeholder=self.stakeholder,
+                    warehouse=self.warehouse,
+                )
+            self.assertEqual(res.status_code, 201)
+            return len(queries)
+
+        self.assertEqual(count_queries(items[:1]), count_queries(items[1:]))
+        for item in items:
+            self.assertEqual(item.stocks.get().amount, Decimal(1))
+
+    def test_invoice_update_only_writes_changed_lines(self):
+        res = TestInvoice.create_invoice(
+            self.employee_client,
+            items=[self.item1, self.item2],
+            amounts=[Decimal(10), Decimal(20)],
+            stakeholder=self.stakeholder,
+            warehouse=self.warehouse,
+        )
+        self.assertEqual(res.status_code, 201)
+        invoice_id = res.data["id"]
+        invoice_items = InvoiceItem.objects.filter(invoice_id=invoice_id).order_by(
+            "id"
+        )
+
+        def update_invoice(amounts: list[Decimal]):
+            data = {
+                "invoice_type": InvoiceType.purchase,
+                "name": res.data["name"],
+                "stakeholder": self.stakeholder.id,
+                "warehouse": self.warehouse.id,
+                "items": [
+                    {
+                        "id": invoice_item.id,
+                        "stock_movement": {
+                            "warehouse_item_stock": {
+                                "item": ItemOutSerializer(item).data,
+                            },
+                            "amount": amount,
+                        },
+                        "price": invoice_item.price,
+                    }
+                    for invoice_item, item, amount in zip(
+                        invoice_items, [self.item1, self.item2], amounts
+                    )
+                ],
+            }
+            with CaptureQueriesContext(connection) as queries:
+                response = self.employee_client.put(
+                    reverse("invoice-detail", args=[invoice_id]), data, format="json"
+                )
+            self.assertEqual(response.status_code, 200, response.data)
+            return [q["sql"] for q in queries if q["sql"].startswith("UPDATE")]
+
+        line_tables = [
+            '"invoice_invoiceitem"',
+            '"inventory_stockmovement"',
+            '"inventory_warehouseitemstock"',
+        ]
+        updates = update_invoice([Decimal(10), Decimal(20)])
+        self.assertFalse(
+            [sql for sql in updates if any(table in sql for table in line_tables)]
+        )
+
+        update_invoice([Decimal(15), Decimal(20)])
+        self.assertEqual(self.item1.stocks.get().amount, Decimal(15))
+        self.assertEqual(self.item2.stocks.get().amount, Decimal(20))
+
+    def test_bulk_import_creates_valid_invoices_and_reports_failed_lines(self):
+        def invoice_record(name: str, amount: Decimal, warehouse: Warehouse | None):
+            return {
+                "invoice_type": InvoiceType.purchase,
+                "name": name,
+                "stakeholder": self.stakeholder.id,
+                "warehouse": warehouse and warehouse.id,
+                "items": [
+                    {
+                        "stock_movement": {
+                            "warehouse_item_stock": {
+                                "item": ItemOutSerializer(item).data,
+                            },
+                            "amount": amount,
+                        },
+                        "price": item.buyprice,
+                    }
+                    for item in [self.item1, self.item2]
+                ],
+            }
+
+        first, no_warehouse, second = (
+            orjson.dumps(record, default=str)
+            for record in [
+                invoice_record("first", Decimal(3), self.warehouse),
+                invoice_record("no warehouse", Decimal(3), None),
+                invoice_record("second", Decimal(4), self.warehouse),
+            ]
+        )
+        lines = [first, no_warehouse, b"{not json", b"", second]
+        res = self.employee_client.post(
+            "/invoice/bulk/invoice/import/",
+            b"\n".join(lines),
+            content_type="application/x-ndjson",
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["created"], 2)
+        self.assertEqual(res.data["failed"], 2)
+        self.assertEqual(
+            [(result["line"], result["status"]) for result in res.data["results"]],
+            [(1, "created"), (2, "failed"), (3, "failed"), (5, "created")],
+        )
+        self.assertIn("warehouse", res.data["results"][1]["errors"])
+        self.assertEqual(
+            set(Invoice.objects.values_list("name", flat=True)), {"first", "second"}
+        )
+        self.assertEqual(self.item1.stocks.get().amount, Decimal(7))
+        self.assertEqual(self.item2.stocks.get().amount, Decimal(7))
+
+        res = self.nonemployee_client.post(
+            "/invoice/bulk/invoice/import/",
+            lines[0],
+            content_type="application/x-ndjson",
+        )
+        self.assertEqual(res.status_code, 403)
+
+    def test_bulk_import_reports_database_errors_as_failed_lines(self):
+        records = [
+            {
+                "invoice_type": InvoiceType.purchase,
+                "name": name,
+                "stakeholder": self.stakeholder.id,
+                "warehouse": self.warehouse.id,
+                "items": [],
+            }
+            for name in ["first", "out of range"]
+        ]
+        create_one = InvoiceDetailInSerializer.create
+
+        def create(serializer, validated_data):
+            if validated_data["name"] == "out of range":
+                raise DataError("numeric field overflow")
+            return create_one(serializer, validated_data)
+
+        with (
+            mock.patch.object(
+                InvoiceDetailInListSerializer,
+                "create",
+                side_effect=DataError("numeric field overflow"),
+            ),
+            mock.patch.object(InvoiceDetailInSerializer, "create", create),
+        ):
+            res = self.employee_client.post(
+                "/invoice/bulk/invoice/import/",
+                b"\n".join(orjson.dumps(record) for record in records),
+                content_type="application/x-ndjson",
+            )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [(result["line"], result["status"]) for result in res.data["results"]],
+            [(1, "created"), (2, "failed")],
+        )
+        self.assertIn("numeric field overflow", res.data["results"][1]["errors"])
+        self.assertEqual(list(Invoice.objects.values_list("name", flat=True)), ["first"])
+
+    def test_invoice_list_keyset_pagination_follows_ordering(self):
+        totals = [Decimal(10), None, Decimal(5), Decimal(10), None, Decimal(20)]
+        for i, total in enumerate(totals):
+            Invoice.objects.create(
+                invoice_type=InvoiceType.purchase,
+                name=f"invoice {i}",
+                stakeholder=self.stakeholder,
+                warehouse=self.warehouse,
+                total_with_tax=total,
+            )
+        url = reverse("invoice-list")
+
+        for ordering in ["total_with_tax", "-total_with_tax"]:
+            expected = list(
+                Invoice.objects.order_by(
+                    ordering, ordering.replace("total_with_tax", "id")
+                ).values_list("id", flat=True)
+            )
+            res = self.employee_client.get(
+                url, {"ordering": ordering, "limit": 2, "cursor": ""}
+            )
+            self.assertIsNone(res.data["count"])
+            self.assertIsNone(res.data["previous"])
+            pages = [[invoice["id"] for invoice in res.data["results"]]]
+            while res.data["next"]:
+                res = self.employee_client.get(res.data["next"])
+                pages.append([invoice["id"] for invoice in res.data["results"]])
+            self.assertEqual([id for page in pages for id in page], expected)
+
+            # and back to the first page
+            for page in reversed(pages[:-1]):
+                res = self.employee_client.get(res.data["previous"])
+                self.assertEqual(
+                    [invoice["id"] for invoice in res.data["results"]], page
+                )
+            self.assertIsNone(res.data["previous"])
+
+        res = self.employee_client.get(url, {"cursor": "", "count": "true"})
+        self.assertEqual(res.data["count"], len(totals))
+        # limit/offset with a count unless a cursor is asked for
+        res = self.employee_client.get(url, {"limit": 2})
+        self.assertEqual(res.data["count"], len(totals))
+        self.assertIn("offset=2", res.data["next"])
+        res = self.employee_client.get(url, {"offset": 5})
+        self.assertEqual(res.data["count"], len(totals))
+        res = self.employee_client.get(url, {"cursor": "not a cursor"})
+        self.assertEqual(res.status_code, 404)
+
+    def test_invoice_search_ranks_words_and_matches_identifiers(self):
+        for name in ["elma elma elma", "elma armut", "FTR-2024-0012", "FTR-2024-0013"]:
+            Invoice.objects.create(
+                invoice_type=InvoiceType.purchase,
+                name=name,
+                stakeholder=self.stakeholder,
+                warehouse=self.warehouse,
+            )
+        url = reverse("invoice-list")
+
+        def search(**params):
+            res = self.employee_client.get(url, params)
+            self.assertEqual(res.status_code, 200)
+            return [invoice["name"] for invoice in res.data["results"]]
+
+        self.assertEqual(search(search="elma"), ["elma elma elma", "elma armut"])
+        # the ranking can't be put in a cursor
+        self.assertEqual(
+            search(search="elma", cursor=""), ["elma elma elma", "elma armut"]
+        )
+        self.assertEqual(
+            search(search="elma", ordering="id"), ["elma elma elma", "elma armut"]
+        )
+        self.assertEqual(search(search="FTR-2024-0012"), ["FTR-2024-0012"])
+        self.assertEqual(search(search="0013"), ["FTR-2024-0013"])
+        self.assertEqual(search(search="ftr 2024-0012"), ["FTR-2024-0012"])
+
+    def test_invoice_list_estimates_big_counts(self):
+        for i in range(7):
+            Invoice.objects.create(
+                invoice_type=InvoiceType.purchase,
+                name=f"invoice {i}",
+                stakeholder=self.stakeholder,
+                warehouse=self.warehouse,
+            )
+        url = reverse("invoice-list")
+        cache.clear()
+
+        res = self.employee_client.get(url, {"offset": 0, "limit": 3})
+        self.assertEqual(res.data["count"], 7)
+        self.assertTrue(res.data["count_exact"])
+
+        with mock.patch.object(KeysetPagination, "exact_count_threshold", 0):
+            res = self.employee_client.get(url, {"offset": 0, "limit": 3})
+            self.assertFalse(res.data["count_exact"])
+            estimate = res.data["count"]
+            ids = [invoice["id"] for invoice in res.data["results"]]
+            # next links don't depend on the estimate
+            while res.data["next"]:
+                res = self.employee_client.get(res.data["next"])
+                self.assertEqual(res.data["count"], estimate)
+                ids += [invoice["id"] for invoice in res.data["results"]]
+            self.assertEqual(len(set(ids)), 7)
+        cache.clear()
+
+        # the estimates of filtered lists aren't used, they are counted up to the
+        # threshold
+        with (
+            mock.patch.object(KeysetPagination, "exact_count_threshold", 5),
+            mock.patch.object(KeysetPagination, "estimate_count", return_value=12000),
+        ):
+            res = self.employee_client.get(url, {"search": "6"})
+            self.assertEqual((res.data["count"], res.data["count_exact"]), (1, True))
+            res = self.employee_client.get(url, {"search": "invoice"})
+            self.assertEqual((res.data["count"], res.data["count_exact"]), (6, False))
+            res = self.employee_client.get(url)
+            self.assertEqual(
+                (res.data["count"], res.data["count_exact"]), (12000, False)
+            )
+        cache.clear()
+
+    def test_sale_invoices_mark_items_sold(self):
+        TestInvoice.create_invoice(
+            self.employee_client,
+            items=[self.item1, self.item2],
+            amounts=[Decimal(10), Decimal(20)],
+            stakeholder=self.stakeholder,
+            warehouse=self.warehouse,
+        )
+        res = TestInvoice.create_invoice(
+            self.employee_client,
+            items=[self.item1],
+            amounts=[Decimal(4)],
+            stakeholder=self.stakeholder,
+            warehouse=self.warehouse,
+            invoice_type=InvoiceType.sale,
+        )
+        self.assertEqual(res.status_code, 201)
+        sold_at = Invoice.objects.get(id=res.data["id"]).created_at
+
+        self.item1.refresh_from_db()
+        self.item2.refresh_from_db()
+        self.assertEqual(self.item1.last_sold_at, sold_at)
+        self.assertEqual(self.item1.total_stock, Decimal(6))
+        self.assertIsNone(self.item2.last_sold_at)
+        self.assertEqual(self.item2.total_stock, Decimal(20))
+
+        leftovers = Item.objects.leftovers(
+            not_sold_since=sold_at, created_before=timezone.now()
+        )
+        self.assertEqual(list(leftovers), [self.item2])
+
+    def test_invoices_changed_to_sales_mark_items_sold(self):
+        res = TestInvoice.create_invoice(
+            self.employee_client,
+            items=[self.item1],
+            amounts=[Decimal(4)],
+            stakeholder=self.stakeholder,
+            warehouse=self.warehouse,
+        )
+        self.assertEqual(res.status_code, 201)
+        invoice = Invoice.objects.get(id=res.data["id"])
+        self.item1.refresh_from_db()
+        self.assertIsNone(self.item1.last_sold_at)
+
+        (invoice_item,) = invoice.items.all()
+        data = {
+            "invoice_type": InvoiceType.sale,
+            "name": invoice.name,
+            "stakeholder": self.stakeholder.id,
+            "warehouse": self.warehouse.id,
+            "items": [
+                {
+                    "id": invoice_item.id,
+                    "stock_movement": {
+                        "warehouse_item_stock": {
+                            "item": ItemOutSerializer(self.item1).data,
+                        },
+                        "amount": Decimal(4),
+                    },
+                    "price": invoice_item.price,
+                }
+            ],
+        }
+        res = self.employee_client.put(
+            reverse("invoice-detail", args=[invoice.id]), data, format="json"
+        )
+        self.assertEqual(res.status_code, 200, res.data)
+        self.item1.refresh_from_db()
+        self.assertEqual(self.item1.last_sold_at, invoice.created_at)
+        self.assertEqual(self.item1.total_stock, Decimal(-4))
+
+    def test_sales_and_refunds_are_rolled_up_per_stakeholder(self):
+        TestInvoice.create_invoice(
+            self.employee_client,
+            items=[self.item1],
+            amounts=[Decimal(10)],
+            stakeholder=self.stakeholder,
+            warehouse=self.warehouse,
+        )
+        invoice_ids = []
+        for invoice_type, amount in [
+            (InvoiceType.sale, Decimal(4)),
+            (InvoiceType.refund_sale, Decimal(1)),
+        ]:
+            res = TestInvoice.create_invoice(
+                self.employee_client,
+                items=[self.item1],
+                amounts=[amount],
+                stakeholder=self.stakeholder,
+                warehouse=self.warehouse,
+                invoice_type=invoice_type,
+            )
+            self.assertEqual(res.status_code, 201)
+            invoice_ids.append(res.data["id"])
+
+        url = reverse("stakeholder-statistics", args=[self.stakeholder.id])
+        res = self.employee_client.get(url)
+        self.assertEqual(res.status_code, 200)
+        (totals,) = res.data["totals"]
+        self.assertEqual(totals["currency"], Currency.turkish_lira)
+        self.assertEqual(Decimal(totals["sales"]), Decimal(600))
+        self.assertEqual(Decimal(totals["refunds"]), Decimal(150))
+        self.assertEqual(Decimal(totals["revenue"]), Decimal(450))
+        self.assertEqual((totals["sale_count"], totals["refund_count"]), (1, 1))
+        (month,) = res.data["months"]
+        this_month = timezone.localdate().replace(day=1)
+        self.assertEqual(month["month"], this_month.isoformat())
+
+        res = self.employee_client.get(url, {"end": "2000-01-01"})
+        self.assertEqual(res.data["totals"], [])
+
+        refund_id = invoice_ids[1]
+        res = self.employee_client.delete(reverse("invoice-detail", args=[refund_id]))
+        self.assertEqual(res.status_code, 204)
+        rollup = list(StakeholderRevenue.objects.values_list("sales", "refunds"))
+        self.assertEqual(rollup, [(Decimal(600), Decimal(0))])
+        StakeholderRevenue.objects.rebuild()
+        rebuilt = list(StakeholderRevenue.objects.values_list("sales", "refunds"))
+        self.assertEqual(rebuilt, rollup)
+
+    def test_totals_are_converted_to_the_base_currency(self):
+        def sell_in_dollars(amount: Decimal) -> Invoice:
+            res = TestInvoice.create_invoice(
+                self.employee_client,
+                items=[self.item1],
+                amounts=[amount],
+                stakeholder=self.stakeholder,
+                warehouse=self.warehouse,
+                invoice_type=InvoiceType.sale,
+                currency=Currency.dollar,
+            )
+            self.assertEqual(res.status_code, 201)
+            return Invoice.objects.get(id=res.data["id"])
+
+        # rates are cached in the process, the rolled back ones too
+        self.addCleanup(clear_rates_cache)
+        # there is no rate yet
+        first = sell_in_dollars(Decimal(2))
+        self.assertEqual(first.total, Decimal(300))
+        self.assertIsNone(first.base_total)
+
+        yesterday = timezone.localdate() - timedelta(days=1)
+        with NamedTemporaryFile("w", suffix=".jsonl") as file:
+            file.write(
+                orjson.dumps(
+                    {"currency": "USD", "date": yesterday, "rate": "30.5"}
+                ).decode()
+            )
+            file.flush()
+            call_command("load_exchange_rates", file.name, stdout=mock.Mock())
+
+        first.refresh_from_db()
+        self.assertEqual(first.base_total, Decimal("9150"))
+        self.assertEqual(first.base_total_with_tax, Decimal("10797"))
+        # yesterday's rate is the latest one
+        self.assertEqual(ExchangeRate.objects.get_rate("USD", yesterday), Decimal("30.5"))
+        second = sell_in_dollars(Decimal(1))
+        self.assertEqual(second.base_total, Decimal("4575"))
+        self.assertEqual(
+            StakeholderRevenue.objects.values_list("sales", "base_sales").get(),
+            (Decimal(450), Decimal("13725")),
+        )
+
+        account = PaymentAccount.objects.create(name="Dollar account")
+        payment = Payment.objects.create(
+            payer=account, receiver=account, amount=Decimal(10), currency="USD"
+        )
+        self.assertEqual(payment.base_amount, Decimal(305))
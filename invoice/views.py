@@ -3,12 +3,16 @@ from django.utils.translation import gettext_lazy as _
 from rest_framework.viewsets import ModelViewSet
 
 from invoice import models, serializers
-from utilities.filters import DjangoFilterBackend, OrderingFilter, SearchFilter
+from utilities.exportviewmixins import CSVExportMixin
+from utilities.filters import (DjangoFilterBackend, FullTextSearchFilter,
+                               OrderingFilter, SearchFilter)
+from utilities.pagination import KeysetPagination
 
 
-class InvoiceViewset(ModelViewSet):
+class InvoiceViewset(CSVExportMixin, ModelViewSet):
     queryset = models.Invoice.objects.all()
-    filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
+    filter_backends = [DjangoFilterBackend, OrderingFilter, FullTextSearchFilter]
+    pagination_class = KeysetPagination
     ordering_fields = [
         "id",
         "name",
@@ -51,6 +55,25 @@ class InvoiceViewset(ModelViewSet):
     }
     serializer_class = serializers.InvoiceListSerializer
     search_fields = ["name"]
+    # invoice numbers
+    search_identifier_fields = ["name"]
+    export_fields = [
+        "id",
+        "invoice_type",
+        "name",
+        ("stakeholder__name", _("Stakeholder")),
+        "warehouse__name",
+        "currency",
+        "currency_exchange_rate",
+        "total",
+        "total_with_tax",
+        "base_total",
+        "base_total_with_tax",
+        "last_payment_date",
+        ("created_by__username", _("Created by")),
+        "created_at",
+        "updated_at",
+    ]
 
     def get_queryset(self):
         if self.action == "retrieve":
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from payments.models import DailyBalance
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculates the daily balances of payment accounts (DailyBalance) "
+        "from payments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--account",
+            type=int,
+            action="append",
+            dest="accounts",
+            help="Only rebuild balances of this payment account id, can be repeated.",
+        )
+
+    def handle(self, *args, **options):
+        rows = DailyBalance.objects.rebuild(account_ids=options["accounts"])
+        self.stdout.write(self.style.SUCCESS(f"{rows} daily balances were created."))
@@ -0,0 +1,119 @@
+# Generated by Django 4.2 on 2026-10-18 10:35
+
+from collections import defaultdict
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import Coalesce, TruncDate
+import django.db.models.deletion
+
+
+def rebuild_daily_balances(apps, schema_editor):
+    Payment = apps.get_model("payments", "Payment")
+    DailyBalance = apps.get_model("payments", "DailyBalance")
+    payments = Payment.objects.annotate(
+        ledger_date=Coalesce("due_date", TruncDate("created_at"))
+    ).order_by()
+    totals = defaultdict(lambda: [Decimal(0), Decimal(0)])
+    for index, side in enumerate(["receiver_id", "payer_id"]):
+        for account_id, currency, date, amount in payments.values_list(
+            side, "currency", "ledger_date"
+        ).annotate(Sum("amount")):
+            totals[(account_id, currency, date)][index] += amount
+
+    balances = defaultdict(Decimal)
+    rows = []
+    for (account_id, currency, date), (cash_in, cash_out) in sorted(totals.items()):
+        balances[(account_id, currency)] += cash_in - cash_out
+        rows.append(
+            DailyBalance(
+                account_id=account_id,
+                currency=currency,
+                date=date,
+                cash_in=cash_in,
+                cash_out=cash_out,
+                balance=balances[(account_id, currency)],
+            )
+        )
+    DailyBalance.objects.bulk_create(rows, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "payments",
+            "0010_alter_invoicepayment_payment_alter_payment_due_date_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyBalance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "currency",
+                    models.CharField(
+                        choices=[
+                            ("TRY", "Turkish lira"),
+                            ("USD", "US dollars"),
+                            ("EUR", "Euro"),
+                            ("GBP", "Pound sterling"),
+                        ],
+                        max_length=4,
+                        verbose_name="Currency",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Date")),
+                (
+                    "cash_in",
+                    models.DecimalField(
+                        decimal_places=4,
+                        default=Decimal("0"),
+                        max_digits=19,
+                        verbose_name="Cash in",
+                    ),
+                ),
+                (
+                    "cash_out",
+                    models.DecimalField(
+                        decimal_places=4,
+                        default=Decimal("0"),
+                        max_digits=19,
+                        verbose_name="Cash out",
+                    ),
+                ),
+                (
+                    "balance",
+                    models.DecimalField(
+                        decimal_places=4,
+                        default=Decimal("0"),
+                        max_digits=19,
+                        verbose_name="Balance",
+                    ),
+                ),
+                (
+                    "account",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_balances",
+                        to="payments.paymentaccount",
+                        verbose_name="Payment account",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("account", "currency", "date")},
+            },
+        ),
+        migrations.RunPython(rebuild_daily_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2 on 2026-10-18 11:05
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def fill_base_amounts(apps, schema_editor):
+    ExchangeRate = apps.get_model("invoice", "ExchangeRate")
+    Payment = apps.get_model("payments", "Payment")
+    rate = Case(
+        When(currency=settings.BASE_CURRENCY, then=Value(Decimal(1))),
+        default=Subquery(
+            ExchangeRate.objects.filter(
+                currency=OuterRef("currency"), date__lte=OuterRef("rate_date")
+            )
+            .order_by("-date")
+            .values("rate")[:1]
+        ),
+    )
+    Payment.objects.annotate(
+        rate_date=Coalesce("due_date", TruncDate("created_at"))
+    ).annotate(rate=rate).filter(rate__isnull=False).update(
+        base_amount=F("amount") * rate
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invoice", "0016_exchangerate_invoice_base_total_and_more"),
+        ("payments", "0011_dailybalance"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="base_amount",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=4,
+                editable=False,
+                max_digits=19,
+                null=True,
+                verbose_name="Amount in the base currency",
+            ),
+        ),
+        migrations.RunPython(fill_base_amounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-18 11:16
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0012_payment_base_amount"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="paymentaccount",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector(
+                    "name", "iban", "account_number", config="turkish"
+                ),
+                name="paymentaccount_search_idx",
+            ),
+        ),
+    ]
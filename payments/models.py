@@ -1,11 +1,20 @@
-from django.db import models
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from typing import Iterable
+
+from django.contrib.postgres.indexes import GinIndex
+from django.db import models, transaction
+from django.db.models import Case, DateField, F, Func, Sum, Value, When, Window
+from django.db.models.functions import Coalesce, Trunc, TruncDate
 from django.utils.translation import gettext_lazy as _
 from django_filters.utils import timezone
 
-from invoice.models import Invoice
+from invoice.models import ExchangeRate, Invoice, to_base_currency
 from stakeholder.models import Stakeholder
 from utilities.common_model_mixins import CreateUpdateInfo, InactivatedMixin
 from utilities.enums import Currency
+from utilities.search import search_vector
 
 
 class Bank(CreateUpdateInfo, InactivatedMixin["Bank"]):
@@ -38,6 +47,13 @@ class PaymentAccount(CreateUpdateInfo, InactivatedMixin["PaymentAccount"]):
 
     class Meta:
         unique_together = [["name", "stakeholder"]]
+        indexes = [
+            # PaymentViewset search_fields of the payer and the receiver
+            GinIndex(
+                search_vector("name", "iban", "account_number"),
+                name="paymentaccount_search_idx",
+            ),
+        ]
 
 
 class PaymentType(models.TextChoices):
@@ -45,16 +61,43 @@ class PaymentType(models.TextChoices):
     cheque = "cheque"
 
 
+# (account id, currency, date, cash in, cash out)
+LedgerEntry = tuple[int, str, datetime.date, Decimal, Decimal]
+
+
 def today():
     return timezone.now().date()
 
 
+class PaymentQuerySet(models.QuerySet["Payment"]):
+    def fill_base_amounts(self) -> int:
+        """sets the base currency amounts that were missing a rate when the payments
+        were saved, returns the number of payments whose rate is known now"""
+        rate = ExchangeRate.objects.rate_expression("currency", "rate_date")
+        return (
+            self.filter(base_amount__isnull=True)
+            .annotate(rate_date=Coalesce("due_date", TruncDate("created_at")))
+            .annotate(rate=rate)
+            .filter(rate__isnull=False)
+            .update(base_amount=F("amount") * rate)
+        )
+
+
 class Payment(CreateUpdateInfo):
     amount = models.DecimalField(
         _("Amount"),
         max_digits=19,
         decimal_places=4,
     )
+    # amount in settings.BASE_CURRENCY, null until the rate of the day is known
+    base_amount = models.DecimalField(
+        _("Amount in the base currency"),
+        max_digits=19,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        editable=False,
+    )
     currency = models.CharField(
         _("Currency"),
         max_length=4,
@@ -83,6 +126,178 @@ class Payment(CreateUpdateInfo):
     due_date = models.DateField(_("Due date"), null=True, blank=True, default=today)
     payment_done = models.BooleanField(_("Payment is concluded"), default=False)
 
+    objects = PaymentQuerySet.as_manager()
+
+    @property
+    def ledger_date(self):
+        """the day of the payment in DailyBalance"""
+        return self.due_date or timezone.localdate(self.created_at)
+
+    def ledger_entries(self, sign: int = 1) -> list[LedgerEntry]:
+        amount = self.amount * sign
+        return [
+            (self.receiver_id, self.currency, self.ledger_date, amount, Decimal(0)),
+            (self.payer_id, self.currency, self.ledger_date, Decimal(0), amount),
+        ]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            entries = []
+            if self.pk is not None:
+                previous = (
+                    Payment.objects.select_for_update().filter(pk=self.pk).first()
+                )
+                if previous is not None:
+                    entries += previous.ledger_entries(sign=-1)
+            rate = ExchangeRate.objects.get_rate(self.currency, self.ledger_date)
+            self.base_amount = to_base_currency(self.amount, rate)
+            super().save(*args, **kwargs)
+            DailyBalance.objects.apply_entries(entries + self.ledger_entries())
+
+
+class RunningSum(Func):
+    """SUM as a window function, unlike Sum it can sum an aggregate"""
+
+    function = "SUM"
+    window_compatible = True
+
+
+class DailyBalanceQuerySet(models.QuerySet["DailyBalance"]):
+    def period_totals(self, kind: str) -> models.QuerySet:
+        """cash in - cash out (change) of each account and currency per period
+        (date_trunc kind: day, week, month) and the sum of the changes up to and
+        including the period (running_change), in a single GROUP BY query."""
+        change = Sum(F("cash_in") - F("cash_out"))
+        return (
+            self.annotate(period=Trunc("date", kind, output_field=DateField()))
+            .values("account_id", "currency", "period")
+            .annotate(change=change)
+            .annotate(
+                running_change=Window(
+                    RunningSum(F("change")),
+                    partition_by=[F("account_id"), F("currency")],
+                    order_by=F("period").asc(),
+                )
+            )
+            .order_by("account_id", "currency", "period")
+        )
+
+    def apply_entries(self, entries: Iterable[LedgerEntry]):
+        """adds the entries to the day rows and to the running balances after them.
+        entries of the same day are merged, the ones that cancel out are skipped."""
+        totals = defaultdict(lambda: [Decimal(0), Decimal(0)])
+        for account_id, currency, date, cash_in, cash_out in entries:
+            total = totals[(account_id, currency, date)]
+            total[0] += cash_in
+            total[1] += cash_out
+        totals = {key: total for key, total in totals.items() if any(total)}
+        if not totals:
+            return
+
+        with transaction.atomic():
+            # one writer per account at a time, running balances depend on each other
+            list(
+                PaymentAccount.objects.select_for_update(no_key=True)
+                .filter(pk__in={key[0] for key in totals})
+                .values_list("pk", flat=True)
+            )
+            for (account_id, currency, date), (cash_in, cash_out) in sorted(
+                totals.items()
+            ):
+                rows = self.filter(account_id=account_id, currency=currency)
+                if not rows.filter(date=date).exists():
+                    previous_balance = (
+                        rows.filter(date__lt=date)
+                        .order_by("-date")
+                        .values_list("balance", flat=True)
+                        .first()
+                    )
+                    self.create(
+                        account_id=account_id,
+                        currency=currency,
+                        date=date,
+                        balance=previous_balance or Decimal(0),
+                    )
+                rows.filter(date__gte=date).update(
+                    cash_in=Case(
+                        When(date=date, then=F("cash_in") + Value(cash_in)),
+                        default=F("cash_in"),
+                    ),
+                    cash_out=Case(
+                        When(date=date, then=F("cash_out") + Value(cash_out)),
+                        default=F("cash_out"),
+                    ),
+                    balance=F("balance") + Value(cash_in - cash_out),
+                )
+
+    def rebuild(self, account_ids: Iterable[int] | None = None) -> int:
+        """recalculates the rows of the given accounts (all if None) from payments,
+        returns the number of rows created."""
+        payments = Payment.objects.annotate(
+            ledger_date=Coalesce("due_date", TruncDate("created_at"))
+        ).order_by()
+        totals = defaultdict(lambda: [Decimal(0), Decimal(0)])
+        for index, side in enumerate(["receiver_id", "payer_id"]):
+            side_payments = payments
+            if account_ids is not None:
+                side_payments = payments.filter(**{f"{side}__in": account_ids})
+            for account_id, currency, date, amount in side_payments.values_list(
+                side, "currency", "ledger_date"
+            ).annotate(Sum("amount")):
+                totals[(account_id, currency, date)][index] += amount
+
+        balances = defaultdict(Decimal)
+        rows = []
+        for (account_id, currency, date), (cash_in, cash_out) in sorted(totals.items()):
+            balances[(account_id, currency)] += cash_in - cash_out
+            rows.append(
+                self.model(
+                    account_id=account_id,
+                    currency=currency,
+                    date=date,
+                    cash_in=cash_in,
+                    cash_out=cash_out,
+                    balance=balances[(account_id, currency)],
+                )
+            )
+
+        with transaction.atomic():
+            existing = self.all()
+            if account_ids is not None:
+                existing = existing.filter(account_id__in=account_ids)
+            existing.delete()
+            self.bulk_create(rows, batch_size=5000)
+        return len(rows)
+
+
+class DailyBalance(models.Model):
+    """cash in and out of a payment account in a currency for a day, and the running
+    balance at the end of that day. kept up to date by Payment writes,
+    the rebuild_balances command recalculates it from scratch."""
+
+    account = models.ForeignKey(
+        PaymentAccount,
+        verbose_name=_("Payment account"),
+        on_delete=models.CASCADE,
+        related_name="daily_balances",
+    )
+    currency = models.CharField(_("Currency"), max_length=4, choices=Currency.choices)
+    date = models.DateField(_("Date"))
+    cash_in = models.DecimalField(
+        _("Cash in"), max_digits=19, decimal_places=4, default=Decimal(0)
+    )
+    cash_out = models.DecimalField(
+        _("Cash out"), max_digits=19, decimal_places=4, default=Decimal(0)
+    )
+    balance = models.DecimalField(
+        _("Balance"), max_digits=19, decimal_places=4, default=Decimal(0)
+    )
+
+    objects = DailyBalanceQuerySet.as_manager()
+
+    class Meta:
+        unique_together = [["account", "currency", "date"]]
+
 
 class InvoicePayment(models.Model):
     payment = models.OneToOneField(
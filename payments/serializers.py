@@ -114,6 +114,7 @@ class PaymentSerializer(ModelSerializer):
             "receiver",
             "amount",
             "currency",
+            "base_amount",
             "additional_info",
             "due_date",
             "payment_type",
@@ -139,6 +140,7 @@ class PaymentOutSerializer(ModelSerializer):
             "receiver",
             "amount",
             "currency",
+            "base_amount",
             "additional_info",
             "due_date",
             "payment_type",
@@ -1,9 +1,14 @@
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
 
-from payments.models import InvoicePayment
+from payments.models import DailyBalance, InvoicePayment, Payment
 
 
 @receiver(post_delete, sender=InvoicePayment)
 def delete_payment_of_invoice_payment(sender, instance: InvoicePayment, **kwargs):
     instance.payment.delete()
+
+
+@receiver(post_delete, sender=Payment)
+def subtract_deleted_payment_from_balances(sender, instance: Payment, **kwargs):
+    DailyBalance.objects.apply_entries(instance.ledger_entries(sign=-1))
@@ -1,16 +1,27 @@
+from datetime import timedelta
 from decimal import Decimal
 from uuid import uuid4
 
 from django.contrib.auth.models import AnonymousUser, Group, Permission
 from django.test import TestCase
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.response import Response
 from rest_framework.test import APIClient
 
+from dashboard.enums import WidgetsEnum
+from dashboard.models import SubscribedWidget
+from dashboard.widgets import Balance, BalanceGraph
 from inventory.models import Item, StockUnit, Warehouse
 from invoice.models import Invoice
 from invoice.tests.test_views import TestInvoice
-from payments.models import Bank, PaymentAccount, PaymentType
+from payments.models import (
+    Bank,
+    DailyBalance,
+    Payment,
+    PaymentAccount,
+    PaymentType,
+)
 from payments.serializers import PaymentSerializer
 from stakeholder.models import Stakeholder, StakeholderRole
 from users.models import User
@@ -179,3 +190,106 @@ class TestInvoiceCreation(TestCase):
 
         self.assertGreater(payments_count_after, payments_count_before)
         self.assertEquals(res.status_code, 201)
+
+    def test_payments_keep_daily_balances_up_to_date(self):
+        def ledger():
+            return list(
+                DailyBalance.objects.order_by(
+                    "account", "currency", "date"
+                ).values_list(
+                    "account", "currency", "date", "cash_in", "cash_out", "balance"
+                )
+            )
+
+        today = timezone.localdate()
+        payments = [
+            Payment.objects.create(
+                payer=self.stakeholder_paymentaccount,
+                receiver=self.paymentaccount,
+                amount=Decimal(amount),
+                due_date=today + timedelta(days=days),
+            )
+            for amount, days in [("100", 0), ("40", -2), ("25", 3)]
+        ]
+        Payment.objects.create(
+            payer=self.paymentaccount,
+            receiver=self.stakeholder_paymentaccount,
+            amount=Decimal("30"),
+            due_date=today - timedelta(days=1),
+        )
+        payments[0].amount = Decimal("80")
+        payments[0].save()
+        payments[2].due_date = today - timedelta(days=5)
+        payments[2].save()
+        payments[1].delete()
+
+        balances = {
+            date: balance
+            for account, currency, date, cash_in, cash_out, balance in ledger()
+            if account == self.paymentaccount.id
+        }
+        self.assertEqual(balances[today - timedelta(days=5)], Decimal("25"))
+        self.assertEqual(balances[today - timedelta(days=2)], Decimal("25"))
+        self.assertEqual(balances[today - timedelta(days=1)], Decimal("-5"))
+        self.assertEqual(balances[today], Decimal("75"))
+        self.assertEqual(balances[today + timedelta(days=3)], Decimal("75"))
+
+        maintained = [row for row in ledger() if row[3] or row[4]]
+        DailyBalance.objects.rebuild()
+        self.assertEqual(maintained, ledger())
+
+        balance = Balance(None).get_queryset().get(id=self.paymentaccount.id).balance
+        self.assertEqual(balance, Decimal("75"))
+
+    def test_balance_graph_sums_payments_per_period(self):
+        today = timezone.localdate()
+        monday = today - timedelta(days=today.weekday())
+        for amount, days in [("100", -30), ("40", 0), ("25", 1), ("10", 7)]:
+            Payment.objects.create(
+                payer=self.stakeholder_paymentaccount,
+                receiver=self.paymentaccount,
+                amount=Decimal(amount),
+                due_date=monday + timedelta(days=days),
+            )
+        widget = BalanceGraph(
+            SubscribedWidget(
+                user=self.user,
+                widget_name=WidgetsEnum.balange_graph,
+                user_settings={"scale": "weeks", "length": 4},
+            )
+        )
+        accounts = list(widget.get_queryset())
+        data = widget.serialized_data(accounts)
+        account_data = next(row for row in data if row["id"] == self.paymentaccount.id)
+
+        self.assertEqual(Decimal(account_data["balance_before"]), Decimal("100"))
+        balances = [
+            (row["range"][0], Decimal(row["balance"]), Decimal(row["running_balance"]))
+            for row in account_data["balances"]
+        ]
+        self.assertEqual(
+            balances,
+            [
+                (monday - timedelta(days=14), Decimal(0), Decimal("100")),
+                (monday - timedelta(days=7), Decimal(0), Decimal("100")),
+                (monday, Decimal("65"), Decimal("165")),
+                (monday + timedelta(days=7), Decimal("10"), Decimal("175")),
+            ],
+        )
+
+    def test_payments_are_searched_by_their_accounts(self):
+        other_account = PaymentAccount.objects.create(name="Other account")
+        paid = Payment.objects.create(
+            payer=self.stakeholder_paymentaccount,
+            receiver=self.paymentaccount,
+            amount=Decimal(10),
+        )
+        Payment.objects.create(
+            payer=self.paymentaccount, receiver=other_account, amount=Decimal(5)
+        )
+        url = reverse("payments-list")
+        for search in ["customer", "1234"]:
+            res = self.employee_client.get(url, {"search": search})
+            self.assertEqual(
+                [payment["id"] for payment in res.data["results"]], [paid.id]
+            )
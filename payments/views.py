@@ -2,7 +2,8 @@ from django.utils.translation import gettext_lazy as _
 from rest_framework.viewsets import ModelViewSet
 
 from payments import models, serializers
-from utilities.filters import DjangoFilterBackend, OrderingFilter, SearchFilter
+from utilities.filters import (DjangoFilterBackend, FullTextSearchFilter,
+                               OrderingFilter, SearchFilter)
 
 
 class BankViewset(ModelViewSet):
@@ -106,7 +107,7 @@ class PaymentAccountViewset(ModelViewSet):
 class PaymentViewset(ModelViewSet):
     queryset = models.Payment.objects.all()
     serializer_class = serializers.PaymentOutSerializer
-    filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
+    filter_backends = [DjangoFilterBackend, OrderingFilter, FullTextSearchFilter]
     ordering_fields = [
         "id",
         "amount",
@@ -179,11 +180,18 @@ class PaymentViewset(ModelViewSet):
         "payer__name",
         "payer__stakeholder__name",
         "payer__iban",
-        "payer__account_number" "receiver__name",
+        "payer__account_number",
+        "receiver__name",
         "receiver__stakeholder__name",
         "receiver__iban",
         "receiver__account_number",
     ]
+    search_identifier_fields = [
+        "payer__iban",
+        "payer__account_number",
+        "receiver__iban",
+        "receiver__account_number",
+    ]
 
 
 class InvoicePaymentViewset(ModelViewSet):
@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 11:16
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "stakeholder",
+            "0002_alter_stakeholder_address_alter_stakeholder_email_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="stakeholder",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector(
+                    "name", "phone", "email", "vkntckn", config="turkish"
+                ),
+                name="stakeholder_search_idx",
+            ),
+        ),
+    ]
@@ -1,8 +1,11 @@
 from typing import TypeVar
 
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from utilities.search import search_vector
+
 
 class StakeholderRole(models.TextChoices):
     supplier = "Satıcı"
@@ -56,6 +59,16 @@ class Stakeholder(models.Model):
     customer = CustomerManager["Stakeholder"]()
     supplier = SupplierManager["Stakeholder"]()
 
+    class Meta:
+        indexes = [
+            # StakeholderViewset search_fields, PaymentViewset searches the
+            # stakeholders of the accounts with it too (indexed_fields)
+            GinIndex(
+                search_vector("name", "phone", "email", "vkntckn"),
+                name="stakeholder_search_idx",
+            ),
+        ]
+
 
 class StakeholderEmployee(models.Model):
     stakeholder: Stakeholder = models.ForeignKey(
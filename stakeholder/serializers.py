@@ -1,5 +1,9 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+
 from payments.models import Bank, PaymentAccount
 from stakeholder import models
+from utilities.enums import Currency
 from utilities.serializers import ModelSerializer
 
 
@@ -66,3 +70,30 @@ class StakeholderBasicSerializer(ModelSerializer):
             "vkntckn",
             "address",
         ]
+
+
+class StakeholderStatisticsQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False, help_text=_("First month"))
+    end = serializers.DateField(required=False, help_text=_("Last month"))
+
+
+class StakeholderRevenueTotalSerializer(serializers.Serializer):
+    currency = serializers.ChoiceField(choices=Currency.choices)
+    sales = serializers.DecimalField(max_digits=19, decimal_places=4)
+    refunds = serializers.DecimalField(max_digits=19, decimal_places=4)
+    revenue = serializers.DecimalField(max_digits=19, decimal_places=4)
+    base_sales = serializers.DecimalField(max_digits=19, decimal_places=4)
+    base_refunds = serializers.DecimalField(max_digits=19, decimal_places=4)
+    base_revenue = serializers.DecimalField(max_digits=19, decimal_places=4)
+    sale_count = serializers.IntegerField()
+    refund_count = serializers.IntegerField()
+
+
+class StakeholderMonthlyRevenueSerializer(StakeholderRevenueTotalSerializer):
+    month = serializers.DateField()
+
+
+class StakeholderStatisticsSerializer(serializers.Serializer):
+    base_currency = serializers.ChoiceField(choices=Currency.choices)
+    totals = StakeholderRevenueTotalSerializer(many=True)
+    months = StakeholderMonthlyRevenueSerializer(many=True)
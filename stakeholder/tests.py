@@ -1,3 +1,44 @@
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from stakeholder.models import Stakeholder, StakeholderRole
+from users.models import User
+
+
+class TestStakeholderSearch(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser(username="stakeholder_admin")
+        )
+        for name, email, phone, vkntckn in [
+            ("Ali Veli", "ali@example.com", "05551234567", "1234567890"),
+            ("Ayşe Fatma", "ayse@example.org", "02121112233", "9876543210"),
+        ]:
+            Stakeholder.objects.create(
+                role=StakeholderRole.customer,
+                name=name,
+                shortname=name,
+                email=email,
+                phone=phone,
+                vkntckn=vkntckn,
+            )
+
+    def test_stakeholders_are_searched_by_words_and_identifiers(self):
+        for search, names in [
+            ("veli", ["Ali Veli"]),
+            ("ali@example.com", ["Ali Veli"]),
+            ("555", ["Ali Veli"]),
+            ("05551234567", ["Ali Veli"]),
+            ("98765", ["Ayşe Fatma"]),
+            ("ayşe 0212", ["Ayşe Fatma"]),
+            ("ali 0212", []),
+        ]:
+            res = self.client.get(reverse("stakeholder-list"), {"search": search})
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(
+                [stakeholder["name"] for stakeholder in res.data["results"]],
+                names,
+                search,
+            )
@@ -1,8 +1,14 @@
+from django.conf import settings
+from drf_spectacular.utils import extend_schema
 from rest_framework import filters
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
+from invoice.models import StakeholderRevenue
 from stakeholder import models, serializers
-from utilities.filters import DjangoFilterBackend, OrderingFilter, SearchFilter
+from utilities.filters import (DjangoFilterBackend, FullTextSearchFilter,
+                               OrderingFilter)
 
 
 class StakeholderEmployeeViewset(ModelViewSet):
@@ -16,13 +22,14 @@ class StakeholderEmployeeViewset(ModelViewSet):
 class StakeholderViewset(ModelViewSet):
     queryset = models.Stakeholder.objects.all()
     serializer_class = serializers.StakeholderSerializer
-    filter_backends = [SearchFilter, DjangoFilterBackend]
+    filter_backends = [FullTextSearchFilter, DjangoFilterBackend]
     search_fields = [
         "name",
         "phone",
         "email",
         "vkntckn",
     ]
+    search_identifier_fields = ["phone", "email", "vkntckn"]
     filterset_fields = {
         "role": {"in": {"component": "hidden", "props": {}}},
         "shortname": {
@@ -52,3 +59,28 @@ class StakeholderViewset(ModelViewSet):
             )
             return queryset
         return super().get_queryset()
+
+    @extend_schema(
+        parameters=[serializers.StakeholderStatisticsQuerySerializer],
+        responses={200: serializers.StakeholderStatisticsSerializer},
+    )
+    @action(detail=True, methods=["get"])
+    def statistics(self, request, pk=None):
+        """sales, refunds and net revenue of the stakeholder per currency, in total
+        and per month, between the start and end months (all time by default)"""
+        stakeholder = self.get_object()
+        query = serializers.StakeholderStatisticsQuerySerializer(
+            data=request.query_params
+        )
+        query.is_valid(raise_exception=True)
+        revenues = StakeholderRevenue.objects.filter(stakeholder=stakeholder).between(
+            query.validated_data.get("start"), query.validated_data.get("end")
+        )
+        serializer = serializers.StakeholderStatisticsSerializer(
+            {
+                "base_currency": settings.BASE_CURRENCY,
+                "totals": revenues.totals("currency"),
+                "months": revenues.totals("month", "currency"),
+            }
+        )
+        return Response(serializer.data)
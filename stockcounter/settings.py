@@ -60,7 +60,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    # "utilities.middleware.LogMiddleware",
+    "utilities.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
@@ -129,6 +129,8 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 AUTH_USER_MODEL = "users.User"
+# permission sets of users are cached (users.backends)
+AUTHENTICATION_BACKENDS = ["users.backends.CachedModelBackend"]
 LOGIN_URL = "/admin/login/"
 
 # Internationalization
@@ -139,6 +141,9 @@ LANGUAGE_CODE = "tr-tr"
 
 TIME_ZONE = "Europe/Istanbul"
 
+# currency of the normalized totals (Invoice.base_total, Payment.base_amount)
+BASE_CURRENCY = "TRY"
+
 USE_I18N = True
 
 USE_L10N = True
@@ -216,6 +221,11 @@ REST_KNOX = {
     "AUTH_HEADER_PREFIX": "Bearer",
     #   'AUTO_REFRESH': True,
 }
+# expired tokens and tokens over TOKEN_LIMIT_PER_USER are deleted by the
+# sweep_tokens command, run it periodically (cron). to sweep from a background
+# thread of the web processes instead (users.token_sweeper), set this to the
+# seconds between sweeps, e.g. 60 * 60
+TOKEN_SWEEP_INTERVAL = None
 
 
 CACHES = {
@@ -223,11 +233,17 @@ CACHES = {
     #     "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
     # }
     "default": {
-        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        # counts cache hits and misses of requests
+        "BACKEND": "utilities.instrumentation.InstrumentedRedisCache",
         "LOCATION": f"redis://default:{os.environ['REDIS_PASSWORD']}@{os.environ['REDIS_HOST']}:6379",
     }
 }
 
+# requests that run more SQL queries are logged as warnings, None disables it
+REQUEST_QUERY_BUDGET = 50
+# bearer token of the /metrics/ endpoint, staff users can read it without one
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
 
 LOGGING = {
     "version": 1,
@@ -254,6 +270,12 @@ LOGGING = {
             "level": "WARNING",
             "handlers": ["file"],
         },
+        # warnings for requests over the query budget, INSTRUMENTATION_LOG_LEVEL=INFO
+        # adds a JSON line for every request
+        "instrumentation": {
+            "level": os.environ.get("INSTRUMENTATION_LOG_LEVEL", "WARNING"),
+            "handlers": ["console"],
+        },
         # "django.db.backends": {
         #     "level": "DEBUG",
         #     "handlers": ["console"],
@@ -29,6 +29,7 @@ from payments.urls import urlpatterns as payments_urls
 from stakeholder.urls import urlpatterns as stakeholder_urls
 from users.urls import urlpatterns as users_urls
 from dashboard.urls import urlpatterns as dashboard_urls
+from utilities.views import metrics
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -43,6 +44,8 @@ urlpatterns = [
         include(dashboard_urls),
         name="dashboard",
     ),
+    # monitoring
+    path("metrics/", metrics, name="metrics"),
     # auth
     # schema
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
@@ -1,4 +1,6 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
 
 
 class UsersConfig(AppConfig):
@@ -7,3 +9,8 @@ class UsersConfig(AppConfig):
 
     def ready(self):
         from users import knox_extensions as _
+        from users import signals  # noqa: F401
+        from users.token_sweeper import start_sweeper
+
+        if settings.TOKEN_SWEEP_INTERVAL:
+            request_started.connect(start_sweeper, dispatch_uid="token_sweeper")
@@ -18,6 +18,8 @@ from knox.settings import CONSTANTS, knox_settings
 from knox.signals import token_expired
 from rest_framework import exceptions
 
+from users import token_cache
+
 
 class TokenCookieAuthentication(TokenAuthentication):
     def authenticate(self, request: HttpRequest):
@@ -32,19 +34,28 @@ class TokenCookieAuthentication(TokenAuthentication):
         Due to the random nature of hashing a value, this must inspect
         each auth_token individually to find the correct one.
 
-        Tokens that have expired will be deleted and skipped
+        Verified tokens are cached by their digest (users.token_cache), so
+        most requests don't query them.
         """
         msg = _("Invalid token.")
         token = token.decode("utf-8")
+        try:
+            digest = hash_token(token)
+        except (TypeError, binascii.Error):
+            raise exceptions.AuthenticationFailed(msg)
+        # refreshed tokens are written on every request anyway
+        if not knox_settings.AUTO_REFRESH:
+            auth_token = token_cache.get_auth_token(digest)
+            if auth_token is not None:
+                return self.validate_user(auth_token)
+
         for auth_token in AuthToken.objects.select_related("user").filter(
             token_key=token[: CONSTANTS.TOKEN_KEY_LENGTH]
         ):
-            try:
-                digest = hash_token(token)
-            except (TypeError, binascii.Error):
-                raise exceptions.AuthenticationFailed(msg)
             if compare_digest(digest, auth_token.digest):
                 if knox_settings.AUTO_REFRESH and auth_token.expiry:
                     self.renew_token(auth_token)
-                return self.validate_user(auth_token)
+                user, auth_token = self.validate_user(auth_token)
+                token_cache.cache_auth_token(auth_token)
+                return user, auth_token
         raise exceptions.AuthenticationFailed(msg)
@@ -0,0 +1,52 @@
+"""ModelBackend with the permission sets of users in the shared cache.
+
+the sets are cached under a versioned key per user. changes of a user's groups
+or permissions remove their entry, changes of a group's permissions (which can
+affect any user) change the version, so the entries of every user become stale
+at once.
+"""
+import time
+
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+CACHE_TIMEOUT = 60 * 60
+VERSION_KEY = "permissions_version"
+
+
+def permissions_cache_key(user_id: int) -> str:
+    # not a counter, an evicted counter would start over and match old sets
+    version = cache.get_or_set(VERSION_KEY, time.time_ns, timeout=None)
+    return f"permissions:{version}:{user_id}"
+
+
+def forget_user_permissions(user_id: int):
+    def delete():
+        cache.delete(permissions_cache_key(user_id))
+
+    delete()
+    # a request reading the permissions before the commit could cache them again
+    transaction.on_commit(delete)
+
+
+def forget_all_permissions():
+    def change_version():
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+    change_version()
+    transaction.on_commit(change_version)
+
+
+class CachedModelBackend(ModelBackend):
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, "_perm_cache"):
+            key = permissions_cache_key(user_obj.pk)
+            permissions = cache.get(key)
+            if permissions is None:
+                permissions = super().get_all_permissions(user_obj)
+                cache.set(key, permissions, CACHE_TIMEOUT)
+            user_obj._perm_cache = permissions
+        return user_obj._perm_cache
@@ -1,8 +1,6 @@
 from django.contrib.auth import login
 from django.contrib.auth.signals import user_logged_in, user_logged_out
-from django.db.models import Q, QuerySet
 from django.http import HttpRequest
-from django.utils import timezone
 from knox.auth import TokenAuthentication
 from knox.models import AuthToken
 from knox.settings import knox_settings
@@ -20,6 +18,7 @@ from users.knox_serializers import (
     LogoutSerializer,
 )
 from users.serializers import UserSerializer
+from users.token_sweeper import sweep_user_tokens
 
 
 class LoginView(KnoxLoginView):
@@ -33,21 +32,14 @@ class LoginView(KnoxLoginView):
 
     def post(self, request: HttpRequest, format=None):
         serializer = LoginSerializer(data=request.data)
-        token_limit_per_user = self.get_token_limit_per_user()
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data["user"]
         # login(request, user)
-        if token_limit_per_user is not None:
-            now = timezone.now()
-            token: QuerySet[AuthToken] = user.auth_token_set.filter(
-                Q(expiry__gt=now) | Q(expiry__isnull=True)
-            )
-            if token.count() >= token_limit_per_user:
-                # delete the oldest valid token for the sake of the new token
-                oldest_valid_token = token.order_by("created").first()
-                oldest_valid_token.delete()
         token_ttl = self.get_token_ttl()
         _, token = AuthToken.objects.create(user, token_ttl)
+        # expired tokens of the user and its oldest ones over TOKEN_LIMIT_PER_USER,
+        # the tokens of users that don't log in are left to sweep_tokens
+        sweep_user_tokens(user, self.get_token_limit_per_user())
         user_logged_in.send(sender=user.__class__, request=request, user=user)
         res = Response(serializer.data)
         max_age = 1000000 if serializer.data["remember_me"] else None
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from users.token_sweeper import sweep_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes expired auth tokens and the oldest tokens of users that have "
+        "more than TOKEN_LIMIT_PER_USER."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--token-limit",
+            type=int,
+            help="Tokens to keep per user, REST_KNOX TOKEN_LIMIT_PER_USER by default.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Tokens per DELETE statement.",
+        )
+
+    def handle(self, *args, **options):
+        expired, over_limit = sweep_tokens(
+            token_limit=options["token_limit"], batch_size=options["batch_size"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{expired} expired tokens and {over_limit} tokens over the limit "
+                "were deleted."
+            )
+        )
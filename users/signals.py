@@ -0,0 +1,44 @@
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from knox.models import AuthToken
+
+from users import token_cache
+from users.backends import forget_all_permissions, forget_user_permissions
+from users.models import User
+
+
+@receiver(post_delete, sender=AuthToken)
+def forget_deleted_token(sender, instance: AuthToken, **kwargs):
+    token_cache.forget_token(instance.digest)
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_changed_user(sender, instance: User, **kwargs):
+    token_cache.forget_user(instance.pk)
+    # is_active and is_superuser
+    forget_user_permissions(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def forget_permissions_of_changed_user(sender, instance, action: str, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if isinstance(instance, User):
+        forget_user_permissions(instance.pk)
+    else:
+        # group.user_set or permission.user_set, clear() doesn't tell the users
+        forget_all_permissions()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def forget_permissions_of_changed_group(sender, action: str, **kwargs):
+    if action.startswith("post_"):
+        forget_all_permissions()
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def forget_permissions_of_deleted_rows(sender, **kwargs):
+    forget_all_permissions()
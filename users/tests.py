@@ -1,4 +1,18 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from knox.models import AuthToken
+from knox.settings import knox_settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from users import token_cache
+from users.authentication import TokenCookieAuthentication
 from users.models import User
 
 
@@ -10,3 +24,114 @@ class TestAppModels(TestCase):
 
     def test_user_created(self):
         self.assertIsNotNone(self.user)
+
+
+class TestTokenAuthentication(TestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.local_cache.clear()
+        self.addCleanup(token_cache.local_cache.clear)
+        self.user = User.objects.create_user(username="tokenuser")
+        self.auth_token, self.token = AuthToken.objects.create(self.user, None)
+
+    def authenticate(self):
+        authentication = TokenCookieAuthentication()
+        return authentication.authenticate_credentials(self.token.encode())
+
+    def test_verified_tokens_are_cached_until_logout(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(), (self.user, self.auth_token))
+        with self.assertNumQueries(0):
+            user, auth_token = self.authenticate()
+            self.assertEqual(user, self.user)
+            self.assertEqual(auth_token, self.auth_token)
+            self.assertTrue(user.is_active)
+            self.assertEqual(user.username, self.user.username)
+        # the password hash isn't cached, it is loaded when needed
+        cached_user = cache.get(token_cache.user_cache_key(self.user.pk))
+        self.assertNotIn("password", cached_user)
+        self.assertEqual(user.password, self.user.password)
+
+        # other processes only have the shared cache
+        token_cache.local_cache.clear()
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+        auth_token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deactivated_users_are_not_authenticated(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+
+class TestCachedPermissions(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="permissionuser")
+        self.group = Group.objects.create(name="permission group")
+        self.group.permissions.add(Permission.objects.get(codename="view_item"))
+        self.user.groups.add(self.group)
+
+    def has_perm(self, perm: str) -> bool:
+        # a new instance per request
+        return User.objects.get(pk=self.user.pk).has_perm(perm)
+
+    def test_permissions_are_cached_until_groups_change(self):
+        self.assertTrue(self.has_perm("inventory.view_item"))
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm("inventory.view_item"))
+            self.assertFalse(user.has_perm("inventory.change_item"))
+
+        self.group.permissions.add(Permission.objects.get(codename="change_item"))
+        self.assertTrue(self.has_perm("inventory.change_item"))
+
+        self.user.user_permissions.add(Permission.objects.get(codename="add_item"))
+        self.assertTrue(self.has_perm("inventory.add_item"))
+
+        self.user.groups.remove(self.group)
+        self.assertFalse(self.has_perm("inventory.view_item"))
+        self.assertTrue(self.has_perm("inventory.add_item"))
+
+
+class TestTokenSweeper(TestCase):
+    def test_expired_tokens_and_tokens_over_the_limit_are_deleted(self):
+        user = User.objects.create_user(username="sweptuser")
+        other_user = User.objects.create_user(username="otheruser")
+        for i in range(2):
+            AuthToken.objects.create(user, timedelta(0))
+        tokens = [AuthToken.objects.create(user, None)[0] for i in range(4)]
+        other_token, _ = AuthToken.objects.create(other_user, timedelta(days=1))
+
+        out = StringIO()
+        call_command("sweep_tokens", token_limit=2, batch_size=1, stdout=out)
+        self.assertIn("2 expired tokens and 2 tokens over the limit", out.getvalue())
+        self.assertCountEqual(
+            AuthToken.objects.values_list("digest", flat=True),
+            [tokens[2].digest, tokens[3].digest, other_token.digest],
+        )
+
+    def test_login_deletes_the_old_tokens_of_the_user(self):
+        user = User.objects.create_user(username="loginuser", password="password")
+        other_user = User.objects.create_user(username="otheruser")
+        AuthToken.objects.create(user, timedelta(0))
+        limit = knox_settings.TOKEN_LIMIT_PER_USER
+        tokens = [AuthToken.objects.create(user, None)[0] for i in range(limit)]
+        other_token, _ = AuthToken.objects.create(other_user, timedelta(0))
+
+        res = APIClient().post(
+            reverse("knox_login"),
+            {"username": "loginuser", "password": "password"},
+            format="json",
+        )
+        self.assertEqual(res.status_code, 200)
+        user_tokens = AuthToken.objects.filter(user=user)
+        self.assertEqual(user_tokens.count(), limit)
+        # the oldest one makes room for the new token
+        self.assertFalse(user_tokens.filter(digest=tokens[0].digest).exists())
+        self.assertTrue(AuthToken.objects.filter(digest=other_token.digest).exists())
@@ -0,0 +1,168 @@
+"""cache of verified knox tokens, so authenticated requests don't query the
+database.
+
+a token is looked up by its digest in a small in process LRU, then in the shared
+cache. token entries hold the user id and expiry, users are cached separately by
+id, only the fields in USER_FIELDS (not the password hash). deleting a token
+(logout) or saving or deleting a user (deactivation) removes their entries from
+the shared cache and the LRU of this process, other processes drop theirs within
+LOCAL_TIMEOUT seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, NamedTuple
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from knox.models import AuthToken
+
+from users.models import User
+
+CACHE_TIMEOUT = 60 * 60
+# logouts and deactivations reach the other processes after this many seconds
+LOCAL_TIMEOUT = 10
+LOCAL_MAXSIZE = 1024
+# what authentication and permission checks use, the other fields of cached users
+# are loaded from the database when they are accessed
+USER_FIELDS = [
+    "id",
+    "username",
+    "first_name",
+    "last_name",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+]
+
+_NOT_FOUND = object()
+
+
+class CachedToken(NamedTuple):
+    user_id: int
+    token_key: str
+    created: datetime
+    expiry: datetime | None
+
+
+class LocalCache:
+    """bounded LRU with a timeout, shared by the threads of the process"""
+
+    def __init__(self, maxsize: int, timeout: float):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # key -> (expires at, value)
+        self.entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str):
+        with self.lock:
+            expires_at, value = self.entries.get(key, (0, _NOT_FOUND))
+            if expires_at <= time.monotonic():
+                self.entries.pop(key, None)
+                return _NOT_FOUND
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LocalCache(LOCAL_MAXSIZE, LOCAL_TIMEOUT)
+
+
+def token_cache_key(digest: str) -> str:
+    return f"auth_token:{digest}"
+
+
+def user_cache_key(user_id: int) -> str:
+    return f"auth_user_fields:{user_id}"
+
+
+def cached(key: str):
+    value = local_cache.get(key)
+    if value is _NOT_FOUND:
+        value = cache.get(key, _NOT_FOUND)
+        if value is not _NOT_FOUND:
+            local_cache.set(key, value)
+    return value
+
+
+def get_auth_token(digest: str) -> AuthToken | None:
+    """the cached token with its user, None if it has to be verified again"""
+    token = cached(token_cache_key(digest))
+    if token is _NOT_FOUND:
+        return None
+    if token.expiry is not None and token.expiry <= timezone.now():
+        return None
+    user_values = cached(user_cache_key(token.user_id))
+    if user_values is _NOT_FOUND:
+        return None
+    # from_db takes the values in the order of the model's fields
+    field_names = [
+        field.attname
+        for field in User._meta.concrete_fields
+        if field.attname in user_values
+    ]
+    auth_token = AuthToken(
+        digest=digest,
+        token_key=token.token_key,
+        user=User.from_db(
+            DEFAULT_DB_ALIAS, field_names, [user_values[name] for name in field_names]
+        ),
+        created=token.created,
+        expiry=token.expiry,
+    )
+    auth_token._state.adding = False
+    return auth_token
+
+
+def cache_auth_token(auth_token: AuthToken):
+    token = CachedToken(
+        auth_token.user_id, auth_token.token_key, auth_token.created, auth_token.expiry
+    )
+    timeout = CACHE_TIMEOUT
+    if token.expiry is not None:
+        remaining = (token.expiry - timezone.now()).total_seconds()
+        timeout = int(min(timeout, remaining))
+        if timeout <= 0:
+            return
+    user_key = user_cache_key(auth_token.user_id)
+    token_key = token_cache_key(auth_token.digest)
+    user_values = {field: getattr(auth_token.user, field) for field in USER_FIELDS}
+    cache.set(user_key, user_values, CACHE_TIMEOUT)
+    cache.set(token_key, token, timeout)
+    local_cache.set(user_key, user_values)
+    local_cache.set(token_key, token)
+
+
+def forget(key: str):
+    def delete():
+        cache.delete(key)
+        local_cache.delete(key)
+
+    delete()
+    # a request verifying the token before the commit could cache it again
+    transaction.on_commit(delete)
+
+
+def forget_token(digest: str):
+    forget(token_cache_key(digest))
+
+
+def forget_user(user_id: int):
+    forget(user_cache_key(user_id))
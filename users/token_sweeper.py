@@ -0,0 +1,113 @@
+"""deletes expired knox tokens and the oldest tokens of users over
+TOKEN_LIMIT_PER_USER. a login only sweeps the tokens of its user, with a single
+DELETE, the tokens of users that don't log in again are left to the sweep.
+
+run it periodically with the sweep_tokens command (the token-sweeper service of
+docker-compose.yml runs it every hour). sweeping from a background thread of every
+process is opt in, by setting settings.TOKEN_SWEEP_INTERVAL (None by default). the
+thread starts with the first request and only one process sweeps in an interval.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F, Q, QuerySet, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from knox.models import AuthToken
+from knox.settings import knox_settings
+
+logger = logging.getLogger(__name__)
+
+SWEEP_LOCK_KEY = "token_sweeper"
+
+
+def expired_tokens() -> QuerySet[AuthToken]:
+    return AuthToken.objects.filter(expiry__lte=timezone.now())
+
+
+def tokens_over_limit(token_limit: int, user=None) -> QuerySet[AuthToken]:
+    """valid tokens of users (or of the user) after their token_limit newest ones"""
+    tokens = AuthToken.objects.filter(
+        Q(expiry__gt=timezone.now()) | Q(expiry__isnull=True)
+    )
+    if user is not None:
+        tokens = tokens.filter(user=user)
+    ranked = tokens.annotate(
+        rank=Window(
+            RowNumber(),
+            partition_by=F("user_id"),
+            order_by=[F("created").desc(), F("digest").desc()],
+        )
+    ).filter(rank__gt=token_limit)
+    return AuthToken.objects.filter(digest__in=ranked.values("digest"))
+
+
+def delete_in_batches(queryset: QuerySet[AuthToken], batch_size: int) -> int:
+    deleted = 0
+    while batch := list(queryset.values_list("digest", flat=True)[:batch_size]):
+        # delete() sends post_delete, which removes the tokens from the token cache
+        count, _ = AuthToken.objects.filter(digest__in=batch).delete()
+        deleted += count
+    return deleted
+
+
+def sweep_tokens(
+    token_limit: int | None = None, batch_size: int = 1000
+) -> tuple[int, int]:
+    """number of the deleted expired tokens and tokens over the limit"""
+    if token_limit is None:
+        token_limit = knox_settings.TOKEN_LIMIT_PER_USER
+    expired = delete_in_batches(expired_tokens(), batch_size)
+    over_limit = 0
+    if token_limit is not None:
+        over_limit = delete_in_batches(tokens_over_limit(token_limit), batch_size)
+    return expired, over_limit
+
+
+def sweep_user_tokens(user, token_limit: int | None = None) -> int:
+    """deletes the expired tokens and the tokens over the limit of the user"""
+    if token_limit is None:
+        token_limit = knox_settings.TOKEN_LIMIT_PER_USER
+    tokens = Q(user=user, expiry__lte=timezone.now())
+    if token_limit is not None:
+        tokens |= Q(digest__in=tokens_over_limit(token_limit, user).values("digest"))
+    count, _ = AuthToken.objects.filter(tokens).delete()
+    return count
+
+
+def sweep_periodically(interval: int):
+    while True:
+        time.sleep(interval)
+        try:
+            # the other processes skip this interval
+            if cache.add(SWEEP_LOCK_KEY, True, interval):
+                sweep_tokens()
+        except Exception:
+            logger.exception("sweeping tokens failed")
+        finally:
+            connections.close_all()
+
+
+sweeper_started = threading.Event()
+start_lock = threading.Lock()
+
+
+def start_sweeper(**kwargs):
+    """request_started receiver that starts the sweeper thread once"""
+    if sweeper_started.is_set():
+        return
+    with start_lock:
+        if sweeper_started.is_set():
+            return
+        thread = threading.Thread(
+            target=sweep_periodically,
+            args=(settings.TOKEN_SWEEP_INTERVAL,),
+            name="token-sweeper",
+            daemon=True,
+        )
+        thread.start()
+        sweeper_started.set()
@@ -1,11 +1,21 @@
+import operator
+from collections import defaultdict
 from datetime import datetime
+from functools import reduce
 
-from django.db import models
+from django.contrib.postgres.search import SearchRank
+from django.db import connections, models
+from django.db.models import F, Q
+from django.db.models.constants import LOOKUP_SEP
 from django_filters import fields, filters, filterset
 from django_filters.rest_framework import DjangoFilterBackend as _DjangoFilterBackend
 from drf_spectacular.plumbing import follow_model_field_lookup
 from rest_framework.filters import OrderingFilter as _OrderingFilter
 from rest_framework.filters import SearchFilter as _SearchFilter
+from rest_framework.settings import api_settings
+
+from utilities.search import (indexed_fields, is_identifier, search_query,
+                              search_vector)
 
 
 class OrderingFilter(_OrderingFilter):
@@ -33,6 +43,78 @@ class SearchFilter(_SearchFilter):
         return result
 
 
+class FullTextSearchFilter(SearchFilter):
+    """full-text search (utilities.search) on PostgreSQL, ranked by relevance when
+    there is no ordering parameter. the fields of the model are searched in one
+    vector, related fields in a subquery of their model per relation. the vectors
+    have the fields of the search index of the model (indexed_fields).
+    every term has to match, identifier terms (is_identifier) also match the
+    search_identifier_fields of the view as substrings like SearchFilter, which
+    doesn't use the index. other databases search like SearchFilter."""
+
+    ordering_param = api_settings.ORDERING_PARAM
+
+    def get_identifier_fields(self, view) -> list[str]:
+        return getattr(view, "search_identifier_fields", [])
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+        if (
+            not search_fields
+            or not search_terms
+            or connections[queryset.db].vendor != "postgresql"
+        ):
+            return super().filter_queryset(request, queryset, view)
+
+        fields_of_relations = defaultdict(list)
+        for search_field in search_fields:
+            relation, _, name = search_field.rpartition(LOOKUP_SEP)
+            fields_of_relations[relation].append(name)
+        fields = fields_of_relations.pop("", None)
+        if fields:
+            fields = indexed_fields(queryset.model, fields)
+            queryset = queryset.annotate(search=search_vector(*fields))
+        identifier_fields = self.get_identifier_fields(view)
+
+        condition = Q()
+        for term in search_terms:
+            term_conditions = []
+            query = search_query([term])
+            if query is not None:
+                if fields:
+                    term_conditions.append(Q(search=query))
+                for relation, related_fields in fields_of_relations.items():
+                    model = follow_model_field_lookup(
+                        queryset.model, relation
+                    ).related_model
+                    # the default manager can hide rows (inactivated ones)
+                    related = model._base_manager.annotate(
+                        search=search_vector(*indexed_fields(model, related_fields))
+                    ).filter(search=query)
+                    term_conditions.append(
+                        Q(**{f"{relation}__in": related.values("pk")})
+                    )
+            if is_identifier(term):
+                term_conditions += [
+                    Q(**{self.construct_search(search_field): term})
+                    for search_field in identifier_fields
+                ]
+            # a term without words matches nothing without identifier fields
+            condition &= reduce(operator.or_, term_conditions, Q(pk__in=[]))
+        queryset = queryset.filter(condition)
+        if self.must_call_distinct(queryset, search_fields):
+            queryset = queryset.distinct()
+
+        query = search_query(search_terms)
+        if fields and query and not request.query_params.get(self.ordering_param):
+            ordering = queryset.query.order_by or queryset.model._meta.ordering
+            queryset = queryset.annotate(
+                search_rank=SearchRank(F("search"), query)
+            ).order_by("-search_rank", *(ordering or ["pk"]))
+        return queryset
+
+
 class BetterDateRangeField(filters.BaseCSVFilter):
     base_field_class = fields.BaseRangeField
 
@@ -0,0 +1,282 @@
+"""per request metrics: SQL query count and time, cache hits and misses,
+serializer time and response size, tagged with the view (viewset.action).
+
+utilities.middleware.RequestMetricsMiddleware collects them and logs them as a JSON
+line to the "instrumentation" logger, as a warning when the request ran more than
+settings.REQUEST_QUERY_BUDGET queries, at the info level otherwise (the shipped
+logging config only lets warnings through). they are also added to histograms of the
+view, every process publishes its histograms to the shared cache and
+metrics_text merges them for prometheus, with p50, p95 and p99 estimates.
+
+what other threads do (dashboard widgets) isn't counted for the request.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.redis import RedisCache
+
+# seconds between two publishes of the histograms of a process
+PUBLISH_INTERVAL = 15
+PROCESSES_KEY = "instrumentation:processes"
+
+QUANTILES = [0.5, 0.95, 0.99]
+SECONDS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+COUNTS = [0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233]
+# (name, help, bucket upper bounds) of the histograms, in the order of Sample
+HISTOGRAMS = [
+    ("request_duration_seconds", "Time to respond to the request.", SECONDS),
+    ("request_queries", "SQL queries run by the request.", COUNTS),
+    ("request_db_seconds", "Time spent running SQL queries.", SECONDS),
+    ("request_cache_hits", "Values found in the cache.", COUNTS),
+    ("request_cache_misses", "Values not found in the cache.", COUNTS),
+    ("request_serializer_seconds", "Time spent in serializers.", SECONDS),
+    (
+        "request_response_bytes",
+        "Size of the response body.",
+        [2**exponent for exponent in range(8, 26, 2)],
+    ),
+]
+Sample = tuple[float, int, float, int, int, float, int]
+
+
+@dataclass
+class RequestMetrics:
+    view: str = "unresolved"
+    queries: int = 0
+    db_time: float = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    serializer_time: float = 0
+    serializing: bool = field(default=False, repr=False)
+
+
+current_metrics: ContextVar[RequestMetrics | None] = ContextVar(
+    "request_metrics", default=None
+)
+
+
+def record_query(execute, sql, params, many, context):
+    """connection.execute_wrapper that counts the queries of the request"""
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def record_cache(hits: int, misses: int):
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+@contextmanager
+def timed_serializer(metrics: RequestMetrics):
+    metrics.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - start
+        metrics.serializing = False
+
+
+def serializing():
+    """times the outermost serializer, nested ones are part of its time"""
+    metrics = current_metrics.get()
+    if metrics is None or metrics.serializing:
+        return nullcontext()
+    return timed_serializer(metrics)
+
+
+_MISSING = object()
+
+
+class InstrumentedCacheMixin:
+    """counts the hits and misses of a cache backend for the request"""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        if value is _MISSING:
+            record_cache(0, 1)
+            return default
+        record_cache(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = super().get_many(keys, version=version)
+        record_cache(len(values), len(keys) - len(values))
+        return values
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    """keeps the processes that publish histograms in a redis set, so processes
+    registering at the same time don't overwrite each other"""
+
+    def add_process(self, process: str):
+        key = self.make_and_validate_key(PROCESSES_KEY)
+        self._cache.get_client(key, write=True).sadd(key, process)
+
+    def get_processes(self) -> set[str]:
+        key = self.make_and_validate_key(PROCESSES_KEY)
+        return {member.decode() for member in self._cache.get_client(key).smembers(key)}
+
+    def remove_processes(self, processes: set[str]):
+        key = self.make_and_validate_key(PROCESSES_KEY)
+        self._cache.get_client(key, write=True).srem(key, *processes)
+
+
+class ProcessLocalRegistry:
+    """the processes of caches that aren't shared between processes
+    (locmem in development and tests), there is nothing to race with"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def add_process(self, process: str):
+        processes = self.get_processes()
+        if process not in processes:
+            self.backend.set(PROCESSES_KEY, processes | {process}, None)
+
+    def get_processes(self) -> set[str]:
+        return self.backend.get(PROCESSES_KEY) or set()
+
+    def remove_processes(self, processes: set[str]):
+        self.backend.set(PROCESSES_KEY, self.get_processes() - processes, None)
+
+
+def process_registry() -> InstrumentedRedisCache | ProcessLocalRegistry:
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(backend, InstrumentedRedisCache):
+        return backend
+    return ProcessLocalRegistry(backend)
+
+
+def new_histograms() -> list[dict]:
+    return [
+        {"buckets": [0] * (len(bounds) + 1), "sum": 0}
+        for name, help_text, bounds in HISTOGRAMS
+    ]
+
+
+class Histograms:
+    """histograms of every view in the process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views: dict[str, list[dict]] = defaultdict(new_histograms)
+        self.published_at = 0.0
+
+    def add(self, view: str, sample: Sample):
+        with self.lock:
+            for histogram, (name, help_text, bounds), value in zip(
+                self.views[view], HISTOGRAMS, sample
+            ):
+                # the last bucket is +Inf
+                histogram["buckets"][bisect_left(bounds, value)] += 1
+                histogram["sum"] += value
+
+    def snapshot(self) -> dict[str, list[dict]]:
+        with self.lock:
+            return {
+                view: [
+                    {"buckets": list(histogram["buckets"]), "sum": histogram["sum"]}
+                    for histogram in histograms
+                ]
+                for view, histograms in self.views.items()
+            }
+
+    def publish(self, force=False):
+        """writes the histograms of the process to the shared cache, at most once
+        in PUBLISH_INTERVAL seconds"""
+        now = time.monotonic()
+        if not force and now - self.published_at < PUBLISH_INTERVAL:
+            return
+        self.published_at = now
+        key = f"instrumentation:{os.uname().nodename}:{os.getpid()}"
+        cache.set(key, self.snapshot(), PUBLISH_INTERVAL * 4)
+        # processes that stopped publishing are dropped by metrics_text, the
+        # others register again on every publish
+        process_registry().add_process(key)
+
+
+histograms = Histograms()
+
+
+def estimate_quantile(q: float, bounds: list[float], buckets: list[int]) -> float:
+    """like prometheus' histogram_quantile, interpolates within the bucket"""
+    rank = q * sum(buckets)
+    seen = 0
+    for index, count in enumerate(buckets):
+        if count and seen + count >= rank:
+            if index == len(bounds):
+                return bounds[-1]
+            lower = bounds[index - 1] if index else 0
+            return lower + (bounds[index] - lower) * (rank - seen) / count
+        seen += count
+    return 0
+
+
+def metrics_text() -> str:
+    """the histograms of every process in the prometheus text format, with the
+    estimated quantiles of each as <name>_quantile gauges"""
+    registry = process_registry()
+    processes = registry.get_processes()
+    snapshots = cache.get_many(processes)
+    if len(snapshots) < len(processes):
+        registry.remove_processes(processes - snapshots.keys())
+
+    views = defaultdict(new_histograms)
+    for snapshot in snapshots.values():
+        for view, view_histograms in snapshot.items():
+            for merged, histogram in zip(views[view], view_histograms):
+                merged["buckets"] = [
+                    a + b for a, b in zip(merged["buckets"], histogram["buckets"])
+                ]
+                merged["sum"] += histogram["sum"]
+
+    lines = []
+    for index, (name, help_text, bounds) in enumerate(HISTOGRAMS):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        quantile_lines = []
+        for view, view_histograms in sorted(views.items()):
+            histogram = view_histograms[index]
+            cumulative = 0
+            for bound, count in zip([*bounds, "+Inf"], histogram["buckets"]):
+                cumulative += count
+                lines.append(
+                    f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{name}_sum{{view="{view}"}} {histogram["sum"]}')
+            lines.append(f'{name}_count{{view="{view}"}} {cumulative}')
+            for q in QUANTILES:
+                value = estimate_quantile(q, bounds, histogram["buckets"])
+                quantile_lines.append(
+                    f'{name}_quantile{{view="{view}",quantile="{q}"}} {value}'
+                )
+        lines += [f"# TYPE {name}_quantile gauge", *quantile_lines]
+    return "\n".join(lines) + "\n"
+
+
+def view_name(view_func, method: str) -> str:
+    """viewset.action of viewsets, view.method of class based views and
+    module.function of function views"""
+    cls = getattr(view_func, "cls", None) or getattr(view_func, "view_class", None)
+    if cls is None:
+        return f"{view_func.__module__}.{view_func.__name__}"
+    method = method.lower()
+    actions = getattr(view_func, "actions", None) or {}
+    return f"{cls.__name__}.{actions.get(method, method)}"
@@ -1,18 +1,90 @@
+import logging
+import time
+from contextlib import ExitStack
+from dataclasses import asdict
+
+import orjson
+from django.conf import settings
+from django.db import connections
 from django.http.request import HttpRequest
 
+from utilities.instrumentation import (
+    RequestMetrics,
+    current_metrics,
+    histograms,
+    record_query,
+    view_name,
+)
+
+logger = logging.getLogger("instrumentation")
+
+
+class RequestMetricsMiddleware:
+    """collects the metrics of utilities.instrumentation for every request"""
 
-class LogMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request: HttpRequest):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
         try:
-            print(request.headers)
-            return self.get_response(request)
-        except Exception as e:
-            # if request.user.is_authenticated():
-            # Log the user
-            path = request.get_full_path()  # Get the URL Path
-            meta = request.META  # Get request meta information
-            # Log everything
-            raise e  # Raise exception again after catching
+            with self.record_queries():
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        duration = time.perf_counter() - start
+
+        size = 0 if response.streaming else len(response.content)
+        histograms.add(
+            metrics.view,
+            (
+                duration,
+                metrics.queries,
+                metrics.db_time,
+                metrics.cache_hits,
+                metrics.cache_misses,
+                metrics.serializer_time,
+                size,
+            ),
+        )
+        self.log(request, response, metrics, duration, size)
+        try:
+            histograms.publish()
+        except Exception:
+            logger.exception("publishing request metrics failed")
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.view = view_name(view_func, request.method)
+
+    @staticmethod
+    def record_queries() -> ExitStack:
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(record_query))
+        return stack
+
+    @staticmethod
+    def log(request, response, metrics: RequestMetrics, duration, size):
+        budget = settings.REQUEST_QUERY_BUDGET
+        over_budget = budget is not None and metrics.queries > budget
+        if not over_budget and not logger.isEnabledFor(logging.INFO):
+            return
+        record = asdict(metrics)
+        del record["serializing"]
+        record.update(
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+            duration=duration,
+            response_bytes=size,
+        )
+        if over_budget:
+            record["query_budget"] = budget
+            logger.warning(orjson.dumps(record).decode())
+        else:
+            logger.info(orjson.dumps(record).decode())
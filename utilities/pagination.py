@@ -0,0 +1,350 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+from hashlib import sha1
+from typing import NamedTuple
+
+import orjson
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetKey(NamedTuple):
+    attname: str
+    descending: bool
+    nullable: bool
+
+
+class EstimatedCountPagination(LimitOffsetPagination):
+    """limit/offset pagination that doesn't run an exact COUNT(*) over big results.
+    results are counted up to exact_count_threshold rows. above it unfiltered lists
+    get the planner's estimate (EXPLAIN, which is based on pg_class.reltuples),
+    cached for a short time keyed by the query. estimates of filtered lists
+    (selective filters, searches) can be far off, those get the capped count.
+    count_exact in the response tells whether the count is exact."""
+
+    exact_count_threshold = 10000
+    count_cache_timeout = 60
+
+    count_exact = True
+
+    def get_count(self, queryset: QuerySet) -> int:
+        queryset = queryset.order_by()
+        # a subquery with a LIMIT, stops counting after the threshold
+        count = queryset[: self.exact_count_threshold + 1].count()
+        self.count_exact = count <= self.exact_count_threshold
+        if self.count_exact or queryset.query.where:
+            return count
+        sql, params = queryset.query.sql_with_params()
+        cache_key = "pagination_count:" + sha1(f"{sql}{params}".encode()).hexdigest()
+        estimate = cache.get(cache_key)
+        if estimate is None:
+            estimate = self.estimate_count(queryset)
+            if estimate is None:
+                self.count_exact = True
+                return super().get_count(queryset)
+            # keeps the count stable while paging through the same results
+            cache.set(cache_key, estimate, self.count_cache_timeout)
+        return max(estimate, count)
+
+    @staticmethod
+    def estimate_count(queryset: QuerySet) -> int | None:
+        if connections[queryset.db].vendor != "postgresql":
+            return None
+        plan = orjson.loads(queryset.explain(format="json"))
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count = self.get_count(queryset)
+        self.offset = self.get_offset(request)
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        if self.count_exact and (self.count == 0 or self.offset > self.count):
+            self.has_next = False
+            return []
+        # an estimated count can't tell whether there is a next page
+        results = list(queryset[self.offset : self.offset + self.limit + 1])
+        self.has_next = len(results) > self.limit
+        return results[: self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(
+            url, self.offset_query_param, self.offset + self.limit
+        )
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("count", self.count),
+                    ("count_exact", self.count_exact),
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count_exact"] = {
+            "type": "boolean",
+            "example": True,
+        }
+        return response_schema
+
+
+class KeysetPagination(EstimatedCountPagination):
+    """keyset (cursor) pagination that follows the OrderingFilter ordering.
+    the ordering values of the last row are put in an opaque cursor and the next
+    page is filtered by them, so deep pages don't scan the rows before them.
+    the pk is added to the ordering as a tie breaker, nulls sort as the largest
+    values like postgres does. keyset pagination is opt in: requests without a
+    cursor are paginated by limit/offset with a count, an empty cursor (cursor=)
+    starts from the first page. with a cursor the total count is only calculated
+    when count=true is passed, as estimated by EstimatedCountPagination.
+    orderings by annotations (search relevance) can't be put in a cursor, those
+    are paginated by limit/offset too."""
+
+    cursor_query_param = "cursor"
+    cursor_query_description = _("The pagination cursor value.")
+    count_query_param = "count"
+    count_query_description = _("Include the total number of results.")
+    invalid_cursor_message = _("Invalid cursor")
+
+    keyset = False
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None):
+        if (
+            self.cursor_query_param not in request.query_params
+            or self.ordered_by_annotation(queryset)
+        ):
+            self.keyset = False
+            return super().paginate_queryset(queryset, request, view)
+
+        self.keyset = True
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ("true", "1"):
+            self.count = self.get_count(queryset)
+
+        self.keys = self.get_keys(queryset, request, view)
+        values, reverse = self.decode_cursor(request)
+        queryset = self.order_queryset(queryset, reverse)
+        if values is not None:
+            queryset = self.filter_after(queryset, values, reverse)
+
+        results = list(queryset[: self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[: self.limit]
+        if reverse:
+            results.reverse()
+
+        self.next_values = self.previous_values = None
+        if results:
+            # going backwards there is always the page we came from after this one
+            if has_more or reverse:
+                self.next_values = self.key_values(results[-1])
+            if has_more and reverse or values is not None and not reverse:
+                self.previous_values = self.key_values(results[0])
+        return results
+
+    @staticmethod
+    def ordered_by_annotation(queryset: QuerySet) -> bool:
+        return any(
+            isinstance(term, str) and term.lstrip("-") in queryset.query.annotations
+            for term in queryset.query.order_by
+        )
+
+    def get_keys(self, queryset: QuerySet, request, view) -> list[KeysetKey]:
+        ordering = None
+        for backend in getattr(view, "filter_backends", []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+        if not ordering:
+            ordering = getattr(view, "ordering", None) or ["-pk"]
+        if isinstance(ordering, str):
+            ordering = [ordering]
+        return self.get_ordering_keys(queryset.model, ordering)
+
+    def get_ordering_keys(self, model, ordering: list[str]) -> list[KeysetKey]:
+        opts = model._meta
+        keys = []
+        for term in ordering:
+            name = term.lstrip("-")
+            field = opts.pk if name == "pk" else opts.get_field(name)
+            keys.append(KeysetKey(field.attname, term.startswith("-"), field.null))
+            if field.primary_key:
+                return keys
+        # rows with the same ordering values would be skipped or repeated otherwise
+        keys.append(KeysetKey(opts.pk.attname, keys[-1].descending, False))
+        return keys
+
+    def order_queryset(self, queryset: QuerySet, reverse: bool) -> QuerySet:
+        if reverse:
+            order_by = [
+                key.attname if key.descending else f"-{key.attname}"
+                for key in self.keys
+            ]
+        else:
+            order_by = [
+                f"-{key.attname}" if key.descending else key.attname
+                for key in self.keys
+            ]
+        return queryset.order_by(*order_by)
+
+    def filter_after(self, queryset: QuerySet, values: list, reverse: bool) -> QuerySet:
+        try:
+            return queryset.filter(self.after(values, reverse))
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def after(self, values: list, reverse: bool) -> Q:
+        """rows that come after the given ordering values"""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for key, value in zip(self.keys, values):
+            descending = key.descending != reverse
+            if value is None:
+                # nulls are the largest values
+                after = Q(**{f"{key.attname}__isnull": False}) if descending else None
+                same = Q(**{f"{key.attname}__isnull": True})
+            else:
+                lookup = "lt" if descending else "gt"
+                after = Q(**{f"{key.attname}__{lookup}": value})
+                if key.nullable and not descending:
+                    after |= Q(**{f"{key.attname}__isnull": True})
+                same = Q(**{key.attname: value})
+            if after is not None:
+                condition |= equal & after
+            equal &= same
+        return condition
+
+    def key_values(self, instance) -> list:
+        return [getattr(instance, key.attname) for key in self.keys]
+
+    def encode_cursor(self, values: list, reverse: bool) -> str:
+        ordering = [key.attname for key in self.keys]
+        data = orjson.dumps({"o": ordering, "v": values, "r": reverse}, default=str)
+        return urlsafe_b64encode(data).decode()
+
+    def decode_cursor(self, request) -> tuple[list | None, bool]:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        return self.parse_cursor(encoded)
+
+    def parse_cursor(self, encoded: str) -> tuple[list, bool]:
+        try:
+            data = orjson.loads(urlsafe_b64decode(encoded.encode()))
+            ordering, values, reverse = data["o"], list(data["v"]), bool(data["r"])
+        except (BinasciiError, orjson.JSONDecodeError, KeyError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        # a cursor is only valid for the ordering it was created with
+        attnames = [key.attname for key in self.keys]
+        if ordering != attnames or len(values) != len(attnames):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def paginate_ordered(
+        self, queryset: QuerySet, ordering: list[str], limit: int, cursor=None
+    ) -> tuple[list, str | None]:
+        """the page of the queryset in ordering after cursor and the cursor of the
+        page after it, for paginating outside of a list view (dashboard widgets)"""
+        self.keys = self.get_ordering_keys(queryset.model, ordering)
+        values, reverse = (None, False) if cursor is None else self.parse_cursor(cursor)
+        queryset = self.order_queryset(queryset, reverse)
+        if values is not None:
+            queryset = self.filter_after(queryset, values, reverse)
+
+        results = list(queryset[: limit + 1])
+        has_more = len(results) > limit
+        results = results[:limit]
+        if reverse:
+            results.reverse()
+        if results and (has_more or reverse):
+            return results, self.encode_cursor(self.key_values(results[-1]), False)
+        return results, None
+
+    def get_cursor_link(self, values: list | None, reverse: bool):
+        if values is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.offset_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(values, reverse)
+        )
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        return self.get_cursor_link(self.next_values, False)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        return self.get_cursor_link(self.previous_values, True)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response(
+            OrderedDict(
+                [
+                    ("count", self.count),
+                    (
+                        "count_exact",
+                        self.count_exact if self.count is not None else None,
+                    ),
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count"]["nullable"] = True
+        response_schema["properties"]["count_exact"]["nullable"] = True
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": str(self.cursor_query_description),
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": str(self.count_query_description),
+                "schema": {"type": "boolean"},
+            },
+        ]
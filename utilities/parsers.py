@@ -0,0 +1,28 @@
+from typing import IO, Any, Iterable, Iterator
+
+import orjson
+from rest_framework.parsers import BaseParser
+
+
+def iter_json_lines(
+    lines: Iterable[bytes | str],
+) -> Iterator[tuple[int, Any, str | None]]:
+    """yields (line number, record, error) for every non-empty line.
+    a line that isn't valid JSON gets an error instead of stopping the iteration."""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, orjson.loads(line), None
+        except orjson.JSONDecodeError as e:
+            yield line_number, None, str(e)
+
+
+class JSONLinesParser(BaseParser):
+    """parses a JSON Lines (ndjson) body lazily, request.data becomes an iterator
+    of iter_json_lines results so the body is read line by line."""
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream: IO[bytes], media_type=None, parser_context=None):
+        return iter_json_lines(stream)
@@ -0,0 +1,55 @@
+"""full-text search vectors of models.
+
+the vectors are indexed by expression, GinIndex(search_vector(...)) in the Meta
+of the model. a search only uses the index when it builds the vector from the
+same fields in the same order, see indexed_fields and
+utilities.filters.FullTextSearchFilter.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchVector
+
+SEARCH_CONFIG = "turkish"
+
+
+def search_vector(*fields: str) -> SearchVector:
+    return SearchVector(*fields, config=SEARCH_CONFIG)
+
+
+def indexed_fields(model, fields: list[str]) -> list[str]:
+    """the fields of the search index of model when it has all of fields, so a
+    search of fields uses the index (and matches the other indexed fields too).
+    fields when no index has them"""
+    for index in model._meta.indexes:
+        for expression in index.expressions:
+            if not isinstance(expression, SearchVector):
+                continue
+            names = [
+                getattr(source, "name", None)
+                for source in expression.get_source_expressions()
+            ]
+            if set(fields) <= set(names):
+                return names
+    return fields
+
+
+def is_identifier(term: str) -> bool:
+    """terms with digits or punctuation, like invoice numbers, phones, emails and
+    ibans. the parser splits them differently than the words of the rows (or
+    the user types a part of one), so they are matched as substrings of the
+    identifier fields too"""
+    return not term.isalpha()
+
+
+def search_query(terms: list[str]) -> SearchQuery | None:
+    """rows with all the words of terms, words match as prefixes. None when the
+    terms have no words"""
+    # only word characters, so the raw query can't have operators of the user
+    words = [word for term in terms for word in re.findall(r"\w+", term)]
+    if not words:
+        return None
+    return SearchQuery(
+        " & ".join(f"{word}:*" for word in words),
+        config=SEARCH_CONFIG,
+        search_type="raw",
+    )
@@ -10,6 +10,9 @@ from rest_framework.exceptions import ValidationError
 from rest_framework.serializers import ListSerializer
 from rest_framework.serializers import ModelSerializer as ModelSerializer_
 
+from utilities.instrumentation import serializing
+from utilities.signals import bulk_saved
+
 serializer_field_mapping_override = {
     models.ImageField: fields.Base64ImageField,
 }
@@ -47,6 +50,10 @@ class ModelSerializer(ModelSerializer_):
             field_kwargs["required"] = True
         return (field_class, field_kwargs)
 
+    def to_representation(self, instance):
+        with serializing():
+            return super().to_representation(instance)
+
 
 class DynamicFieldsModelSerializer(ModelSerializer):
     def __init__(
@@ -85,6 +92,7 @@ class UpdateListSerializer(ListSerializer):
                     update_fields.append(attr)
 
         self.child.Meta.model._default_manager.bulk_update(instances, update_fields)
+        bulk_saved.send(sender=self.child.Meta.model)
         return instances
 
 
@@ -96,5 +104,6 @@ class CreateListSerializer(ListSerializer):
             self.child.Meta.model.objects.bulk_create(result)
         except IntegrityError as e:
             raise ValidationError(e)
+        bulk_saved.send(sender=self.child.Meta.model)
 
         return result
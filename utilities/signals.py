@@ -1,4 +1,9 @@
 from django.db import models
+from django.dispatch import Signal
+
+# sent with the model as sender after bulk_create and bulk_update,
+# which don't send post_save for the instances
+bulk_saved = Signal()
 
 
 def handle_file_field_cleanup_pre_save(
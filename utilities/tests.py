@@ -0,0 +1,206 @@
+from collections import defaultdict
+from unittest import mock
+
+import orjson
+from django.contrib.auth.models import Permission
+from django.core.cache import cache, caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from inventory.models import Warehouse
+from invoice.models import Invoice
+from payments.models import Payment, PaymentAccount
+from stakeholder.models import Stakeholder, StakeholderRole
+from users.models import User
+from utilities import middleware
+from utilities.enums import InvoiceType
+from utilities.instrumentation import (
+    Histograms,
+    RequestMetrics,
+    current_metrics,
+    metrics_text,
+)
+from utilities.search import indexed_fields
+
+
+class TestRequestMetrics(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username="metrics_user")
+        user.user_permissions.add(Permission.objects.get(codename="view_invoice"))
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        # InvoiceViewset.list is a sample view
+        Invoice.objects.create(
+            invoice_type=InvoiceType.purchase,
+            name="invoice",
+            stakeholder=Stakeholder.objects.create(
+                role=StakeholderRole.customer, name="customer", shortname="customer"
+            ),
+            warehouse=Warehouse.objects.create(name="warehouse"),
+        )
+
+    @override_settings(METRICS_TOKEN="metrics token")
+    def test_requests_are_measured_per_view(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # kept patched for the metrics requests too, publishing the process-wide
+        # histograms would replace these under the same key
+        histograms = Histograms()
+        patcher = mock.patch.object(middleware, "histograms", histograms)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with self.assertLogs("instrumentation", "INFO") as logs:
+            self.client.get(reverse("invoice-list"))
+            with override_settings(REQUEST_QUERY_BUDGET=0):
+                self.client.get(reverse("invoice-list"))
+            histograms.publish(force=True)
+
+        (first, over_budget) = [
+            orjson.loads(record.getMessage()) for record in logs.records
+        ]
+        self.assertEqual(first["view"], "InvoiceViewset.list")
+        self.assertGreater(first["queries"], 0)
+        self.assertEqual(first["queries"], over_budget["queries"])
+        self.assertGreater(first["serializer_time"], 0)
+        self.assertEqual(logs.records[0].levelname, "INFO")
+        self.assertEqual(logs.records[1].levelname, "WARNING")
+        self.assertEqual(over_budget["query_budget"], 0)
+
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        res = self.client.get(url, HTTP_AUTHORIZATION="Bearer metrics token")
+        self.assertEqual(res.status_code, 200)
+        text = res.content.decode()
+        self.assertIn('request_queries_count{view="InvoiceViewset.list"} 2', text)
+        self.assertIn(
+            'request_queries_quantile{view="InvoiceViewset.list",quantile="0.99"}',
+            text,
+        )
+
+
+class TestFullTextSearchFilter(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser(username="search_admin")
+        )
+        self.payments = []
+        for name, iban, stakeholder_name, phone in [
+            ("Kasa/1", "TR120006200000000123456789", "Ali Veli", "05551234567"),
+            ("Banka 2", "TR980001000000000987654321", "Ayşe Fatma", "02121112233"),
+        ]:
+            account = PaymentAccount.objects.create(
+                name=name,
+                iban=iban,
+                stakeholder=Stakeholder.objects.create(
+                    role=StakeholderRole.customer,
+                    name=stakeholder_name,
+                    shortname=stakeholder_name,
+                    phone=phone,
+                ),
+            )
+            self.payments.append(
+                Payment.objects.create(
+                    payer=account, receiver=account, amount=1, currency="TRY"
+                )
+            )
+
+    def test_related_fields_are_searched_with_the_index_of_their_model(self):
+        # payer__stakeholder__name is searched in the vector of
+        # stakeholder_search_idx
+        self.assertEqual(
+            indexed_fields(Stakeholder, ["name"]),
+            ["name", "phone", "email", "vkntckn"],
+        )
+        self.assertEqual(indexed_fields(Stakeholder, ["shortname"]), ["shortname"])
+        for search, payments in [
+            ("ayşe", [self.payments[1]]),
+            ("0212", [self.payments[1]]),
+            # a part of an iban, only the identifier fields match as substrings
+            ("0123456", [self.payments[0]]),
+            ("kasa 0123456", [self.payments[0]]),
+            ("sa/1", []),
+        ]:
+            res = self.client.get(reverse("payments-list"), {"search": search})
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(
+                [payment["id"] for payment in res.data["results"]],
+                [payment.id for payment in payments],
+                search,
+            )
+
+
+class FakeRedis:
+    """the redis commands used by InstrumentedRedisCache"""
+
+    def __init__(self):
+        self.values = {}
+        self.sets = defaultdict(set)
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+    def sadd(self, key, *members):
+        self.sets[key].update(member.encode() for member in members)
+
+    def smembers(self, key):
+        return set(self.sets[key])
+
+    def srem(self, key, *members):
+        self.sets[key].difference_update(member.encode() for member in members)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "utilities.instrumentation.InstrumentedRedisCache",
+            "LOCATION": "redis://localhost:6379",
+        }
+    }
+)
+class TestInstrumentedRedisCache(SimpleTestCase):
+    def setUp(self):
+        self.backend = caches["default"]
+        self.redis = FakeRedis()
+        patcher = mock.patch.object(
+            self.backend._cache, "get_client", return_value=self.redis
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hits_and_misses_are_counted_for_the_request(self):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        self.addCleanup(current_metrics.reset, token)
+        self.backend.set("found", 1)
+        self.assertEqual(self.backend.get("found"), 1)
+        self.assertIsNone(self.backend.get("missing"))
+        self.assertEqual(self.backend.get_many(["found", "missing"]), {"found": 1})
+        self.assertEqual((metrics.cache_hits, metrics.cache_misses), (2, 2))
+
+    def test_processes_publish_to_a_redis_set(self):
+        for pid in [1, 2]:
+            histograms = Histograms()
+            histograms.add("InvoiceViewset.list", (0.1, 3, 0.01, 0, 0, 0.01, 1000))
+            with mock.patch("os.getpid", return_value=pid):
+                histograms.publish(force=True)
+        processes = self.backend.get_processes()
+        self.assertEqual(len(processes), 2)
+        self.assertIn(
+            'request_queries_count{view="InvoiceViewset.list"} 2', metrics_text()
+        )
+
+        # the process that stopped publishing is dropped
+        stopped = min(processes)
+        del self.redis.values[self.backend.make_and_validate_key(stopped)]
+        self.assertIn(
+            'request_queries_count{view="InvoiceViewset.list"} 1', metrics_text()
+        )
+        self.assertEqual(self.backend.get_processes(), processes - {stopped})
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from utilities.instrumentation import metrics_text
+
+
+def metrics(request):
+    """request metrics of every process for prometheus, for staff users (admin
+    session) or with the METRICS_TOKEN bearer token"""
+    authorization = request.headers.get("Authorization", "")
+    token = settings.METRICS_TOKEN
+    authorized = bool(token) and constant_time_compare(authorization, f"Bearer {token}")
+    if not authorized and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics_text(), content_type="text/plain; version=0.0.4")